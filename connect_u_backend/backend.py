@@ -0,0 +1,79 @@
+"""
+GraphQL backend that parses and validates each distinct document once,
+including the depth and cost limits from complexity.py.
+
+Documents are kept in a bounded LRU keyed by the sha256 of the query text,
+which is also the hash automatic persisted query (APQ) clients send, so a
+registered query can be executed from its hash alone.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from graphql.backend.base import GraphQLBackend, GraphQLDocument
+from graphql.execution import ExecutionResult, execute
+from graphql.language.base import parse
+from graphql.validation import specified_rules, validate
+
+from .complexity import QueryComplexityRule, measure_document
+
+DEFAULT_MAX_DOCUMENTS = 1000
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+def invalid_result(errors, **kwargs):
+    return ExecutionResult(errors=errors, invalid=True)
+
+
+class ValidatedDocumentBackend(GraphQLBackend):
+
+    def __init__(self, max_documents=DEFAULT_MAX_DOCUMENTS):
+        self.max_documents = max_documents
+        self.documents = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_document(self, sha256_hash):
+        """Return the cached document for a query hash, or None if it is unknown."""
+        with self.lock:
+            document = self.documents.get(sha256_hash)
+            if document is not None:
+                self.documents.move_to_end(sha256_hash)
+            return document
+
+    def document_from_string(self, schema, document_string):
+        key = query_hash(document_string)
+        document = self.get_document(key)
+        if document is not None and document.schema is schema:
+            return document
+
+        # syntax errors raise here and are reported by the view, uncached
+        document_ast = parse(document_string)
+        errors = self.validate(schema, document_ast)
+        if errors:
+            run = partial(invalid_result, errors)
+        else:
+            run = partial(execute, schema, document_ast)
+        document = GraphQLDocument(schema, document_string, document_ast, run)
+        document.valid = not errors
+        # static {operation name: (cost, depth)}, reported in response extensions
+        document.complexity = {} if errors else measure_document(schema, document_ast)
+
+        with self.lock:
+            self.documents[key] = document
+            self.documents.move_to_end(key)
+            while len(self.documents) > self.max_documents:
+                self.documents.popitem(last=False)
+        return document
+
+    def validate(self, schema, document_ast):
+        return validate(schema, document_ast, specified_rules + [QueryComplexityRule])
+
+
+document_backend = ValidatedDocumentBackend(
+    getattr(settings, 'GRAPHQL_DOCUMENT_CACHE_SIZE', DEFAULT_MAX_DOCUMENTS),
+)
@@ -0,0 +1,72 @@
+"""
+Shared pieces of the batch mutations (likePosts, followUsers, ...).
+
+A batch is validated with one query, written with one bulk statement and
+answered with a result per requested id, in request order.
+"""
+import graphene
+from django.db import connection
+from graphql import GraphQLError
+
+MAX_BULK_ITEMS = 500
+
+
+class BulkItemResult(graphene.ObjectType):
+    id = graphene.ID()
+    success = graphene.Boolean()
+    message = graphene.String()
+
+
+def to_int(raw):
+    try:
+        return int(raw)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_ids(ids):
+    """Return the distinct integer ids of a batch; values that aren't ids are left out."""
+    if len(ids) > MAX_BULK_ITEMS:
+        raise GraphQLError(f"At most {MAX_BULK_ITEMS} items can be sent at once.")
+    parsed = (to_int(raw) for raw in ids)
+    return list(dict.fromkeys(pk for pk in parsed if pk is not None))
+
+
+def results(ids, messages):
+    """One BulkItemResult per distinct requested id; `messages` maps id -> (success, message)."""
+    items, seen = [], set()
+    for raw in ids:
+        pk = to_int(raw)
+        if pk is not None and pk in seen:
+            continue
+        seen.add(pk)
+        success, message = messages[pk] if pk is not None else (False, "Invalid id.")
+        items.append(BulkItemResult(id=raw, success=success, message=message))
+    return items
+
+
+def insert_new(objs, returning):
+    """
+    Insert unsaved `objs` of one model in one statement, skipping rows that
+    conflict with existing ones (bulk_create(ignore_conflicts=True) can't tell
+    which those were). Returns the `returning` field values of the rows this
+    statement inserted, as tuples.
+    """
+    if not objs:
+        return []
+    model = type(objs[0])
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    returned = ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in returning)
+    row = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    params = [
+        field.get_db_prep_save(field.pre_save(obj, add=True), connection)
+        for obj in objs for field in fields
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({columns}) '
+            f'VALUES {", ".join([row] * len(objs))} ON CONFLICT DO NOTHING RETURNING {returned}',
+            params,
+        )
+        return [tuple(values) for values in cursor.fetchall()]
@@ -0,0 +1,176 @@
+"""
+Response cache for read-only GraphQL operations.
+
+Responses are keyed on the normalized query document, the variables, the
+viewer and the current version of every "tag" (model) the selection set can
+reach. Writes bump the version of the tags they touch (see the post_save /
+post_delete receivers in posts.signals and users.signals), which makes every
+dependent entry unreachable; the backend's TTL/LRU eviction reclaims them.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import caches
+from graphql.language.printer import print_ast
+from graphql.language.visitor import TypeInfoVisitor, Visitor, visit
+from graphql.type.definition import get_named_type
+from graphql.utils.get_operation_ast import get_operation_ast
+from graphql.utils.type_info import TypeInfo
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.settings import jwt_settings
+from graphql_jwt.utils import get_http_authorization, get_payload
+
+DEFAULTS = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 30,
+}
+
+# Root fields whose responses may be cached, with the tags that aren't
+# visible from the types in their selection set (e.g. `followers` returns
+# users but is computed from Follow rows).
+CACHEABLE_ROOT_FIELDS = {
+    'posts': (),
+    'post': (),
+    'timeline': ('follow',),
+    'searchPosts': ('comment',),
+    'comments': (),
+    'commentThread': (),
+    'commentsCount': ('post',),
+    'likeCount': ('post',),
+    'likeCountComment': ('comment',),
+    'likesPost': (),
+    'likesComment': (),
+    'users': (),
+    'user': (),
+    'followers': ('follow',),
+    'following': ('follow',),
+    'isFollowing': ('follow',),
+    'mutualFollows': ('follow',),
+    'suggestedUsers': ('follow',),
+    'searchUsers': ('profile',),
+}
+
+
+def cache_settings():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_RESPONSE_CACHE', {})}
+
+
+def get_cache():
+    return caches[cache_settings()['CACHE_ALIAS']]
+
+
+def tag_key(tag):
+    return f'graphql:tag:{tag}'
+
+
+def invalidate(*tags):
+    """Bump the version of each tag so every response that depends on it misses."""
+    cache = get_cache()
+    for tag in tags:
+        try:
+            cache.incr(tag_key(tag))
+        except ValueError:
+            # the version was evicted; restart from a value no old entry used
+            cache.set(tag_key(tag), time.time_ns(), None)
+
+
+def tag_versions(tags):
+    cache = get_cache()
+    keys = [tag_key(tag) for tag in sorted(tags)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+class TagCollector(Visitor):
+    """Collect the model behind every object type the selection set reaches."""
+
+    def __init__(self, type_info):
+        self.type_info = type_info
+        self.tags = set()
+
+    def enter_Field(self, node, *args):
+        graphql_type = get_named_type(self.type_info.get_type())
+        model = getattr(getattr(getattr(graphql_type, 'graphene_type', None), '_meta', None), 'model', None)
+        if model is not None:
+            self.tags.add(model._meta.model_name)
+
+
+def get_tags(schema, document_ast, operation_name):
+    """Return the tags an operation depends on, or None if it must not be cached."""
+    operation = get_operation_ast(document_ast, operation_name)
+    if operation is None or operation.operation != 'query':
+        return None
+
+    tags = set()
+    for selection in operation.selection_set.selections:
+        name = getattr(getattr(selection, 'name', None), 'value', None)
+        if name not in CACHEABLE_ROOT_FIELDS:
+            return None
+        tags.update(CACHEABLE_ROOT_FIELDS[name])
+
+    type_info = TypeInfo(schema)
+    collector = TagCollector(type_info)
+    visit(document_ast, TypeInfoVisitor(type_info, collector))
+    return tags | collector.tags
+
+
+def get_viewer(request):
+    """
+    Identify the viewer from the session and the JWT, as the view will
+    authenticate them, without loading the user. Returns None when a token is
+    present but invalid so the request isn't cached.
+    """
+    viewer = []
+    session = getattr(request, 'session', None)
+    # a logged-in session (e.g. the admin) authenticates the request as well
+    session_user = session.get(SESSION_KEY) if session is not None else None
+    if session_user is not None:
+        viewer.append(f'session:{session_user}')
+    token = get_http_authorization(request)
+    if token is not None:
+        try:
+            payload = get_payload(token, request)
+        except JSONWebTokenError:
+            return None
+        username = jwt_settings.JWT_PAYLOAD_GET_USERNAME_HANDLER(payload)
+        if not username:
+            return None
+        viewer.append(f'jwt:{username}')
+    return ' '.join(viewer)
+
+
+def get_key(request, schema, document_ast, variables, operation_name):
+    """Build the cache key for a request, or None if the response must not be cached."""
+    if not cache_settings()['ENABLED']:
+        return None
+    tags = get_tags(schema, document_ast, operation_name)
+    if tags is None:
+        return None
+    viewer = get_viewer(request)
+    if viewer is None:
+        return None
+
+    fingerprint = json.dumps(
+        [print_ast(document_ast), operation_name, variables or {}, viewer, tag_versions(tags)],
+        sort_keys=True,
+        default=str,
+    )
+    return 'graphql:response:' + hashlib.sha256(fingerprint.encode()).hexdigest()
+
+
+def get_response(key):
+    return get_cache().get(key)
+
+
+def set_response(key, data, timeout=None):
+    """Cache `data` for `timeout` seconds, at most TIMEOUT."""
+    limit = cache_settings()['TIMEOUT']
+    get_cache().set(key, data, limit if timeout is None else min(timeout, limit))
@@ -0,0 +1,142 @@
+"""
+Static cost and depth analysis of GraphQL operations.
+
+Every object field costs its weight (one batched fetch, see loaders.py) plus
+the cost of its selection set, multiplied by the expected list size for
+list fields: the `first` argument when given (up to the hard page size
+cap), the cap itself when `first` is a variable, and DEFAULT_LIST_SIZE for unbounded lists. Scalar
+fields are free unless weighted in FIELD_WEIGHTS.
+"""
+from django.conf import settings
+from graphql.error import GraphQLError
+from graphql.language import ast
+from graphql.type.definition import GraphQLList, GraphQLNonNull, get_named_type
+from graphql.validation.rules.base import ValidationRule
+
+from .pagination import MAX_PAGE_SIZE
+
+DEFAULTS = {
+    'MAX_DEPTH': 10,
+    'MAX_COST': 5000,
+    'DEFAULT_LIST_SIZE': 10,
+    # "Type.field": weight, overriding 1 for object fields and 0 for scalars
+    'FIELD_WEIGHTS': {},
+}
+
+
+def query_limits():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_QUERY_LIMITS', {})}
+
+
+def is_list(graphql_type):
+    if isinstance(graphql_type, GraphQLNonNull):
+        graphql_type = graphql_type.of_type
+    return isinstance(graphql_type, GraphQLList)
+
+
+def is_connection(graphql_type):
+    return graphql_type.name.endswith('Connection') and 'edges' in getattr(graphql_type, 'fields', {})
+
+
+def requested_size(field_ast, limits):
+    for argument in field_ast.arguments or ():
+        if argument.name.value in ('first', 'last'):
+            if isinstance(argument.value, ast.IntValue):
+                # pagination never serves more than MAX_PAGE_SIZE rows
+                return min(int(argument.value.value), MAX_PAGE_SIZE)
+            return MAX_PAGE_SIZE  # a variable, assume the largest page we serve
+    return limits['DEFAULT_LIST_SIZE']
+
+
+class OperationMeasurer:
+
+    def __init__(self, schema, document_ast, limits=None):
+        self.schema = schema
+        self.limits = limits or query_limits()
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document_ast.definitions
+            if isinstance(definition, ast.FragmentDefinition)
+        }
+
+    def measure(self, operation):
+        """Return (cost, depth) of an operation definition."""
+        root_type = {
+            'query': self.schema.get_query_type,
+            'mutation': self.schema.get_mutation_type,
+            'subscription': self.schema.get_subscription_type,
+        }[operation.operation]()
+        return self.measure_selections(operation.selection_set, root_type, None, set())
+
+    def measure_selections(self, selection_set, parent_type, page_size, visited):
+        cost, depth = 0, 0
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.FragmentSpread):
+                name = selection.name.value
+                fragment = self.fragments.get(name)
+                if fragment is None or name in visited:
+                    continue
+                fragment_type = self.schema.get_type(fragment.type_condition.name.value) or parent_type
+                child_cost, child_depth = self.measure_selections(
+                    fragment.selection_set, fragment_type, page_size, visited | {name})
+            elif isinstance(selection, ast.InlineFragment):
+                fragment_type = parent_type
+                if selection.type_condition:
+                    fragment_type = self.schema.get_type(selection.type_condition.name.value) or parent_type
+                child_cost, child_depth = self.measure_selections(
+                    selection.selection_set, fragment_type, page_size, visited)
+            else:
+                child_cost, child_depth = self.measure_field(selection, parent_type, page_size, visited)
+            cost += child_cost
+            depth = max(depth, child_depth)
+        return cost, depth
+
+    def measure_field(self, field_ast, parent_type, page_size, visited):
+        name = field_ast.name.value
+        if name.startswith('__'):
+            return 0, 0  # introspection is not charged
+        field = getattr(parent_type, 'fields', {}).get(name)
+        if field is None:
+            return 0, 1  # unknown fields are reported by the standard rules
+
+        weight_key = f'{parent_type.name}.{name}'
+        named_type = get_named_type(field.type)
+        if not field_ast.selection_set:
+            return self.limits['FIELD_WEIGHTS'].get(weight_key, 0), 1
+
+        weight = self.limits['FIELD_WEIGHTS'].get(weight_key, 1)
+        child_page_size = requested_size(field_ast, self.limits) if is_connection(named_type) else None
+        child_cost, child_depth = self.measure_selections(
+            field_ast.selection_set, named_type, child_page_size, visited)
+
+        if is_list(field.type):
+            # the edges of a connection hold as many items as its `first` asked for
+            multiplier = page_size if name == 'edges' and page_size else requested_size(field_ast, self.limits)
+            child_cost *= multiplier
+        return weight + child_cost, child_depth + 1
+
+
+def measure_document(schema, document_ast):
+    """Return {operation name: (cost, depth)} for every operation in a document."""
+    measurer = OperationMeasurer(schema, document_ast)
+    return {
+        definition.name.value if definition.name else None: measurer.measure(definition)
+        for definition in document_ast.definitions
+        if isinstance(definition, ast.OperationDefinition)
+    }
+
+
+class QueryComplexityRule(ValidationRule):
+    """Reject operations deeper than MAX_DEPTH or costlier than MAX_COST before they execute."""
+
+    def enter_OperationDefinition(self, node, *args):
+        limits = query_limits()
+        cost, depth = OperationMeasurer(self.context.get_schema(), self.context.get_ast(), limits).measure(node)
+        name = f'"{node.name.value}"' if node.name else 'Operation'
+        if depth > limits['MAX_DEPTH']:
+            self.context.report_error(GraphQLError(
+                f"{name} is nested {depth} levels deep, more than the maximum of {limits['MAX_DEPTH']}.", [node]))
+        if cost > limits['MAX_COST']:
+            self.context.report_error(GraphQLError(
+                f"{name} has a cost of {cost}, more than the maximum of {limits['MAX_COST']}.", [node]))
+        return False  # the whole operation was measured, don't descend
@@ -0,0 +1,149 @@
+"""
+Concurrent execution of a query's independent root fields.
+
+`{ posts { ... } users { ... } me { ... } }` is three unrelated lookups, but
+graphql-core 2 resolves them one after the other on one thread. The async
+view (views.AsyncGraphQLView) instead executes each root field of a query as
+its own document on a bounded thread pool and merges the results in the
+order the fields were requested, so a request waits about as long as its
+slowest root field and the event loop never blocks on the database.
+
+Each root field gets a FieldContext of its own: DataLoaders are cached on
+the context and aren't thread-safe, so they are never shared between
+threads. Mutations keep their serial execution, and queries with a single
+root field, or fragments spread at the root, aren't split.
+"""
+import asyncio
+import contextvars
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections
+from graphql.execution import ExecutionResult, execute
+from graphql.language import ast
+from graphql.utils.get_operation_ast import get_operation_ast
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MAX_WORKERS': 8,
+}
+
+
+def concurrency_settings():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_CONCURRENCY', {})}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(concurrency_settings()['MAX_WORKERS'], thread_name_prefix='graphql')
+        return _pool
+
+
+def in_worker(fn, *args, **kwargs):
+    # pool threads outlive requests; give their connections the same
+    # CONN_MAX_AGE/health handling request threads get
+    close_old_connections()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def run_in_pool(fn, *args, **kwargs):
+    """Await fn(*args, **kwargs) on the pool, in a copy of the caller's context (e.g. its database routing)."""
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(
+        get_pool(), partial(context.run, in_worker, fn, *args, **kwargs))
+
+
+class FieldContext:
+    """
+    The request as seen by one root field. Attributes are read from and
+    written to the request, except `_dataloaders`, which is the field's own.
+    """
+
+    def __init__(self, request):
+        object.__setattr__(self, 'request', request)
+        object.__setattr__(self, '_dataloaders', {})
+
+    def __getattr__(self, name):
+        return getattr(self.request, name)
+
+    def __setattr__(self, name, value):
+        if name == '_dataloaders':
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.request, name, value)
+
+
+def root_field_documents(document_ast, operation_name):
+    """
+    One Document per root field (fields sharing a response key stay together)
+    if the operation is a query with more than one, otherwise None.
+    """
+    operation = get_operation_ast(document_ast, operation_name)
+    if operation is None or operation.operation != 'query':
+        return None
+    groups = OrderedDict()
+    for selection in operation.selection_set.selections:
+        if not isinstance(selection, ast.Field):
+            return None
+        key = selection.alias.value if selection.alias else selection.name.value
+        groups.setdefault(key, []).append(selection)
+    if len(groups) < 2:
+        return None
+
+    fragments = [d for d in document_ast.definitions if isinstance(d, ast.FragmentDefinition)]
+    return [
+        ast.Document(definitions=[ast.OperationDefinition(
+            operation='query',
+            name=operation.name,
+            variable_definitions=operation.variable_definitions,
+            directives=operation.directives,
+            selection_set=ast.SelectionSet(selections=fields),
+        )] + fragments)
+        for fields in groups.values()
+    ]
+
+
+def execute_field(schema, document_ast, request, profile=None, **options):
+    with profile.attach() if profile is not None else nullcontext():
+        try:
+            return execute(schema, document_ast, context_value=FieldContext(request), **options)
+        except Exception as e:
+            return ExecutionResult(errors=[e], invalid=True)
+
+
+def merge(results):
+    """Combine the per-field results, in field order, into the operation's result."""
+    data, errors = {}, []
+    for result in results:
+        if result.invalid:
+            # e.g. bad variables: every field fails the same way
+            return result
+        errors.extend(result.errors or ())
+        if result.data is None:
+            # a non-null root field failed, which nulls the whole response
+            data = None
+        elif data is not None:
+            data.update(result.data)
+    return ExecutionResult(data=data, errors=errors or None)
+
+
+async def execute_concurrently(schema, documents, request, profile=None, **options):
+    """Execute each of `documents` (from root_field_documents) on the pool and merge the results."""
+    results = await asyncio.gather(*(
+        run_in_pool(execute_field, schema, document_ast, request, profile, **options)
+        for document_ast in documents
+    ))
+    return merge(results)
@@ -0,0 +1,131 @@
+from collections import defaultdict
+
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from .pagination import page_size
+from .projection import build_projection
+
+
+class ModelLoader(DataLoader):
+    """Batch load `model` rows whose `field` matches the keys, one row per key."""
+
+    def __init__(self, model, field='pk'):
+        self.model = model
+        self.field = field
+        super().__init__()
+
+    def batch_load_fn(self, keys):
+        rows = self.model._default_manager.filter(**{f'{self.field}__in': keys})
+        by_key = {getattr(row, self.field): row for row in rows}
+        return Promise.resolve([by_key.get(key) for key in keys])
+
+
+class RelatedListLoader(DataLoader):
+    """Batch load every `model` row pointing at each key through `field`."""
+
+    def __init__(self, model, field):
+        self.model = model
+        self.field = field
+        super().__init__()
+
+    def batch_load_fn(self, keys):
+        grouped = defaultdict(list)
+        rows = self.model._default_manager.filter(**{f'{self.field}__in': keys}).order_by('pk')
+        for row in rows:
+            grouped[getattr(row, self.field)].append(row)
+        return Promise.resolve([grouped[key] for key in keys])
+
+
+class WindowedListLoader(DataLoader):
+    """
+    Batch load the first `limit` rows of `projection`'s model pointing at
+    each key through `field`, in `ordering`. One query ranks the rows of
+    every key with ROW_NUMBER() OVER (PARTITION BY field ...) and keeps the
+    top `limit`, so however many rows a key has, at most `limit` are loaded.
+    """
+
+    def __init__(self, field, ordering, limit, projection):
+        self.field = field
+        self.ordering = ordering
+        self.limit = limit
+        self.projection = projection
+        super().__init__()
+
+    def batch_load_fn(self, keys):
+        grouped = defaultdict(list)
+        rows = (
+            self.projection.apply(self.projection.model._default_manager.all())
+            .filter(**{f'{self.field}__in': keys})
+            .annotate(rank=Window(RowNumber(), partition_by=F(self.field), order_by=self.ordering))
+            .filter(rank__lte=self.limit)
+            .order_by(self.field, 'rank')
+        )
+        for row in rows:
+            grouped[getattr(row, self.field)].append(row)
+        return Promise.resolve([grouped[key] for key in keys])
+
+
+def get_loader(info, loader_class, *args):
+    """Return the loader for `args`, created once per request and cached on the context."""
+    loaders = getattr(info.context, '_dataloaders', None)
+    if loaders is None:
+        loaders = info.context._dataloaders = {}
+    key = (loader_class, *args)
+    if key not in loaders:
+        loaders[key] = loader_class(*args)
+    return loaders[key]
+
+
+def load_related(instance, info, name):
+    """
+    Resolve the relation `name` of a model instance through a batched loader,
+    reusing whatever select_related/prefetch_related already put in its cache.
+    """
+    field = instance._meta.get_field(name)
+
+    # reverse foreign keys: post.comments, user.posts, ...
+    if field.one_to_many:
+        if name in getattr(instance, '_prefetched_objects_cache', {}):
+            return getattr(instance, name).all()
+        loader = get_loader(info, RelatedListLoader, field.related_model, field.field.attname)
+        return loader.load(instance.pk)
+
+    if field.is_cached(instance):
+        return getattr(instance, name)
+
+    # forward foreign keys: comment.author, like.post, ...
+    if field.concrete:
+        key = getattr(instance, field.attname)
+        if key is None:
+            return None
+        return get_loader(info, ModelLoader, field.related_model).load(key)
+
+    # reverse one-to-one: user.profile
+    loader = get_loader(info, ModelLoader, field.related_model, field.field.attname)
+    return loader.load(instance.pk)
+
+
+def related_resolver(name):
+    """Build a graphene resolver that batch loads the relation `name`."""
+    def resolver(root, info, **kwargs):
+        return load_related(root, info, name)
+    return resolver
+
+
+def windowed_resolver(name, ordering):
+    """
+    Build a graphene resolver for the reverse foreign key `name` that takes a
+    `first` argument (clamped like a page size) and loads that many related
+    rows per instance, in `ordering`.
+    """
+    def resolver(root, info, first=None, **kwargs):
+        field = root._meta.get_field(name)
+        # the related rows load only what is selected on them, plus what ranks them
+        ranked_by = {field.field.name} | {column.lstrip('-') for column in ordering if column.lstrip('-') != 'pk'}
+        projection = build_projection(field.related_model, info, extra=ranked_by)
+        loader = get_loader(info, WindowedListLoader, field.field.attname, tuple(ordering), page_size(first), projection)
+        return loader.load(root.pk)
+    return resolver
@@ -0,0 +1,75 @@
+import base64
+
+import graphene
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from graphql import GraphQLError
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+
+
+def encode_cursor(created_at, pk):
+    """Encode a (created_at, id) keyset position as an opaque cursor."""
+    raw = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor back into (created_at, id)."""
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (ValueError, UnicodeDecodeError, TypeError):
+        raise GraphQLError("Invalid cursor.")
+    if created_at is None:
+        raise GraphQLError("Invalid cursor.")
+    return created_at, pk
+
+
+def page_size(first):
+    """Clamp a client supplied `first` to the hard page size cap."""
+    if first is None:
+        return DEFAULT_PAGE_SIZE
+    if first < 1:
+        raise GraphQLError("`first` must be a positive integer.")
+    return min(first, MAX_PAGE_SIZE)
+
+
+def paginate(queryset, connection, first=None, after=None, ordering="created_at", node=None):
+    """
+    Keyset paginate `queryset` newest first on (ordering, id) and build a
+    relay style `connection`. `node` optionally maps each row to the object
+    exposed on the edge (e.g. a Follow row to the follower).
+    """
+    limit = page_size(first)
+    queryset = queryset.order_by(f"-{ordering}", "-pk")
+    if after:
+        created_at, pk = decode_cursor(after)
+        queryset = queryset.filter(
+            Q(**{f"{ordering}__lt": created_at}) | Q(**{ordering: created_at, "pk__lt": pk})
+        )
+
+    rows = list(queryset[:limit + 1])
+    has_next_page = len(rows) > limit
+    rows = rows[:limit]
+
+    return build_connection(
+        connection,
+        [(node(row) if node else row, encode_cursor(getattr(row, ordering), row.pk)) for row in rows],
+        has_next_page,
+        after,
+    )
+
+
+def build_connection(connection, items, has_next_page, after=None):
+    """Build a relay style `connection` from a page of (node, cursor) pairs."""
+    edges = [connection.Edge(node=node, cursor=cursor) for node, cursor in items]
+    page_info = graphene.relay.PageInfo(
+        has_next_page=has_next_page,
+        has_previous_page=after is not None,
+        start_cursor=edges[0].cursor if edges else None,
+        end_cursor=edges[-1].cursor if edges else None,
+    )
+    return connection(edges=edges, page_info=page_info)
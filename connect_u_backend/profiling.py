@@ -0,0 +1,191 @@
+"""
+Per-request resolver and SQL profiling for the GraphQL endpoint.
+
+The view opens a RequestProfile around execution, which sees every SQL query
+through `connection.execute_wrapper`; ProfilingMiddleware (in
+GRAPHENE['MIDDLEWARE']) tells it which field is resolving. Timings are
+aggregated per "Type.field" so a page of 50 posts is one entry, not 50.
+Queries issued outside a resolver (batched DataLoader loads) are grouped
+under BATCHED. The same SQL running more than once in a request is flagged
+as an N+1 suspect. A profile may be fed from several threads at once (root
+fields executed concurrently by the async view each attach it to their own
+connection); each thread keeps its own resolver stack.
+
+When enabled (it's off by default: wrapping every field and query costs
+each request), requests that send the debug header (staff or DEBUG only) get
+the profile in `extensions.profile`; every other request is summarized in
+one log line.
+"""
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'HEADER': 'X-Debug-Profile',
+    'TOP_FIELDS': 5,
+}
+
+BATCHED = '(batched)'
+
+
+def profiling_settings():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_PROFILING', {})}
+
+
+def header_key(header):
+    return 'HTTP_' + header.upper().replace('-', '_')
+
+
+class FieldStats:
+    __slots__ = ('calls', 'time', 'queries', 'sql_time')
+
+    def __init__(self):
+        self.calls = 0
+        self.time = 0.0
+        self.queries = 0
+        self.sql_time = 0.0
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'ms': round(self.time * 1000, 2),
+            'queries': self.queries,
+            'sqlMs': round(self.sql_time * 1000, 2),
+        }
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.fields = defaultdict(FieldStats)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        # sql -> [count, {fields that ran it}]
+        self.statements = {}
+        self.queries = 0
+        self.sql_time = 0.0
+
+    @property
+    def stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def attach(self):
+        """Record the SQL run on this thread's connection while the returned context is open."""
+        return connection.execute_wrapper(self)
+
+    def __enter__(self):
+        self.wrapper = self.attach()
+        self.wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return self.wrapper.__exit__(*exc_info)
+
+    def stop(self):
+        self.duration = time.perf_counter() - self.started
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            stack = self.stack
+            owner = stack[-1] if stack else BATCHED
+            with self.lock:
+                stats = self.fields[owner]
+                stats.queries += 1
+                stats.sql_time += elapsed
+                self.queries += 1
+                self.sql_time += elapsed
+                count_owners = self.statements.setdefault(sql, [0, set()])
+                count_owners[0] += 1
+                count_owners[1].add(owner)
+
+    def resolve(self, name, resolver):
+        with self.lock:
+            stats = self.fields[name]
+            stats.calls += 1
+        stack = self.stack
+        stack.append(name)
+        started = time.perf_counter()
+        try:
+            return resolver()
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                stats.time += elapsed
+            stack.pop()
+
+    def n_plus_one_suspects(self):
+        return [
+            {'sql': sql, 'count': count, 'fields': sorted(owners)}
+            for sql, (count, owners) in self.statements.items()
+            if count > 1
+        ]
+
+    def as_dict(self):
+        return {
+            'ms': round(self.duration * 1000, 2),
+            'queries': self.queries,
+            'sqlMs': round(self.sql_time * 1000, 2),
+            'fields': {name: stats.as_dict() for name, stats in self.fields.items()},
+            'nPlusOneSuspects': self.n_plus_one_suspects(),
+        }
+
+    def summary(self, operation_name, top):
+        slowest = sorted(self.fields.items(), key=lambda item: item[1].time + item[1].sql_time, reverse=True)
+        return {
+            'operation': operation_name,
+            'ms': round(self.duration * 1000, 2),
+            'queries': self.queries,
+            'sqlMs': round(self.sql_time * 1000, 2),
+            'slowest': {name: stats.as_dict() for name, stats in slowest[:top]},
+            'nPlusOneSuspects': len(self.n_plus_one_suspects()),
+        }
+
+
+def start(request):
+    """Attach a RequestProfile to the request, or None if profiling is disabled."""
+    profile = RequestProfile() if profiling_settings()['ENABLED'] else None
+    request.graphql_profile = profile
+    return profile
+
+
+def wants_profile(request):
+    if header_key(profiling_settings()['HEADER']) not in request.META:
+        return False
+    return settings.DEBUG or getattr(getattr(request, 'user', None), 'is_staff', False)
+
+
+def finish(request, profile, result, operation_name):
+    """Emit the profile in the result's extensions when asked for, log a summary otherwise."""
+    if wants_profile(request):
+        result.extensions['profile'] = profile.as_dict()
+    else:
+        summary = profile.summary(operation_name, profiling_settings()['TOP_FIELDS'])
+        logger.info('graphql.profile %s', json.dumps(summary, sort_keys=True))
+
+
+class ProfilingMiddleware:
+    """Graphene middleware that times each resolver of a profiled request."""
+
+    def resolve(self, next, root, info, **args):
+        profile = getattr(info.context, 'graphql_profile', None)
+        if profile is None:
+            return next(root, info, **args)
+        name = f'{info.parent_type.name}.{info.field_name}'
+        return profile.resolve(name, lambda: next(root, info, **args))
@@ -0,0 +1,178 @@
+"""
+Field-level projection of GraphQL selections onto querysets.
+
+A resolver returning model rows doesn't know which columns the client will
+read, so by default it loads them all: for a post that includes the
+unbounded `content`, for a user `password` and every other AbstractUser
+column. `project` reads the selection set of the field being resolved and
+narrows the queryset to it:
+
+- selected model columns go into `.only()`, with the primary key and
+  whatever the resolver itself needs (e.g. the pagination ordering);
+- selected forward foreign keys and reverse one-to-ones are joined with
+  select_related and projected the same way;
+- selected reverse foreign keys are prefetched with a projected queryset.
+
+A relation whose GraphQL field takes arguments (e.g. `first` on
+PostType.comments) is left to its resolver, which knows what they mean.
+
+The loaders (loaders.load_related) pick up both caches, so a relation that
+isn't selected costs nothing and one that is costs at most one query per
+level. A selected field that isn't a model field may read anything, so its
+model loads every column. Fragments are followed; @skip and @include
+aren't evaluated, so a conditional field is always loaded.
+"""
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import ast
+from graphql.type.definition import get_named_type
+
+
+def selected_fields(selection_set, fragments):
+    """Yield the Fields of a selection set, looking through fragments."""
+    for selection in selection_set.selections if selection_set else ():
+        if isinstance(selection, ast.Field):
+            yield selection
+        elif isinstance(selection, ast.InlineFragment):
+            yield from selected_fields(selection.selection_set, fragments)
+        elif isinstance(selection, ast.FragmentSpread):
+            fragment = fragments.get(selection.name.value)
+            if fragment is not None:
+                yield from selected_fields(fragment.selection_set, fragments)
+
+
+def selections(info, *path):
+    """
+    The Fields selected on the field being resolved, below `path` (e.g.
+    'edges', 'node'), and the GraphQL type they are selected on.
+    """
+    fields = list(info.field_asts)
+    graphql_type = get_named_type(info.return_type)
+    for name in path:
+        fields = [
+            child for field in fields
+            for child in selected_fields(field.selection_set, info.fragments)
+            if child.name.value == name
+        ]
+        graphql_type = get_named_type(graphql_type.fields[name].type)
+    return [child for field in fields for child in selected_fields(field.selection_set, info.fragments)], graphql_type
+
+
+def field_definition(graphql_type, name):
+    fields = getattr(graphql_type, 'fields', None) or {}
+    return fields.get(name)
+
+
+class Projection:
+    """
+    The columns and relations of `model` a selection set reads. Projections
+    compare equal when they load the same thing, so they can key loaders.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.columns = {model._meta.pk.name}
+        self.all_columns = False
+        self.joined = OrderedDict()  # select_related: name -> Projection
+        self.prefetched = OrderedDict()  # prefetch_related: name -> Projection
+
+    @classmethod
+    def build(cls, model, graphql_type, fields, fragments):
+        projection = cls(model)
+        grouped = OrderedDict()
+        for field in fields:
+            if field.name.value.startswith('__'):
+                continue
+            # the same field may be selected more than once, e.g. through fragments
+            grouped.setdefault(field.name.value, []).extend(selected_fields(field.selection_set, fragments))
+
+        for graphql_name, children in grouped.items():
+            name = to_snake_case(graphql_name)
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                projection.all_columns = True
+                continue
+            if not field.is_relation:
+                projection.columns.add(field.name)
+                continue
+            if field.concrete:
+                projection.columns.add(field.name)
+            definition = field_definition(graphql_type, graphql_name)
+            if field.many_to_many or (definition is not None and definition.args):
+                # resolved with a query of its own; nothing else to load here
+                continue
+            child_type = get_named_type(definition.type) if definition is not None else None
+            child = cls.build(field.related_model, child_type, children, fragments)
+            if field.one_to_many:
+                # prefetching matches the rows back to ours through this column
+                child.columns.add(field.field.name)
+                projection.prefetched[name] = child
+            else:
+                projection.joined[name] = child
+        return projection
+
+    def key(self):
+        return (
+            self.model._meta.label,
+            tuple(self.only()),
+            tuple((name, child.key()) for name, child in self.prefetched.items()),
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, Projection) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def only(self, prefix=''):
+        if self.all_columns:
+            columns = [field.name for field in self.model._meta.concrete_fields]
+        else:
+            columns = sorted(self.columns)
+        names = [prefix + column for column in columns]
+        for name, child in self.joined.items():
+            names.extend(child.only(f'{prefix}{name}__'))
+        return names
+
+    def select_related(self, prefix=''):
+        for name, child in self.joined.items():
+            yield prefix + name
+            yield from child.select_related(f'{prefix}{name}__')
+
+    def prefetch_related(self, prefix=''):
+        for name, child in self.joined.items():
+            yield from child.prefetch_related(f'{prefix}{name}__')
+        for name, child in self.prefetched.items():
+            # pk order, as the loaders return related lists
+            queryset = child.apply(child.model._default_manager.order_by('pk'))
+            yield Prefetch(prefix + name, queryset=queryset)
+
+    def apply(self, queryset):
+        related = list(self.select_related())
+        if related:
+            queryset = queryset.select_related(*related)
+        prefetches = list(self.prefetch_related())
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        return queryset.only(*self.only())
+
+
+def build_projection(model, info, *path, extra=()):
+    """
+    The Projection of `model` rows for what the field being resolved
+    selects, below `path` for connections ('edges', 'node'). `extra` names
+    columns the resolver needs whether or not they are selected.
+    """
+    fields, graphql_type = selections(info, *path)
+    projection = Projection.build(model, graphql_type, fields, info.fragments)
+    projection.columns.update(extra)
+    return projection
+
+
+def project(queryset, info, *path, extra=()):
+    """Narrow `queryset` to what the field being resolved selects; see build_projection."""
+    return build_projection(queryset.model, info, *path, extra=extra).apply(queryset)
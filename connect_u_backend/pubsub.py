@@ -0,0 +1,184 @@
+"""
+Publish/subscribe feeding the GraphQL subscriptions.
+
+Writes publish small JSON-able payloads (ids and counts, never model
+instances) on channels such as "comment_added:<post id>" once their
+transaction commits. Subscribers get an Rx Observable of Events. The
+backend is pluggable through GRAPHQL_SUBSCRIPTIONS['BACKEND']:
+
+- LocalBackend delivers to subscribers in the same process. It is enough
+  for development, tests and a single worker.
+- RedisBackend relays through Redis pub/sub so a write on one worker
+  reaches subscribers on every worker.
+
+Delivery happens on one dispatcher thread per process, never on the
+publishing request. An Event loads each model row at most once however many
+subscribers it has, so each subscriber only costs its own field resolution.
+"""
+import json
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+from rx import Observable
+from rx.disposables import AnonymousDisposable
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BACKEND': 'connect_u_backend.pubsub.LocalBackend',
+    'OPTIONS': {},
+    'KEEPALIVE': 20,  # seconds between keep-alive messages on idle sockets
+}
+
+
+def subscription_settings():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_SUBSCRIPTIONS', {})}
+
+
+class Event:
+    """A published payload, shared by every subscriber of its channel in this process."""
+
+    def __init__(self, channel, payload):
+        self.channel = channel
+        self.payload = payload
+        self.loaded = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, key):
+        return self.payload[key]
+
+    def load(self, model, key, **related):
+        """The `model` row whose pk is payload[key], fetched once per event."""
+        with self.lock:
+            if (model, key) not in self.loaded:
+                queryset = model.objects.select_related(*related.get('select_related', ()))
+                self.loaded[model, key] = queryset.filter(pk=self.payload[key]).first()
+            return self.loaded[model, key]
+
+
+class LocalBackend:
+
+    def __init__(self, inline=False):
+        # inline delivers on the publishing thread (tests, where rows aren't
+        # visible to other connections until the test transaction ends)
+        self.inline = inline
+        self.observers = {}
+        self.lock = threading.Lock()
+        self.queue = queue.SimpleQueue()
+        self.dispatcher = None
+
+    def publish(self, channel, payload):
+        if self.inline:
+            self.deliver(channel, payload)
+            return
+        self.start_dispatcher()
+        self.queue.put((channel, payload))
+
+    def start_dispatcher(self):
+        with self.lock:
+            if self.dispatcher is None:
+                self.dispatcher = threading.Thread(target=self.dispatch, name='graphql-pubsub', daemon=True)
+                self.dispatcher.start()
+
+    def dispatch(self):
+        while True:
+            channel, payload = self.queue.get()
+            try:
+                self.deliver(channel, payload)
+            except Exception:
+                logger.exception("Delivering %s failed", channel)
+            finally:
+                close_old_connections()
+
+    def deliver(self, channel, payload):
+        with self.lock:
+            observers = list(self.observers.get(channel, ()))
+        if not observers:
+            return
+        event = Event(channel, payload)
+        for observer in observers:
+            try:
+                observer.on_next(event)
+            except Exception:
+                logger.exception("A subscriber of %s failed", channel)
+
+    def subscribe(self, channel):
+        """An Observable of the Events published on `channel` from now on."""
+        def on_subscribe(observer):
+            with self.lock:
+                self.observers.setdefault(channel, set()).add(observer)
+
+            def unsubscribe():
+                with self.lock:
+                    channel_observers = self.observers.get(channel, set())
+                    channel_observers.discard(observer)
+                    if not channel_observers:
+                        self.observers.pop(channel, None)
+            return AnonymousDisposable(unsubscribe)
+        return Observable.create(on_subscribe)
+
+    def subscriber_count(self, channel):
+        with self.lock:
+            return len(self.observers.get(channel, ()))
+
+
+class RedisBackend(LocalBackend):
+    """
+    Publishes to Redis; one listener thread per process relays every message
+    to the local subscribers. Needs the `redis` package.
+    """
+
+    def __init__(self, url, prefix='graphql:'):
+        import redis
+        super().__init__()
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.listener = None
+
+    def publish(self, channel, payload):
+        self.start_dispatcher()
+        self.client.publish(self.prefix + channel, json.dumps(payload))
+
+    def start_dispatcher(self):
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.listen, name='graphql-pubsub-redis', daemon=True)
+                self.listener.start()
+        super().start_dispatcher()
+
+    def subscribe(self, channel):
+        self.start_dispatcher()
+        return super().subscribe(channel)
+
+    def listen(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(self.prefix + '*')
+        for message in pubsub.listen():
+            channel = message['channel'].decode()[len(self.prefix):]
+            self.queue.put((channel, json.loads(message['data'])))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            options = subscription_settings()
+            _backend = import_string(options['BACKEND'])(**options['OPTIONS'])
+        return _backend
+
+
+def publish(channel, **payload):
+    """Publish `payload` on `channel` once the current transaction commits."""
+    transaction.on_commit(lambda: get_backend().publish(channel, payload))
+
+
+def subscribe(channel):
+    return get_backend().subscribe(channel)
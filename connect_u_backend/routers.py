@@ -0,0 +1,115 @@
+"""
+Read-replica routing for the GraphQL API.
+
+Only GraphQL query operations read from the replica: the view runs each
+operation inside `route_operation`, which sets a context variable the router
+consults. Everything else (mutations, the admin, signals, management
+commands, pub/sub deliveries) keeps Django's default of using the primary.
+
+A viewer who has just run a mutation is "sticky": their queries go to the
+primary for STICKY_SECONDS afterwards, so they read their own writes even if
+the replica lags. The pins live in a cache (CACHE_ALIAS), which needs to be
+shared between workers for stickiness to hold across them.
+
+The context variable follows the request into sync_to_async threads and the
+async view's pool (concurrency.run_in_pool copies the context).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .cache import get_viewer
+
+DEFAULTS = {
+    'REPLICA': None,  # database alias for query operations, None to disable
+    'STICKY_SECONDS': 10,
+    'CACHE_ALIAS': 'default',
+}
+
+# alias reads of the current operation go to; None leaves Django's default
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def routing_settings():
+    return {**DEFAULTS, **getattr(settings, 'DATABASE_ROUTING', {})}
+
+
+def pin_key(viewer):
+    return f'db:primary:{viewer}'
+
+
+def pin_to_primary(viewer):
+    options = routing_settings()
+    caches[options['CACHE_ALIAS']].set(pin_key(viewer), True, options['STICKY_SECONDS'])
+
+
+def is_pinned(viewer):
+    return bool(viewer) and caches[routing_settings()['CACHE_ALIAS']].get(pin_key(viewer), False)
+
+
+@contextmanager
+def reading_from(alias):
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+@contextmanager
+def route_operation(request, operation_type):
+    """
+    Run one GraphQL operation: queries read from the replica unless the
+    viewer is pinned; a mutation pins its viewer to the primary afterwards.
+    Yields the alias the operation reads from, None for the primary.
+    """
+    replica = routing_settings()['REPLICA']
+    if not replica:
+        yield None
+        return
+    viewer = get_viewer(request)
+    if operation_type == 'mutation':
+        try:
+            yield None
+        finally:
+            if viewer:
+                pin_to_primary(viewer)
+        return
+    alias = replica if operation_type == 'query' and not is_pinned(viewer) else None
+    with reading_from(alias):
+        yield alias
+
+
+def replica_cache_timeout(alias):
+    """
+    How long a response read from `alias` may be cached. A lagging replica
+    can answer with rows from before a write whose invalidation already
+    happened, so its responses live no longer than the sticky window the
+    replica is trusted to catch up within; None (the default) otherwise.
+    """
+    return routing_settings()['STICKY_SECONDS'] if alias else None
+
+
+class PrimaryReplicaRouter:
+    """Routes reads to the alias chosen by route_operation; all writes go to the primary."""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary
+        aliases = {'default', routing_settings()['REPLICA']}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replica gets its schema through replication
+        if db == routing_settings()['REPLICA']:
+            return False
+        return None
@@ -1,9 +1,13 @@
 import graphene
+from django.contrib.auth import get_user_model
 from graphql_auth.schema import UserQuery as AuthUserQuery, MeQuery
 from graphql_auth import mutations
+from graphql_jwt.decorators import login_required
 from graphql_jwt.refresh_token.models import RefreshToken
-from users.schema import UserQuery, Mutation as UserMutation
-from posts.schema import Query as PostsQuery, Mutation as PostsMutation
+from users.auth import forget_user
+from users.schema import UserQuery, Mutation as UserMutation, Subscription as UserSubscription
+from posts.schema import Query as PostsQuery, Mutation as PostsMutation, Subscription as PostsSubscription
+from notifications.schema import Query as NotificationsQuery, Mutation as NotificationsMutation
 
 
 
@@ -16,8 +20,9 @@ class LogoutUser(graphene.Mutation):
 
     def mutate(self, info, refresh_token, **kwargs):
         try:
-            token = RefreshToken.objects.get(token=refresh_token)
+            token = RefreshToken.objects.select_related('user').get(token=refresh_token)
             token.revoke()  # blacklist token
+            forget_user(token.user)
             return LogoutUser(ok=True)
         except RefreshToken.DoesNotExist:
             return LogoutUser(ok=False)
@@ -47,10 +52,17 @@ class AuthMutation(graphene.ObjectType):
     # Custom logout mutation
     logout_user = LogoutUser.Field()
 
-class Query(AuthUserQuery, UserQuery, MeQuery, PostsQuery, graphene.ObjectType):
-    pass
+class Query(AuthUserQuery, UserQuery, MeQuery, PostsQuery, NotificationsQuery, graphene.ObjectType):
+    # `users` is graphql_auth's filter connection, which joins what UserNode
+    # needs itself; the users app's projected list resolver doesn't fit it
+    @login_required
+    def resolve_users(self, info, **kwargs):
+        return get_user_model().objects.all()
 
-class Mutation(AuthMutation, UserMutation, PostsMutation, graphene.ObjectType):
+class Mutation(AuthMutation, UserMutation, PostsMutation, NotificationsMutation, graphene.ObjectType):
    pass
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
\ No newline at end of file
+class Subscription(UserSubscription, PostsSubscription, graphene.ObjectType):
+    pass
+
+schema = graphene.Schema(query=Query, mutation=Mutation, subscription=Subscription)
\ No newline at end of file
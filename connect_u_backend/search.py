@@ -0,0 +1,185 @@
+"""
+Ranked full-text search shared by posts.search and users.search.
+
+On PostgreSQL every searchable table has a generated, weighted `tsvector`
+column with a GIN index (added by the posts/users search migrations), and
+queries are `websearch_to_tsquery` matches ranked with `ts_rank`. Other
+databases (SQLite in development and tests) use InvertedIndex, an in-process
+index built from the same fields with the same weights and kept current by
+the model signals.
+
+Results from both are paged on (rank, id), newest id first among ties.
+"""
+import base64
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchVectorField
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from graphql import GraphQLError
+
+from .pagination import build_connection, page_size
+
+# ts_rank weights for the A/B/C/D labels, mirrored by the fallback index
+WEIGHTS = {'A': 1.0, 'B': 0.4, 'C': 0.2, 'D': 0.1}
+MAX_QUERY_LENGTH = 200
+
+STOPWORDS = frozenset(
+    'a an and are as at be by for from has have in is it its of on or that the to was were will with'.split()
+)
+TOKEN_RE = re.compile(r'\w+')
+
+
+def uses_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def clean_query(text):
+    text = (text or '').strip()
+    if not text:
+        raise GraphQLError("Search query must not be empty.")
+    if len(text) > MAX_QUERY_LENGTH:
+        raise GraphQLError(f"Search query must be at most {MAX_QUERY_LENGTH} characters.")
+    return text
+
+
+def encode_rank_cursor(rank, pk):
+    return base64.urlsafe_b64encode(f"{rank!r}|{pk}".encode()).decode()
+
+
+def decode_rank_cursor(cursor):
+    try:
+        rank, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return float(rank), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise GraphQLError("Invalid cursor.")
+
+
+# PostgreSQL
+
+def vector_column(table):
+    """The generated search_vector column of `table`, which the models don't declare."""
+    return RawSQL(f'"{table}"."search_vector"', [], output_field=SearchVectorField())
+
+
+def search_query(text, config):
+    return SearchQuery(text, search_type='websearch', config=config)
+
+
+def ranked_page(queryset, connection_type, first=None, after=None):
+    """Keyset page of a queryset annotated with `rank`, best match first."""
+    limit = page_size(first)
+    queryset = queryset.order_by('-rank', '-pk')
+    if after:
+        rank, pk = decode_rank_cursor(after)
+        queryset = queryset.filter(Q(rank__lt=rank) | Q(rank=rank, pk__lt=pk))
+    rows = list(queryset[:limit + 1])
+    items = [(row, encode_rank_cursor(row.rank, row.pk)) for row in rows[:limit]]
+    return build_connection(connection_type, items, len(rows) > limit, after)
+
+
+# Fallback
+
+def tokenize(text):
+    for token in TOKEN_RE.findall((text or '').lower()):
+        if token in STOPWORDS:
+            continue
+        # a crude stand-in for stemming so "post" finds "posts"
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        yield token
+
+
+class InvertedIndex:
+    """
+    term -> {id: weighted term frequency}, built on first use from `load`,
+    which yields (id, [(text, weight label), ...]) for every document.
+    """
+
+    def __init__(self, load, load_one):
+        self.load = load
+        self.load_one = load_one
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.built = False
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def terms(fields):
+        terms = defaultdict(float)
+        for text, weight in fields:
+            for token in tokenize(text):
+                terms[token] += WEIGHTS[weight]
+        return terms
+
+    def add(self, pk, fields):
+        with self.lock:
+            self.discard(pk)
+            terms = self.terms(fields)
+            for term, frequency in terms.items():
+                self.postings[term][pk] = frequency
+            self.documents[pk] = terms
+
+    def discard(self, pk):
+        with self.lock:
+            for term in self.documents.pop(pk, ()):
+                self.postings[term].pop(pk, None)
+                if not self.postings[term]:
+                    del self.postings[term]
+
+    def clear(self):
+        """Forget everything; the next search rebuilds from the database."""
+        with self.lock:
+            self.postings.clear()
+            self.documents.clear()
+            self.built = False
+
+    def ensure_built(self):
+        with self.lock:
+            if not self.built:
+                for pk, fields in self.load():
+                    self.add(pk, fields)
+                self.built = True
+
+    def refresh(self, pk):
+        """Re-read one document after a write, once it has been committed."""
+        def apply():
+            if not self.built:
+                return
+            fields = self.load_one(pk)
+            if fields is None:
+                self.discard(pk)
+            else:
+                self.add(pk, fields)
+        transaction.on_commit(apply)
+
+    def search(self, text):
+        """Return [(score, id)] of documents containing every term, best first."""
+        self.ensure_built()
+        terms = set(tokenize(text))
+        if not terms:
+            return []
+        with self.lock:
+            postings = [self.postings.get(term, {}) for term in terms]
+            total = len(self.documents)
+        postings.sort(key=len)
+        scores = {}
+        for pk in postings[0]:
+            if all(pk in posting for posting in postings[1:]):
+                scores[pk] = sum(
+                    posting[pk] * math.log(1 + total / len(posting)) for posting in postings
+                )
+        return sorted(((score, pk) for pk, score in scores.items()), key=lambda pair: (-pair[0], -pair[1]))
+
+
+def page_of_ranked(ranked, first=None, after=None):
+    """Apply a rank cursor and page size to [(score, id)], returning (page, has_next_page)."""
+    limit = page_size(first)
+    if after:
+        rank, pk = decode_rank_cursor(after)
+        ranked = [(score, id) for score, id in ranked if score < rank or (score == rank and id < pk)]
+    return ranked[:limit], len(ranked) > limit
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'users.apps.UsersConfig',
     'posts.apps.PostsConfig',
+    'notifications.apps.NotificationsConfig',
     'graphene_django',
     'corsheaders',
     'django_filters',
@@ -53,6 +54,7 @@ GRAPHENE = {
     'SCHEMA': 'connect_u_backend.schema.schema',
     'MIDDLEWARE': [
         'graphql_jwt.middleware.JSONWebTokenMiddleware',
+        'connect_u_backend.profiling.ProfilingMiddleware',
     ],
 }
 
@@ -60,6 +62,9 @@ GRAPHQL_JWT = {
     "JWT_VERIFY_EXPIRATION": True,
     "JWT_EXPIRATION_DELTA": timedelta(minutes=15),  # Access token lifetime
     "JWT_REFRESH_EXPIRATION_DELTA": timedelta(days=14),  # Refresh token lifetime
+    # verified tokens and their users are cached per process (see users/auth.py)
+    "JWT_DECODE_HANDLER": "users.auth.jwt_decode",
+    "JWT_GET_USER_BY_NATURAL_KEY_HANDLER": "users.auth.get_user_by_natural_key",
     # ...
     "JWT_ALLOW_ANY_CLASSES": [
         "graphql_auth.mutations.Register",
@@ -77,6 +82,42 @@ GRAPHQL_JWT = {
     "JWT_LONG_RUNNING_REFRESH_TOKEN": True,
 }
 
+# How long a worker trusts a verified token's user before loading it again;
+# logout, password and account changes drop it at once on the same worker
+JWT_USER_CACHE = {
+    'ENABLED': True,
+    'TTL': 60,  # seconds
+    'MAX_ENTRIES': 10000,
+}
+
+
+# Authors with more followers than this are not fanned out into follower
+# timelines on write; their posts are merged into timelines at read time.
+TIMELINE_FANOUT_LIMIT = 5000
+
+# Seconds before a process rebuilds its in-memory follow graph (users/graph.py);
+# follows made through this process are applied to it immediately
+FOLLOW_GRAPH_REBUILD_INTERVAL = 300
+
+# Write-behind like buffer (posts/like_buffer.py): single like/unlike
+# mutations are batched per process and flushed every FLUSH_INTERVAL seconds
+# or at MAX_PENDING events. JOURNAL_DIR keeps them across crashes.
+LIKE_BUFFER = {
+    'ENABLED': os.environ.get('LIKE_BUFFER_ENABLED', '').lower() in ('1', 'true', 'yes'),
+    'FLUSH_INTERVAL': 0.5,  # seconds
+    'MAX_PENDING': 1000,
+    'JOURNAL_DIR': os.environ.get('LIKE_BUFFER_JOURNAL_DIR') or None,
+    'FSYNC': False,
+}
+
+# Trending post windows, name: (hours of activity ranked, half-life in hours),
+# and the weight of each kind of engagement (posts/trending.py). Scores are
+# kept up to date on write; run `manage.py rebuild_trending` periodically.
+TRENDING = {
+    'WINDOWS': {'day': (24, 6), 'week': (24 * 7, 36)},
+    'WEIGHTS': {'like': 1.0, 'comment': 3.0, 'comment_like': 0.5},
+}
+
 
 AUTHENTICATION_BACKENDS = [
     # "graphql_jwt.backends.JSONWebTokenBackend",
@@ -149,6 +190,111 @@ DATABASES = {
     )
 }
 
+# Optional read replica for GraphQL query operations (see
+# connect_u_backend/routers.py). Under test it mirrors the primary.
+if os.environ.get('DATABASE_REPLICA_URL'):
+    DATABASES['replica'] = dj_database_url.parse(os.environ['DATABASE_REPLICA_URL'], conn_max_age=600)
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['connect_u_backend.routers.PrimaryReplicaRouter']
+
+# Queries run on the replica unless the viewer wrote within STICKY_SECONDS.
+# Under test the mirror is a second connection, which can't see a TestCase's
+# uncommitted rows; tests that go through the view turn routing off.
+DATABASE_ROUTING = {
+    'REPLICA': 'replica' if 'replica' in DATABASES else None,
+    'STICKY_SECONDS': 10,
+    'CACHE_ALIAS': 'default',
+}
+
+# Django's psycopg (3) connection pool instead of persistent connections,
+# e.g. DATABASE_POOL_MAX_SIZE=10. Pooling replaces CONN_MAX_AGE.
+if os.environ.get('DATABASE_POOL_MAX_SIZE'):
+    for database in DATABASES.values():
+        if database['ENGINE'] == 'django.db.backends.postgresql':
+            database['CONN_MAX_AGE'] = 0
+            database.setdefault('OPTIONS', {})['pool'] = {
+                'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.environ['DATABASE_POOL_MAX_SIZE']),
+                'timeout': 10,  # seconds to wait for a free connection
+            }
+
+# Caching
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory caches are per process and evict least recently used entries
+# once MAX_ENTRIES is reached. Point GRAPHQL_CACHE_URL at a shared cache
+# (e.g. redis://...) so invalidations reach every worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'graphql': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'graphql-responses',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+if os.environ.get('GRAPHQL_CACHE_URL'):
+    CACHES['graphql'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['GRAPHQL_CACHE_URL'],
+    }
+
+# Read-only GraphQL responses (see connect_u_backend/cache.py)
+GRAPHQL_RESPONSE_CACHE = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'graphql',
+    'TIMEOUT': 30,  # seconds
+}
+
+# Parsed and validated GraphQL documents kept in memory, also the registry
+# of automatic persisted queries (see connect_u_backend/backend.py)
+GRAPHQL_DOCUMENT_CACHE_SIZE = 1000
+
+# Resolver/SQL profile of each GraphQL request: returned in `extensions.profile`
+# to staff (or anyone when DEBUG) sending the header, logged as a summary otherwise.
+# Times every resolver and query, so off unless GRAPHQL_PROFILING_ENABLED is set.
+GRAPHQL_PROFILING = {
+    'ENABLED': os.environ.get('GRAPHQL_PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes'),
+    'HEADER': 'X-Debug-Profile',
+    'TOP_FIELDS': 5,  # slowest fields included in the log line
+}
+
+# Operations deeper or costlier than this are rejected before execution
+# (see connect_u_backend/complexity.py for how cost is computed)
+GRAPHQL_QUERY_LIMITS = {
+    'MAX_DEPTH': 10,
+    'MAX_COST': 5000,
+    'DEFAULT_LIST_SIZE': 10,  # assumed size of lists without a `first` argument
+    'FIELD_WEIGHTS': {
+        'Query.timeline': 3,
+        'Query.commentThread': 2,
+    },
+}
+
+# Root fields of one query resolved concurrently by the async view (see
+# connect_u_backend/concurrency.py). Each pool thread keeps its own database
+# connection, so a worker may hold up to MAX_WORKERS more connections.
+GRAPHQL_CONCURRENCY = {
+    'ENABLED': True,
+    'MAX_WORKERS': 8,
+}
+
+# Pub/sub behind the GraphQL subscriptions (see connect_u_backend/pubsub.py).
+# The local backend only reaches sockets on the publishing worker; point
+# GRAPHQL_PUBSUB_URL at Redis when running more than one worker.
+GRAPHQL_SUBSCRIPTIONS = {
+    'BACKEND': 'connect_u_backend.pubsub.LocalBackend',
+    'OPTIONS': {},
+    'KEEPALIVE': 20,  # seconds between "ka" messages on legacy graphql-ws sockets
+}
+
+if os.environ.get('GRAPHQL_PUBSUB_URL'):
+    GRAPHQL_SUBSCRIPTIONS['BACKEND'] = 'connect_u_backend.pubsub.RedisBackend'
+    GRAPHQL_SUBSCRIPTIONS['OPTIONS'] = {'url': os.environ['GRAPHQL_PUBSUB_URL']}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
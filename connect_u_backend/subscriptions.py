@@ -0,0 +1,294 @@
+"""
+GraphQL over WebSocket for the Subscription root (commentAdded, postLiked,
+newFollower), served by the same ASGI application as the HTTP API.
+
+Both protocols in use by clients are spoken, picked from the requested
+subprotocol:
+
+- "graphql-transport-ws" (graphql-ws library): subscribe/next/error/complete,
+  ping/pong.
+- "graphql-ws" (legacy subscriptions-transport-ws, e.g. Apollo Client 2):
+  start/data/error/complete/stop, with "ka" keep-alive messages.
+
+The JWT travels in the connection_init payload ({"Authorization": "JWT ..."}),
+since browsers can't set headers on a WebSocket. Documents go through the
+same cached, cost-checked backend as the HTTP view. Subscription results
+are produced on the pub/sub delivery thread (see pubsub.py) and handed to
+the socket's event loop; queries and mutations sent over the socket run in
+a worker thread.
+"""
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from graphql.error import format_error
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.settings import jwt_settings
+from graphql_jwt.shortcuts import get_user_by_token
+from promise import is_thenable
+from rx import Observable, Observer
+
+from .backend import document_backend
+from .pubsub import subscription_settings
+
+logger = logging.getLogger(__name__)
+
+TRANSPORT_WS = 'graphql-transport-ws'
+LEGACY_WS = 'graphql-ws'
+
+# message types of each protocol, by role
+MESSAGES = {
+    TRANSPORT_WS: {'start': 'subscribe', 'stop': 'complete', 'data': 'next', 'complete': 'complete'},
+    LEGACY_WS: {'start': 'start', 'stop': 'stop', 'data': 'data', 'complete': 'complete'},
+}
+
+# close codes of graphql-transport-ws
+UNAUTHORIZED = 4401
+FORBIDDEN = 4403
+INVALID_MESSAGE = 4400
+INIT_TIMEOUT = 4408
+DUPLICATE_OPERATION = 4409
+TOO_MANY_INIT = 4429
+
+CONNECTION_INIT_TIMEOUT = 10  # seconds
+
+
+class SocketContext:
+    """`info.context` of operations on a socket: the user authenticated at connection_init."""
+
+    def __init__(self, scope, user):
+        self.scope = scope
+        self.user = user
+        self.META = {}
+
+
+def token_from(payload):
+    if not isinstance(payload, dict):
+        return None
+    header = payload.get('Authorization') or payload.get('authorization') or ''
+    prefix, _, token = header.partition(' ')
+    if prefix.lower() == jwt_settings.JWT_AUTH_HEADER_PREFIX.lower() and token:
+        return token
+    return payload.get('token')
+
+
+def authenticate(payload):
+    token = token_from(payload)
+    if not token:
+        return AnonymousUser()
+    try:
+        return get_user_by_token(token) or AnonymousUser()
+    except JSONWebTokenError:
+        return None
+
+
+def resolved(data):
+    """Subscription payloads may still hold loader promises; wait for them."""
+    if data is None:
+        return None
+    return {key: value.get() if is_thenable(value) else value for key, value in data.items()}
+
+
+def result_payload(result):
+    payload = {'data': resolved(result.data)}
+    if result.errors:
+        payload['errors'] = [format_error(error) for error in result.errors]
+    return payload
+
+
+class ResultObserver(Observer):
+    """Forwards a subscription's results from the delivery thread to the socket."""
+
+    def __init__(self, connection, id):
+        self.connection = connection
+        self.id = id
+
+    def on_next(self, result):
+        try:
+            self.connection.send_threadsafe(self.connection.data_message(self.id, result_payload(result)))
+        finally:
+            # loaders cache rows per operation; a subscription must see each event fresh
+            self.connection.context.__dict__.pop('_dataloaders', None)
+
+    def on_error(self, error):
+        logger.exception("Subscription %s failed", self.id, exc_info=error)
+        self.connection.send_threadsafe(self.connection.error_message(self.id, [format_error(error)]))
+
+    def on_completed(self):
+        self.connection.send_threadsafe({'type': 'complete', 'id': self.id})
+
+
+class GraphQLConnection:
+
+    def __init__(self, schema, scope, receive, send):
+        self.schema = schema
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.protocol = None
+        self.context = None
+        self.initialised = False
+        self.operations = {}
+        self.outgoing = asyncio.Queue()
+        self.loop = asyncio.get_running_loop()
+
+    def message(self, role):
+        return MESSAGES[self.protocol][role]
+
+    def data_message(self, id, payload):
+        return {'type': self.message('data'), 'id': id, 'payload': payload}
+
+    def error_message(self, id, errors):
+        if self.protocol == LEGACY_WS:
+            return {'type': 'error', 'id': id, 'payload': errors[0] if len(errors) == 1 else {'errors': errors}}
+        return {'type': 'error', 'id': id, 'payload': errors}
+
+    def send_threadsafe(self, message):
+        self.loop.call_soon_threadsafe(self.outgoing.put_nowait, message)
+
+    async def run(self):
+        event = await self.receive()
+        if event['type'] != 'websocket.connect':
+            return
+        requested = self.scope.get('subprotocols') or []
+        self.protocol = next((p for p in requested if p in MESSAGES), None)
+        if self.protocol is None:
+            await self.send({'type': 'websocket.close', 'code': 1002})
+            return
+        await self.send({'type': 'websocket.accept', 'subprotocol': self.protocol})
+
+        sender = asyncio.ensure_future(self.send_outgoing())
+        background = [sender, asyncio.ensure_future(self.expect_init())]
+        if self.protocol == LEGACY_WS:
+            background.append(asyncio.ensure_future(self.keep_alive()))
+        try:
+            while True:
+                event = await self.receive()
+                if event['type'] == 'websocket.disconnect':
+                    break
+                if event['type'] == 'websocket.receive':
+                    await self.handle(event.get('text') or event.get('bytes'))
+        finally:
+            for operation in list(self.operations.values()):
+                operation.dispose()
+            self.operations.clear()
+            for task in background:
+                task.cancel()
+
+    async def send_outgoing(self):
+        while True:
+            message = await self.outgoing.get()
+            if message.get('type') == 'websocket.close':
+                await self.send(message)
+                continue
+            await self.send({'type': 'websocket.send', 'text': json.dumps(message)})
+
+    def close(self, code, reason=''):
+        self.outgoing.put_nowait({'type': 'websocket.close', 'code': code, 'reason': reason})
+
+    async def expect_init(self):
+        await asyncio.sleep(CONNECTION_INIT_TIMEOUT)
+        if not self.initialised:
+            self.close(INIT_TIMEOUT, 'Connection initialisation timeout')
+
+    async def keep_alive(self):
+        interval = subscription_settings()['KEEPALIVE']
+        while True:
+            await asyncio.sleep(interval)
+            if self.initialised:
+                self.outgoing.put_nowait({'type': 'ka'})
+
+    async def handle(self, text):
+        try:
+            message = json.loads(text)
+            kind = message['type']
+        except (TypeError, ValueError, KeyError):
+            self.close(INVALID_MESSAGE, 'Invalid message')
+            return
+
+        if kind == 'connection_init':
+            await self.init(message.get('payload'))
+        elif kind == 'ping':
+            self.outgoing.put_nowait({'type': 'pong'})
+        elif kind == 'pong':
+            pass
+        elif kind == 'connection_terminate':
+            self.close(1000)
+        elif not self.initialised:
+            self.close(UNAUTHORIZED, 'Unauthorized')
+        elif kind == self.message('start'):
+            await self.start(message.get('id'), message.get('payload') or {})
+        elif kind == self.message('stop'):
+            operation = self.operations.pop(message.get('id'), None)
+            if operation is not None:
+                operation.dispose()
+        else:
+            self.close(INVALID_MESSAGE, f'Unknown message type {kind}')
+
+    async def init(self, payload):
+        if self.initialised:
+            self.close(TOO_MANY_INIT, 'Too many initialisation requests')
+            return
+        user = await sync_to_async(authenticate)(payload)
+        if user is None:
+            if self.protocol == LEGACY_WS:
+                self.outgoing.put_nowait({'type': 'connection_error', 'payload': {'message': 'Invalid token'}})
+            self.close(FORBIDDEN, 'Forbidden')
+            return
+        self.context = SocketContext(self.scope, user)
+        self.initialised = True
+        self.outgoing.put_nowait({'type': 'connection_ack'})
+        if self.protocol == LEGACY_WS:
+            self.outgoing.put_nowait({'type': 'ka'})
+
+    async def start(self, id, payload):
+        if not id:
+            self.close(INVALID_MESSAGE, 'Missing operation id')
+            return
+        if id in self.operations:
+            self.close(DUPLICATE_OPERATION, f'Subscriber for {id} already exists')
+            return
+        result = await sync_to_async(self.execute)(payload)
+        if isinstance(result, list):
+            self.outgoing.put_nowait(self.error_message(id, result))
+        elif isinstance(result, Observable):
+            self.operations[id] = result.subscribe(ResultObserver(self, id))
+        else:
+            payload = await sync_to_async(result_payload)(result)
+            self.outgoing.put_nowait(self.data_message(id, payload))
+            self.outgoing.put_nowait({'type': 'complete', 'id': id})
+
+    def execute(self, payload):
+        """The operation's ExecutionResult, its Observable for subscriptions, or a list of errors."""
+        try:
+            document = document_backend.document_from_string(self.schema, payload.get('query') or '')
+        except Exception as error:
+            return [format_error(error)]
+        result = document.execute(
+            context_value=self.context,
+            variable_values=payload.get('variables'),
+            operation_name=payload.get('operationName'),
+            allow_subscriptions=True,
+        )
+        if not isinstance(result, Observable) and result.invalid:
+            return [format_error(error) for error in result.errors]
+        return result
+
+
+class GraphQLWebSocketApp:
+    """ASGI application for websocket scopes; see the module docstring."""
+
+    def __init__(self, schema=None):
+        self._schema = schema
+
+    @property
+    def schema(self):
+        if self._schema is None:
+            from .schema import schema
+            self._schema = schema
+        return self._schema
+
+    async def __call__(self, scope, receive, send):
+        await GraphQLConnection(self.schema, scope, receive, send).run()
@@ -16,10 +16,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
+from .views import AsyncGraphQLView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path("", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("", csrf_exempt(AsyncGraphQLView.as_view(graphiql=True))),
 ]
@@ -0,0 +1,223 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import authenticate
+from django.http import HttpResponse
+from django.http.response import HttpResponseBadRequest
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView as BaseGraphQLView, HttpError
+from graphql.execution import ExecutionResult
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.utils import get_http_authorization
+
+from . import cache as response_cache, concurrency, profiling, routers
+from .backend import document_backend, query_hash
+from .complexity import query_limits
+
+
+class GraphQLView(BaseGraphQLView):
+    """
+    GraphQL endpoint that accepts automatic persisted queries, reuses parsed
+    and validated documents, serves repeated read-only queries from the
+    response cache and reports each operation's static cost (and, on request,
+    its resolver/SQL profile) in `extensions`.
+    """
+
+    def get_backend(self, request):
+        return document_backend
+
+    def get_graphql_params(self, request, data):
+        query, variables, operation_name, id = super().get_graphql_params(request, data)
+
+        extensions = request.GET.get("extensions") or data.get("extensions")
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        persisted = (extensions or {}).get("persistedQuery")
+        if not persisted:
+            return query, variables, operation_name, id
+
+        sha256_hash = persisted.get("sha256Hash")
+        if query:
+            # registering a query: make sure the hash really is its hash
+            if query_hash(query) != sha256_hash:
+                raise HttpError(HttpResponseBadRequest("provided sha does not match query"))
+            return query, variables, operation_name, id
+
+        document = document_backend.get_document(sha256_hash) if sha256_hash else None
+        if document is None:
+            # APQ clients retry with the full query text on this error
+            raise HttpError(HttpResponse(status=200), "PersistedQueryNotFound")
+        return document.document_string, variables, operation_name, id
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        document = key = result = None
+        if query:
+            try:
+                document = self.get_backend(request).document_from_string(self.schema, query)
+            except Exception:
+                pass  # let the base view report the syntax error
+            if document is not None:
+                key, result = self.cached_result(request, document, variables, operation_name)
+
+        if result is None:
+            operation_type = document.get_operation_type(operation_name) if document is not None else None
+            profile = profiling.start(request)
+            with routers.route_operation(request, operation_type) as alias:
+                if profile is None:
+                    result = super().execute_graphql_request(
+                        request, data, query, variables, operation_name, show_graphiql)
+                else:
+                    with profile:
+                        result = super().execute_graphql_request(
+                            request, data, query, variables, operation_name, show_graphiql)
+            if profile is not None and result is not None:
+                profiling.finish(request, profile, result, operation_name)
+            self.cache_result(key, result, routers.replica_cache_timeout(alias))
+
+        if result is not None and document is not None:
+            self.add_extensions(result, document, operation_name)
+        return result
+
+    def cached_result(self, request, document, variables, operation_name):
+        """Return (cache key or None, cached ExecutionResult or None)."""
+        key = response_cache.get_key(request, self.schema, document.document_ast, variables, operation_name)
+        if key is not None:
+            cached = response_cache.get_response(key)
+            if cached is not None:
+                return key, ExecutionResult(data=cached)
+        return key, None
+
+    def cache_result(self, key, result, timeout=None):
+        if key is not None and result is not None and not result.errors and not result.invalid:
+            response_cache.set_response(key, result.data, timeout)
+
+    def add_extensions(self, result, document, operation_name):
+        complexity = getattr(document, 'complexity', {})
+        if operation_name not in complexity and len(complexity) == 1:
+            operation_name = next(iter(complexity))
+        if operation_name in complexity:
+            cost, depth = complexity[operation_name]
+            limits = query_limits()
+            result.extensions['cost'] = {
+                'requested': cost,
+                'maximum': limits['MAX_COST'],
+                'depth': depth,
+                'maximumDepth': limits['MAX_DEPTH'],
+            }
+
+    def get_response(self, request, data, show_graphiql=False):
+        """Same as the base view, plus the result's `extensions` in the response body."""
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        return self.format_response(request, execution_result, id, show_graphiql)
+
+    def format_response(self, request, execution_result, id=None, show_graphiql=False):
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        if not execution_result:
+            return None, 200
+
+        status_code = 200
+        response = {}
+        if execution_result.errors:
+            set_rollback()
+            response["errors"] = [self.format_error(e) for e in execution_result.errors]
+
+        if execution_result.invalid:
+            status_code = 400
+        else:
+            response["data"] = execution_result.data
+
+        if execution_result.extensions:
+            response["extensions"] = execution_result.extensions
+
+        if self.batch:
+            response["id"] = id
+            response["status"] = status_code
+
+        return self.json_encode(request, response, pretty=show_graphiql), status_code
+
+
+class AsyncGraphQLView(GraphQLView):
+    """
+    GraphQLView for ASGI. Queries with several root fields have them resolved
+    concurrently on a bounded thread pool (see concurrency.py), with the same
+    persisted queries, response cache, cost extensions and profiling as the
+    sync view. Everything else (mutations, single-field queries, GraphiQL,
+    batches) runs through the sync view in a worker thread.
+    """
+
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            documents = None
+            if request.method.lower() in ("get", "post") and not self.batch:
+                data = self.parse_body(request)
+                if not (self.graphiql and self.can_display_graphiql(request, data)):
+                    query, variables, operation_name, id = self.get_graphql_params(request, data)
+                    document, documents = self.concurrent_documents(request, query, operation_name)
+            if documents is None:
+                return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+            result = await self.execute_concurrently(request, document, documents, variables, operation_name)
+            content, status_code = self.format_response(request, result, id)
+            return HttpResponse(status=status_code, content=content, content_type="application/json")
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(request, {"errors": [self.format_error(e)]})
+            return response
+
+    def concurrent_documents(self, request, query, operation_name):
+        """The parsed document and its per-root-field documents, or (None, None) if it shouldn't be split."""
+        if not query or not concurrency.concurrency_settings()['ENABLED']:
+            return None, None
+        try:
+            document = self.get_backend(request).document_from_string(self.schema, query)
+        except Exception:
+            return None, None
+        if not document.valid:
+            return None, None
+        documents = concurrency.root_field_documents(document.document_ast, operation_name)
+        return (document, documents) if documents else (None, None)
+
+    async def execute_concurrently(self, request, document, documents, variables, operation_name):
+        # authenticate once up front rather than racing to do it in every field
+        key, result = await concurrency.run_in_pool(
+            self.authenticated_cached_result, request, document, variables, operation_name)
+        if result is None:
+            profile = profiling.start(request)
+            with routers.route_operation(request, 'query') as alias:
+                result = await concurrency.execute_concurrently(
+                    self.schema, documents, request, profile,
+                    root_value=self.get_root_value(request),
+                    variable_values=variables,
+                    operation_name=operation_name,
+                    middleware=self.get_middleware(request),
+                )
+            if profile is not None:
+                profile.stop()
+                profiling.finish(request, profile, result, operation_name)
+            await concurrency.run_in_pool(self.cache_result, key, result, routers.replica_cache_timeout(alias))
+        self.add_extensions(result, document, operation_name)
+        return result
+
+    def authenticated_cached_result(self, request, document, variables, operation_name):
+        user = getattr(request, 'user', None)
+        if (user is None or user.is_anonymous) and get_http_authorization(request) is not None:
+            try:
+                user = authenticate(request=request)
+            except JSONWebTokenError:
+                user = None  # each field reports the token error, as in the sync view
+            if user is not None:
+                request.user = user
+        return self.cached_result(request, document, variables, operation_name)
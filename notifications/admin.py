@@ -0,0 +1,6 @@
+from django.contrib import admin
+from .models import Notification, Inbox
+
+# Register your models here.
+admin.site.register(Notification)
+admin.site.register(Inbox)
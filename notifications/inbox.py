@@ -0,0 +1,103 @@
+"""
+Writing to and reading from notification inboxes.
+
+Activity is coalesced when it is written: a like of a post whose author
+already has an unread "liked your post" notification for it makes the liker
+that notification's latest actor instead of adding a notification, with a
+fixed number of statements for any number of recipients. Actors are kept in
+NotificationActor, so someone who likes, unlikes and likes again counts
+once. Only activity that opens a new notification touches Inbox, whose
+unread_count is recounted from the unread rows of the recipients involved,
+so it stays exact under concurrent writers and reading it is a primary key
+lookup.
+"""
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Inbox, Notification, NotificationActor
+
+
+def group_key(verb, post_id=None, comment_id=None):
+    return f'{verb}:{post_id or ""}:{comment_id or ""}'
+
+
+def notify(verb, actor_id, targets):
+    """
+    Record that `actor_id` did `verb` for each (recipient id, post id,
+    comment id) of `targets`, coalescing into unread notifications. Nobody
+    is notified of their own activity.
+    """
+    groups = {}
+    for recipient_id, post_id, comment_id in targets:
+        if recipient_id != actor_id:
+            groups[recipient_id, group_key(verb, post_id, comment_id)] = (post_id, comment_id)
+    if not groups:
+        return
+    now = timezone.now()
+    recipients = {recipient_id for recipient_id, _ in groups}
+    unread = Notification.objects.filter(
+        recipient_id__in=recipients, group_key__in={key for _, key in groups}, read=False)
+
+    def unread_groups():
+        return {
+            (recipient_id, key): pk
+            for pk, recipient_id, key in unread.values_list('pk', 'recipient_id', 'group_key')
+            if (recipient_id, key) in groups
+        }
+
+    existing = unread_groups()
+    new = [
+        Notification(recipient_id=recipient_id, verb=verb, group_key=key, post_id=post_id, comment_id=comment_id,
+                     actor_id=actor_id, updated_at=now)
+        for (recipient_id, key), (post_id, comment_id) in groups.items()
+        if (recipient_id, key) not in existing
+    ]
+    if new:
+        # a concurrent first notification of the same group wins the unique constraint
+        Notification.objects.bulk_create(new, ignore_conflicts=True)
+        existing = unread_groups()
+
+    # someone already counted (e.g. like, unlike, like) isn't news
+    pks = set(existing.values())
+    known = set(NotificationActor.objects.filter(notification_id__in=pks, actor_id=actor_id)
+                .values_list('notification_id', flat=True))
+    fresh = pks - known
+    if fresh:
+        NotificationActor.objects.bulk_create(
+            [NotificationActor(notification_id=pk, actor_id=actor_id) for pk in fresh], ignore_conflicts=True)
+        actors = (
+            NotificationActor.objects.filter(notification_id=OuterRef('pk'))
+            .order_by().values('notification_id').annotate(n=Count('pk')).values('n')
+        )
+        Notification.objects.filter(pk__in=fresh).update(
+            actor_id=actor_id, updated_at=now, actor_count=Subquery(actors, output_field=IntegerField()))
+    if new:
+        recount({notification.recipient_id for notification in new})
+
+
+def recount(user_ids):
+    """Set the unread count of `user_ids` from their unread notifications."""
+    Inbox.objects.bulk_create([Inbox(user_id=pk) for pk in user_ids], ignore_conflicts=True)
+    unread = (
+        Notification.objects.filter(recipient_id=OuterRef('user_id'), read=False)
+        .order_by().values('recipient_id').annotate(n=Count('pk')).values('n')
+    )
+    Inbox.objects.filter(user_id__in=user_ids).update(
+        unread_count=Coalesce(Subquery(unread, output_field=IntegerField()), 0))
+
+
+def unread_count(user):
+    return Inbox.objects.filter(user=user).values_list('unread_count', flat=True).first() or 0
+
+
+def mark_read(user, ids=None):
+    """Mark `user`'s notifications `ids` (all of them if None) read. Returns how many were unread."""
+    unread = Notification.objects.filter(recipient=user, read=False)
+    if ids is not None:
+        unread = unread.filter(pk__in=ids)
+    marked = unread.update(read=True)
+    if marked:
+        # recounted even when marking all: a notification may have opened since
+        recount([user.pk])
+    return marked
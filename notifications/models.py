@@ -0,0 +1,69 @@
+from django.db import models
+from django.db.models import Q
+from django.contrib.auth import get_user_model
+
+from posts.models import Post, Comment
+
+User = get_user_model()
+
+
+class Notification(models.Model):
+    """
+    One entry of a user's inbox. Activity on the same thing is coalesced
+    into the user's unread notification for it ("alice and 41 others liked
+    your post"), so an inbox grows with what happened, not with how often.
+    """
+    POST_LIKED = 'post_liked'
+    POST_COMMENTED = 'post_commented'
+    COMMENT_REPLIED = 'comment_replied'
+    FOLLOWED = 'followed'
+    VERBS = [
+        (POST_LIKED, 'liked your post'),
+        (POST_COMMENTED, 'commented on your post'),
+        (COMMENT_REPLIED, 'replied to your comment'),
+        (FOLLOWED, 'followed you'),
+    ]
+
+    recipient = models.ForeignKey(User, related_name='notifications', on_delete=models.CASCADE)
+    verb = models.CharField(max_length=32, choices=VERBS)
+    post = models.ForeignKey(Post, related_name='+', null=True, blank=True, on_delete=models.CASCADE)
+    comment = models.ForeignKey(Comment, related_name='+', null=True, blank=True, on_delete=models.CASCADE)
+    # what unread activity is coalesced on, e.g. "post_liked:12:"
+    group_key = models.CharField(max_length=64, editable=False)
+    actor = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)  # the latest one
+    actor_count = models.PositiveIntegerField(default=1)  # distinct actors, see NotificationActor
+    read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)  # the inbox order, which bumps don't move
+    updated_at = models.DateTimeField()  # time of the latest activity
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['recipient', 'group_key'], condition=Q(read=False),
+                                    name='notification_unread_group_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['recipient', 'created_at', 'id'], name='notification_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_verb_display()} for {self.recipient.email}'
+
+
+class NotificationActor(models.Model):
+    """Someone a notification is about, so each person counts once however often they act."""
+    notification = models.ForeignKey(Notification, related_name='actors', on_delete=models.CASCADE)
+    actor = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['notification', 'actor'], name='notification_actor_uniq'),
+        ]
+
+
+class Inbox(models.Model):
+    """A user's unread notification count, kept in step on write so reading it is one row."""
+    user = models.OneToOneField(User, primary_key=True, related_name='inbox', on_delete=models.CASCADE)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user.email}'s inbox"
@@ -0,0 +1,84 @@
+import graphene
+from graphene_django import DjangoObjectType
+from graphql_jwt.decorators import login_required
+
+from connect_u_backend import bulk
+from connect_u_backend.loaders import related_resolver
+from connect_u_backend.pagination import paginate
+from . import inbox
+from .models import Notification
+
+
+class NotificationType(DjangoObjectType):
+    class Meta:
+        model = Notification
+        exclude = ('recipient', 'group_key')
+
+    # e.g. "alice and 41 others liked your post"
+    message = graphene.String()
+    # how many actors besides `actor`, the latest one
+    others_count = graphene.Int()
+
+    resolve_actor = related_resolver('actor')
+    resolve_post = related_resolver('post')
+    resolve_comment = related_resolver('comment')
+
+    def resolve_others_count(self, info):
+        return self.actor_count - 1
+
+    def resolve_message(self, info):
+        actors = self.actor.username or "Someone"
+        others = self.actor_count - 1
+        if others:
+            actors += f" and {others} other{'s' if others > 1 else ''}"
+        return f"{actors} {self.get_verb_display()}"
+
+class NotificationConnection(graphene.relay.Connection):
+    class Meta:
+        node = NotificationType
+
+
+class Query(graphene.ObjectType):
+    notifications = graphene.Field(NotificationConnection, first=graphene.Int(), after=graphene.String(), unread_only=graphene.Boolean())
+    unread_notification_count = graphene.Int()
+
+    # get a page of the viewer's notifications, newest first; paged on the
+    # creation time, since new activity changes updated_at under the cursors
+    @login_required
+    def resolve_notifications(self, info, first=None, after=None, unread_only=False):
+        queryset = Notification.objects.filter(recipient=info.context.user).select_related('actor')
+        if unread_only:
+            queryset = queryset.filter(read=False)
+        return paginate(queryset, NotificationConnection, first=first, after=after)
+
+    # kept up to date on write, so this reads one row
+    @login_required
+    def resolve_unread_notification_count(self, info):
+        return inbox.unread_count(info.context.user)
+
+
+class MarkNotificationsRead(graphene.Mutation):
+    class Arguments:
+        # all of the viewer's notifications when left out
+        notification_ids = graphene.List(graphene.ID)
+
+    success = graphene.Boolean()
+    message = graphene.String()
+    marked = graphene.Int()
+    unread_count = graphene.Int()
+
+    @login_required
+    def mutate(self, info, notification_ids=None):
+        user = info.context.user
+        ids = bulk.parse_ids(notification_ids) if notification_ids is not None else None
+        marked = inbox.mark_read(user, ids)
+        return MarkNotificationsRead(
+            success=True,
+            message=f"{marked} notifications marked as read.",
+            marked=marked,
+            unread_count=inbox.unread_count(user),
+        )
+
+
+class Mutation(graphene.ObjectType):
+    mark_notifications_read = MarkNotificationsRead.Field()
@@ -0,0 +1,53 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from posts.models import Post, Comment, PostLike
+from posts.signals import posts_liked
+from users.models import Follow
+from users.signals import follows_created
+from . import inbox
+from .models import Notification
+
+
+@receiver(post_save, sender=PostLike)
+def notify_post_liked(sender, instance, created, **kwargs):
+    if created:
+        notify_posts_liked(sender, [instance.post_id], instance.user_id)
+
+
+@receiver(posts_liked)
+def notify_posts_liked(sender, post_ids, user_id, **kwargs):
+    authors = Post.objects.filter(pk__in=post_ids).values_list('author_id', 'pk')
+    inbox.notify(Notification.POST_LIKED, user_id, [(author_id, pk, None) for author_id, pk in authors])
+
+
+@receiver(post_save, sender=Comment)
+def notify_commented(sender, instance, created, **kwargs):
+    """The post's author hears of every comment; the parent comment's author of replies to it."""
+    if not created:
+        return
+    post_author = Post.objects.filter(pk=instance.post_id).values_list('author_id', flat=True).first()
+    if instance.parent_id:
+        parent_author = Comment.objects.filter(pk=instance.parent_id).values_list('author_id', flat=True).first()
+        inbox.notify(Notification.COMMENT_REPLIED, instance.author_id, [(parent_author, instance.post_id, instance.parent_id)])
+        if parent_author == post_author:
+            return
+    inbox.notify(Notification.POST_COMMENTED, instance.author_id, [(post_author, instance.post_id, None)])
+
+
+@receiver(post_save, sender=Follow)
+def notify_followed(sender, instance, created, **kwargs):
+    if created:
+        inbox.notify(Notification.FOLLOWED, instance.follower_id, [(instance.followed_id, None, None)])
+
+
+@receiver(follows_created)
+def notify_followed_bulk(sender, follower_id, followed_ids, **kwargs):
+    inbox.notify(Notification.FOLLOWED, follower_id, [(followed_id, None, None) for followed_id in followed_ids])
+
+
+@receiver(post_delete, sender=Notification)
+def forget_deleted_notification(sender, instance, **kwargs):
+    """Notifications go with their post or comment; keep the unread count exact."""
+    if not instance.read:
+        inbox.recount([instance.recipient_id])
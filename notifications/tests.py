@@ -0,0 +1,185 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from graphql_jwt.testcases import JSONWebTokenTestCase
+
+from posts.models import Post, Comment, PostLike
+from users.models import Follow
+from .models import Notification, Inbox
+
+User = get_user_model()
+
+# Create your tests here.
+
+
+class NotificationInboxTest(JSONWebTokenTestCase):
+    query = '''
+        query Inbox($first: Int, $after: String, $unreadOnly: Boolean) {
+          notifications(first: $first, after: $after, unreadOnly: $unreadOnly) {
+            edges { node { id verb message othersCount read } }
+            pageInfo { hasNextPage endCursor }
+          }
+          unreadNotificationCount
+        }
+    '''
+    mark_read = '''
+        mutation($ids: [ID]) {
+          markNotificationsRead(notificationIds: $ids) { success marked unreadCount }
+        }
+    '''
+
+    def setUp(self):
+        self.author = User.objects.create_user(email='author@example.com', password='pass', username='author')
+        self.fans = [
+            User.objects.create_user(email=f'fan{i}@example.com', password='pass', username=f'fan{i}')
+            for i in range(4)
+        ]
+        self.post = Post.objects.create(title='Post', content='...', author=self.author)
+        self.client.authenticate(self.author)
+
+    def inbox(self, **variables):
+        result = self.client.execute(self.query, variables)
+        self.assertIsNone(result.errors)
+        return [edge['node'] for edge in result.data['notifications']['edges']], result.data['unreadNotificationCount']
+
+    def test_likes_are_coalesced_into_one_notification(self):
+        for fan in self.fans:
+            PostLike.objects.create(post=self.post, user=fan)
+        notifications, unread = self.inbox()
+        self.assertEqual(len(notifications), 1)
+        self.assertEqual(notifications[0]['message'], 'fan3 and 3 others liked your post')
+        self.assertEqual(notifications[0]['othersCount'], 3)
+        self.assertEqual(unread, 1)
+
+    def test_each_actor_counts_once(self):
+        toggle = 'mutation($id: ID!) { togglePostLike(postId: $id) { liked } }'
+        for fan in (self.fans[0], self.fans[1], self.fans[0], self.fans[0]):
+            self.client.authenticate(fan)
+            self.client.execute(toggle, {'id': self.post.pk})
+        self.client.authenticate(self.author)
+        notifications, _ = self.inbox()
+        # fan0 liked, unliked and liked again: still one of two people
+        self.assertEqual([n['message'] for n in notifications], ['fan1 and 1 other liked your post'])
+
+    def test_bulk_and_toggle_likes_notify(self):
+        other = Post.objects.create(title='Other', content='...', author=self.author)
+        self.client.authenticate(self.fans[0])
+        self.client.execute('mutation($ids: [ID]!) { likePosts(postIds: $ids) { success } }', {'ids': [self.post.pk, other.pk]})
+        self.client.authenticate(self.fans[1])
+        self.client.execute('mutation($id: ID!) { togglePostLike(postId: $id) { liked } }', {'id': self.post.pk})
+        self.client.authenticate(self.author)
+        notifications, unread = self.inbox()
+        self.assertEqual(sorted(n['message'] for n in notifications),
+                         ['fan0 liked your post', 'fan1 and 1 other liked your post'])
+        self.assertEqual(unread, 2)
+
+    def test_own_activity_is_not_notified(self):
+        PostLike.objects.create(post=self.post, user=self.author)
+        Comment.objects.create(post=self.post, author=self.author, content='bump')
+        self.assertEqual(self.inbox(), ([], 0))
+
+    def test_comments_replies_and_follows(self):
+        comment = Comment.objects.create(post=self.post, author=self.fans[0], content='nice')
+        self.client.authenticate(self.fans[1])
+        self.client.execute(
+            'mutation($id: ID!) { createCommentComment(parentCommentId: $id, content: "agreed") { success } }',
+            {'id': comment.pk},
+        )
+        Follow.objects.create(follower=self.fans[2], followed=self.author)
+        self.client.authenticate(self.fans[3])
+        self.client.execute('mutation($ids: [ID]!) { followUsers(userIds: $ids) { success } }', {'ids': [self.author.pk]})
+
+        self.client.authenticate(self.fans[0])
+        notifications, _ = self.inbox()
+        self.assertEqual([n['message'] for n in notifications], ['fan1 replied to your comment'])
+        self.client.authenticate(self.author)
+        notifications, unread = self.inbox()
+        self.assertEqual([n['message'] for n in notifications], [
+            'fan3 and 1 other followed you',
+            'fan1 and 1 other commented on your post',
+        ])
+        self.assertEqual(unread, 2)
+
+    def test_unread_count_reads_one_row(self):
+        for fan in self.fans:
+            Follow.objects.create(follower=fan, followed=self.author)
+            PostLike.objects.create(post=self.post, user=fan)
+        with CaptureQueriesContext(connection) as queries:
+            result = self.client.execute('{ unreadNotificationCount }')
+        self.assertEqual(result.data['unreadNotificationCount'], 2)
+        # besides authenticating the viewer, one primary key lookup; no counting
+        inbox_reads = [q['sql'] for q in queries if 'notifications_' in q['sql']]
+        self.assertEqual(len(inbox_reads), 1)
+        self.assertNotIn('notifications_notification', inbox_reads[0])
+
+    def test_mark_read_and_start_a_new_group(self):
+        PostLike.objects.create(post=self.post, user=self.fans[0])
+        Follow.objects.create(follower=self.fans[0], followed=self.author)
+        like = Notification.objects.get(verb=Notification.POST_LIKED)
+
+        result = self.client.execute(self.mark_read, {'ids': [like.pk]})
+        self.assertEqual(result.data['markNotificationsRead'], {'success': True, 'marked': 1, 'unreadCount': 1})
+
+        # read notifications stay as they were; new likes open a new group
+        PostLike.objects.create(post=self.post, user=self.fans[1])
+        notifications, unread = self.inbox(unreadOnly=True)
+        self.assertEqual([n['message'] for n in notifications], ['fan1 liked your post', 'fan0 followed you'])
+        self.assertEqual(unread, 2)
+
+        result = self.client.execute(self.mark_read)
+        self.assertEqual(result.data['markNotificationsRead'], {'success': True, 'marked': 2, 'unreadCount': 0})
+        self.assertEqual(Inbox.objects.get(user=self.author).unread_count, 0)
+
+    def test_mark_all_read_counts_what_opened_meanwhile(self):
+        from unittest import mock
+        from django.db.models import QuerySet
+        from . import inbox
+        PostLike.objects.create(post=self.post, user=self.fans[0])
+        update = QuerySet.update
+
+        def mark_then_follow(queryset, **kwargs):
+            marked = update(queryset, **kwargs)
+            if kwargs == {'read': True}:
+                # a follow lands between marking everything read and the count
+                Follow.objects.create(follower=self.fans[1], followed=self.author)
+            return marked
+
+        with mock.patch.object(QuerySet, 'update', mark_then_follow):
+            self.assertEqual(inbox.mark_read(self.author), 1)
+        self.assertEqual(inbox.unread_count(self.author), 1)
+
+    def test_others_notifications_cannot_be_marked_read(self):
+        PostLike.objects.create(post=self.post, user=self.fans[0])
+        self.client.authenticate(self.fans[0])
+        result = self.client.execute(self.mark_read, {'ids': [Notification.objects.get().pk]})
+        self.assertEqual(result.data['markNotificationsRead']['marked'], 0)
+        self.assertFalse(Notification.objects.get().read)
+
+    def test_deleting_the_post_removes_its_notifications(self):
+        PostLike.objects.create(post=self.post, user=self.fans[0])
+        self.post.delete()
+        self.assertEqual(self.inbox(), ([], 0))
+
+    def test_pagination(self):
+        for i in range(5):
+            post = Post.objects.create(title=f'Post {i}', content='...', author=self.author)
+            PostLike.objects.create(post=post, user=self.fans[0])
+        first, _ = self.inbox(first=3)
+        result = self.client.execute(self.query, {'first': 3})
+        cursor = result.data['notifications']['pageInfo']['endCursor']
+        self.assertTrue(result.data['notifications']['pageInfo']['hasNextPage'])
+        rest, _ = self.inbox(first=3, after=cursor)
+        self.assertEqual(len(first) + len(rest), 5)
+        self.assertFalse({n['id'] for n in first} & {n['id'] for n in rest})
+
+    def test_new_activity_does_not_move_notifications_between_pages(self):
+        posts = [Post.objects.create(title=f'Post {i}', content='...', author=self.author) for i in range(3)]
+        for post in posts:
+            PostLike.objects.create(post=post, user=self.fans[0])
+        result = self.client.execute(self.query, {'first': 2})
+        seen = [edge['node']['id'] for edge in result.data['notifications']['edges']]
+        # the oldest, not yet seen, gets a new like while the client pages
+        PostLike.objects.create(post=posts[0], user=self.fans[1])
+        rest, _ = self.inbox(first=2, after=result.data['notifications']['pageInfo']['endCursor'])
+        self.assertEqual([n['message'] for n in rest], ['fan1 and 1 other liked your post'])
+        self.assertNotIn(rest[0]['id'], seen)
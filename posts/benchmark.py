@@ -0,0 +1,299 @@
+"""
+Benchmark harness for the canonical GraphQL operations.
+
+Each operation runs through `schema.execute` (no HTTP, no response cache) as
+a realistic viewer picked from the current data. Mutations run inside a
+transaction that is rolled back, so every iteration sees the same state.
+Results can be saved as a JSON baseline and later runs compared against it.
+
+With `concurrent=True` queries with several root fields are executed the way
+the async view executes them, one root field per pool thread (see
+connect_u_backend/concurrency.py), so the two paths can be compared.
+
+`like_stress` measures sustained like throughput on a few hot posts, with
+and without the write-behind like buffer (posts/like_buffer.py).
+"""
+import json
+import random
+import threading
+import time
+import tracemalloc
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import RequestFactory, override_settings
+
+from connect_u_backend import concurrency
+from connect_u_backend.backend import document_backend
+from connect_u_backend.profiling import RequestProfile
+from connect_u_backend.schema import schema
+from . import like_buffer
+from .models import Post, PostLike
+from .synthetic import synthetic_users
+
+User = get_user_model()
+
+# a slower run only counts as a regression past this many milliseconds,
+# which keeps sub-millisecond noise from failing the comparison
+NOISE_FLOOR_MS = 2.0
+
+FEED = '''
+query Feed { posts(first: 20) { edges { cursor node { id title likeCount commentCount author { email } } } } }
+'''
+TIMELINE = '''
+query Timeline { timeline(first: 20) { edges { cursor node { id title likeCount author { email } } } } }
+'''
+POST_WITH_COMMENTS = '''
+query PostWithComments($postId: ID!) {
+  post(id: $postId) { id title content likeCount commentCount author { email } }
+  commentThread(postId: $postId, first: 20) {
+    edges { node { comment { id content likeCount author { email } } hasMoreReplies
+      replies { comment { id content author { email } } replies { comment { id content } } } } }
+  }
+}
+'''
+FOLLOWS = '''
+query Follows($userId: ID!) {
+  followers(userId: $userId, first: 20) { edges { cursor node { email } } }
+  following(userId: $userId, first: 20) { edges { cursor node { email } } }
+}
+'''
+HOME = '''
+query Home {
+  posts(first: 20) { edges { node { id title likeCount author { email } } } }
+  timeline(first: 20) { edges { node { id title author { email } } } }
+  suggestedUsers(first: 10) { user { email } mutualConnections }
+}
+'''
+LIKE_POST = '''
+mutation LikePost($postId: ID!) { createLikePost(postId: $postId) { success like { id } } }
+'''
+UNLIKE_POST = '''
+mutation UnlikePost($postId: ID!) { unlikePost(postId: $postId) { success } }
+'''
+CREATE_COMMENT = '''
+mutation CreateComment($postId: ID!) { createComment(postId: $postId, content: "Benchmark") { success comment { id } } }
+'''
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class Operation:
+
+    def __init__(self, name, query, variables=None, mutation=False):
+        self.name = name
+        self.query = query
+        self.variables = variables or (lambda fixtures: {})
+        self.mutation = mutation
+
+
+OPERATIONS = [
+    Operation('feed', FEED),
+    Operation('timeline', TIMELINE),
+    Operation('post_with_comments', POST_WITH_COMMENTS, lambda f: {'postId': f['post']}),
+    Operation('follows', FOLLOWS, lambda f: {'userId': f['popular_user']}),
+    Operation('home', HOME),
+    Operation('like_post', LIKE_POST, lambda f: {'postId': f['unliked_post']}, mutation=True),
+    Operation('create_comment', CREATE_COMMENT, lambda f: {'postId': f['post']}, mutation=True),
+]
+
+
+def fixtures():
+    """Pick the viewer and objects the operations run against: the busiest of each."""
+    viewer = User.objects.annotate(n=Count('following')).order_by('-n', 'pk').first()
+    post = Post.objects.order_by('-comment_count', 'pk').first()
+    if viewer is None or post is None:
+        raise BenchmarkError("No data to benchmark; run `manage.py seed_social_graph` first.")
+    popular_user = User.objects.order_by('-profile__follower_count', 'pk').first()
+    liked = PostLike.objects.filter(user=viewer).values('post_id')
+    unliked_post = Post.objects.exclude(pk__in=liked).order_by('-like_count', 'pk').first() or post
+    return {
+        'viewer': viewer,
+        'post': post.pk,
+        'popular_user': popular_user.pk,
+        'unliked_post': unliked_post.pk,
+    }
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(values) - 1, round(fraction * len(values) + 0.5) - 1))
+    return values[index]
+
+
+class Runner:
+
+    def __init__(self, iterations=50, warmup=5, concurrent=False):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.concurrent = concurrent
+        self.fixtures = fixtures()
+        self.request_factory = RequestFactory()
+
+    def execute(self, operation, profile=None):
+        request = self.request_factory.post('/graphql/')
+        request.user = self.fixtures['viewer']
+        variables = operation.variables(self.fixtures)
+
+        def execute():
+            return schema.execute(operation.query, variable_values=variables, context_value=request)
+
+        documents = None
+        if self.concurrent and not operation.mutation:
+            document = document_backend.document_from_string(schema, operation.query)
+            documents = concurrency.root_field_documents(document.document_ast, None)
+        if documents:
+            result = async_to_sync(concurrency.execute_concurrently)(
+                schema, documents, request, profile, variable_values=variables)
+        elif operation.mutation:
+            with transaction.atomic():
+                result = execute()
+                transaction.set_rollback(True)
+        else:
+            result = execute()
+        if result.errors:
+            raise BenchmarkError(f"{operation.name} failed: {result.errors[0]}")
+        return result
+
+    def measure(self, operation):
+        for _ in range(self.warmup):
+            self.execute(operation)
+
+        timings, queries = [], 0
+        for _ in range(self.iterations):
+            # counts queries on this thread and on any pool thread it's handed to
+            with RequestProfile() as profile:
+                started = time.perf_counter()
+                self.execute(operation, profile)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, profile.queries)
+
+        # a separate pass, tracemalloc slows everything it traces
+        tracemalloc.start()
+        try:
+            self.execute(operation)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        timings.sort()
+        return {
+            'p50_ms': round(percentile(timings, 0.50), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'p99_ms': round(percentile(timings, 0.99), 3),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'queries': queries,
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def run(self, names=None):
+        operations = [op for op in OPERATIONS if names is None or op.name in names]
+        return {
+            'iterations': self.iterations,
+            'operations': {op.name: self.measure(op) for op in operations},
+        }
+
+
+def compare(current, baseline, tolerance=0.5):
+    """Return a description of every metric that got worse than the baseline allows."""
+    regressions = []
+    for name, result in current['operations'].items():
+        base = baseline['operations'].get(name)
+        if base is None:
+            continue
+        if result['queries'] > base['queries']:
+            regressions.append(f"{name}: {result['queries']} queries, baseline {base['queries']}")
+        for metric in ('p50_ms', 'p95_ms', 'peak_kb'):
+            allowed = base[metric] * (1 + tolerance)
+            if metric.endswith('_ms'):
+                allowed = max(allowed, base[metric] + NOISE_FLOOR_MS)
+            if result[metric] > allowed:
+                regressions.append(f"{name}: {metric} {result[metric]}, baseline {base[metric]}")
+    return regressions
+
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def like_stress(seconds=10, threads=8, hot_posts=1, buffered=False, seed=0):
+    """
+    Sustained like throughput on the `hot_posts` most liked posts: `threads`
+    clients, each acting as random synthetic users, like a post (or unlike it
+    if they already do) through createLikePost/unlikePost for `seconds`.
+    With `buffered` the like buffer is on and its final flush counts towards
+    the elapsed time. The likes are really written, nothing is rolled back.
+    """
+    users = list(synthetic_users().order_by('pk')[:5000])
+    posts = list(Post.objects.order_by('-like_count', 'pk').values_list('pk', flat=True)[:hot_posts])
+    if not users or not posts:
+        raise BenchmarkError("No data to benchmark; run `manage.py seed_social_graph` first.")
+    request_factory = RequestFactory()
+    timings, errors = [], []
+    lock = threading.Lock()
+
+    def client(index, deadline):
+        rng = random.Random(seed + index)
+        mine = []
+        try:
+            while time.perf_counter() < deadline:
+                request = request_factory.post('/graphql/')
+                request.user = rng.choice(users)
+                variables = {'postId': rng.choice(posts)}
+                started = time.perf_counter()
+                result = schema.execute(LIKE_POST, variable_values=variables, context_value=request)
+                if not result.errors and not result.data['createLikePost']['success']:
+                    result = schema.execute(UNLIKE_POST, variable_values=variables, context_value=request)
+                if result.errors:
+                    # e.g. SQLite refusing a concurrent writer
+                    with lock:
+                        errors.append(str(result.errors[0]))
+                    continue
+                mine.append((time.perf_counter() - started) * 1000)
+        finally:
+            connection.close()
+            with lock:
+                timings.extend(mine)
+
+    options = {**like_buffer.buffer_settings(), 'ENABLED': buffered}
+    with override_settings(LIKE_BUFFER=options):
+        previous, like_buffer._buffer = like_buffer._buffer, None
+        try:
+            started = time.perf_counter()
+            deadline = started + seconds
+            clients = [threading.Thread(target=client, args=(i, deadline)) for i in range(threads)]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+            if buffered:
+                like_buffer.get_buffer().flush()
+            elapsed = time.perf_counter() - started
+        finally:
+            like_buffer._buffer = previous
+
+    timings.sort()
+    consistent = all(
+        post.like_count == post.n
+        for post in Post.objects.filter(pk__in=posts).annotate(n=Count('likes'))
+    )
+    return {
+        'buffered': buffered,
+        'threads': threads,
+        'likes': len(timings),
+        'likes_per_second': round(len(timings) / elapsed, 1),
+        'p50_ms': round(percentile(timings, 0.50), 3) if timings else None,
+        'p95_ms': round(percentile(timings, 0.95), 3) if timings else None,
+        'errors': len(errors),
+        'consistent': consistent,
+    }
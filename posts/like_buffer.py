@@ -0,0 +1,295 @@
+"""
+Write-behind buffering of like and unlike events (opt-in, LIKE_BUFFER).
+
+When a post goes viral, createLikePost turns into a stream of single-row
+INSERTs that all update the same Post row. With the buffer enabled, the
+single like/unlike mutations (createLikePost, unlikePost, createLikeComment,
+unlikeComment) only record the viewer's intent. Events are kept in memory,
+deduplicated per (target, user) so the last one wins, and written by a
+background thread every FLUSH_INTERVAL seconds or as soon as MAX_PENDING
+are waiting. A flush is one transaction: per kind of like, one bulk INSERT
+of the new likes, one DELETE of the removed ones and one recount of the
+like_count of every target touched.
+
+The viewer's own state is answered at once: whether they like a target is
+read from the buffer before the database. Everyone else sees a like once it
+has been flushed.
+
+Crash safety: with JOURNAL_DIR set, every event is appended to this
+process's journal segment before the mutation returns. A flush starts a new
+segment and deletes the old one only after its transaction commits.
+Segments stay flock()ed by the process writing them, and a new buffer
+replays the segments no live process holds, so a crash loses no
+acknowledged event (with FSYNC, not even on power loss). Replaying is
+idempotent because a flush writes the final state of each (target, user),
+not a delta.
+"""
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+
+from connect_u_backend import bulk, cache as response_cache, pubsub
+from . import trending
+from .signals import posts_liked
+from .models import Comment, CommentLike, Post, PostLike, count_of
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+DEFAULTS = {
+    'ENABLED': False,
+    'FLUSH_INTERVAL': 0.5,  # seconds
+    'MAX_PENDING': 1000,
+    'JOURNAL_DIR': None,  # None keeps events in memory only
+    'FSYNC': False,
+}
+
+# the `field` of an event: (like model, target model)
+LIKE_MODELS = {
+    'post': (PostLike, Post),
+    'comment': (CommentLike, Comment),
+}
+
+DELETE_BATCH_SIZE = 500
+
+
+def buffer_settings():
+    return {**DEFAULTS, **getattr(settings, 'LIKE_BUFFER', {})}
+
+
+class Journal:
+    """Append-only segments of buffered events in `directory`; one active segment per process."""
+
+    def __init__(self, directory, fsync=False):
+        self.directory = directory
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self.active = self.open_segment()
+
+    def open_segment(self):
+        path = os.path.join(self.directory, f'likes-{os.getpid()}-{time.time_ns()}.jsonl')
+        segment = open(path, 'a', encoding='utf-8')
+        fcntl.flock(segment, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return segment
+
+    def append(self, event):
+        self.active.write(json.dumps(event) + '\n')
+        self.active.flush()
+        if self.fsync:
+            os.fsync(self.active.fileno())
+
+    def rotate(self):
+        """Start a new segment; return the previous one, still locked, to discard once it is flushed."""
+        previous, self.active = self.active, self.open_segment()
+        return previous
+
+    def claim_orphans(self):
+        """Lock and read the segments no live process holds: [(segment, events)], oldest first."""
+        paths = sorted(glob.glob(os.path.join(self.directory, 'likes-*.jsonl')), key=lambda p: p.rsplit('-', 1)[-1])
+        claimed = []
+        for path in paths:
+            if path == self.active.name:
+                continue
+            try:
+                segment = open(path, 'r+', encoding='utf-8')
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(segment, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                # its owner may have flushed and deleted it while we waited for the lock
+                if os.fstat(segment.fileno()).st_ino != os.stat(path).st_ino:
+                    raise FileNotFoundError(path)
+            except (BlockingIOError, FileNotFoundError):
+                segment.close()
+                continue
+            claimed.append((segment, list(read_events(segment))))
+        return claimed
+
+    @staticmethod
+    def discard(segment):
+        os.unlink(segment.name)
+        segment.close()
+
+
+def read_events(segment):
+    for line in segment:
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # the last line of a segment cut short by a crash
+            continue
+
+
+class LikeBuffer:
+
+    def __init__(self, journal_dir=None, fsync=False, background=True):
+        # background=False leaves flushing to the caller (tests, where rows
+        # aren't visible to other connections until the test transaction ends)
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = {}  # (field, target id, user id) -> liked
+        self.flushing = {}
+        self.segments = []  # journal segments whose events are in `pending`
+        self.journal = Journal(journal_dir, fsync) if journal_dir else None
+        if self.journal:
+            for segment, events in self.journal.claim_orphans():
+                for field, target_id, user_id, liked in events:
+                    self.pending[field, target_id, user_id] = liked
+                self.segments.append(segment)
+        self.wake = threading.Event()
+        if background:
+            threading.Thread(target=self.run, name='like-buffer', daemon=True).start()
+            atexit.register(self.flush)
+
+    def record(self, field, target_id, user_id, liked):
+        with self.lock:
+            if self.journal:
+                self.journal.append([field, target_id, user_id, liked])
+            self.pending[field, target_id, user_id] = liked
+            full = len(self.pending) >= buffer_settings()['MAX_PENDING']
+        if full:
+            self.wake.set()
+
+    def state(self, field, target_id, user_id):
+        """Whether the user likes the target as far as the buffer knows, None if it doesn't."""
+        key = (field, target_id, user_id)
+        with self.lock:
+            return self.pending.get(key, self.flushing.get(key))
+
+    def likes(self, field, target_id, user_id):
+        liked = self.state(field, target_id, user_id)
+        if liked is None:
+            like_model, _ = LIKE_MODELS[field]
+            liked = like_model.objects.filter(**{f'{field}_id': target_id, 'user_id': user_id}).exists()
+        return liked
+
+    def run(self):
+        while True:
+            self.wake.wait(buffer_settings()['FLUSH_INTERVAL'])
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing buffered likes failed; they will be retried")
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Write every pending event. Returns how many (target, user) states were written."""
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending and not self.segments:
+                    return 0
+                pending, self.pending = self.pending, {}
+                self.flushing = pending
+                segments, self.segments = self.segments, []
+                if self.journal:
+                    segments.append(self.journal.rotate())
+            try:
+                if pending:
+                    write(pending)
+            except Exception:
+                with self.lock:
+                    # events recorded since are newer and win
+                    self.pending = {**pending, **self.pending}
+                    self.segments = segments + self.segments
+                raise
+            finally:
+                with self.lock:
+                    self.flushing = {}
+            for segment in segments:
+                Journal.discard(segment)
+            return len(pending)
+
+
+def write(pending):
+    """Apply the final like state of each (field, target id, user id) in one transaction."""
+    by_field = defaultdict(lambda: ([], []))
+    for (field, target_id, user_id), liked in pending.items():
+        by_field[field][0 if liked else 1].append((target_id, user_id))
+
+    with transaction.atomic():
+        for field, (likes, unlikes) in by_field.items():
+            like_model, target = LIKE_MODELS[field]
+            new = []
+            if likes:
+                # targets or users deleted since the event was accepted are dropped
+                targets = set(target.objects.filter(pk__in={t for t, _ in likes}).values_list('pk', flat=True))
+                users = set(User.objects.filter(pk__in={u for _, u in likes}).values_list('pk', flat=True))
+                existing = set(
+                    like_model.objects.filter(**{f'{field}_id__in': targets, 'user_id__in': users})
+                    .values_list(f'{field}_id', 'user_id')
+                )
+                # likes a concurrent toggle inserted first are skipped and not announced
+                new = bulk.insert_new(
+                    [like_model(user_id=u, **{f'{field}_id': t})
+                     for t, u in likes if t in targets and u in users and (t, u) not in existing],
+                    returning=[field, 'user'],
+                )
+            for start in range(0, len(unlikes), DELETE_BATCH_SIZE):
+                batch = unlikes[start:start + DELETE_BATCH_SIZE]
+                like_model.objects.filter(reduce(or_, (Q(**{f'{field}_id': t, 'user_id': u}) for t, u in batch))).delete()
+
+            touched = {t for t, _ in likes} | {t for t, _ in unlikes}
+            # one recount per target, however many likes it got
+            target.objects.filter(pk__in=touched).update(like_count=count_of(like_model, field))
+            for t, u in new:
+                pubsub.publish(f'{target._meta.model_name}_liked:{t}', **{f'{field}_id': t, 'user_id': u})
+            trending.record_likes(target, [t for t, _ in new])
+            if like_model is PostLike:
+                for user_id in {u for _, u in new}:
+                    posts_liked.send(sender=PostLike, post_ids=[t for t, u in new if u == user_id], user_id=user_id)
+    # bulk writes send no post_save/post_delete; invalidate like the signals would
+    tags = {model._meta.model_name for field in by_field for model in LIKE_MODELS[field]}
+    transaction.on_commit(lambda: response_cache.invalidate(*tags))
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def enabled():
+    return buffer_settings()['ENABLED']
+
+
+def get_buffer():
+    global _buffer
+    with _buffer_lock:
+        # a forked worker must not share its parent's buffer, thread or journal
+        if _buffer is None or _buffer.pid != os.getpid():
+            options = buffer_settings()
+            _buffer = LikeBuffer(options['JOURNAL_DIR'], options['FSYNC'])
+        return _buffer
+
+
+def like(field, target_id, user_id):
+    """Buffer a like of the `field` target; False if the user already likes it."""
+    buffer = get_buffer()
+    if buffer.likes(field, target_id, user_id):
+        return False
+    buffer.record(field, target_id, user_id, True)
+    return True
+
+
+def unlike(field, target_id, user_id):
+    """Buffer the removal of a like; False if the user doesn't like the target."""
+    buffer = get_buffer()
+    if not buffer.likes(field, target_id, user_id):
+        return False
+    buffer.record(field, target_id, user_id, False)
+    return True
@@ -0,0 +1,72 @@
+"""
+Race-free like toggling.
+
+A toggle is at most three statements in one transaction: a DELETE of the
+viewer's like, an INSERT ... ON CONFLICT DO NOTHING when there was nothing
+to delete, and an UPDATE ... RETURNING of the parent's like_count. Each
+statement reports whether it changed a row, so concurrent toggles can never
+raise IntegrityError on unique (target, user) or count a like twice. A toggle
+that loses a race with another toggle of the same like reports the state the
+winner left behind. (PostgreSQL, and SQLite 3.35+, support both clauses.)
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from connect_u_backend import cache as response_cache, pubsub
+from . import trending
+from .signals import posts_liked
+
+
+def toggle_like(like_model, field, target_id, user_id):
+    """
+    Like or unlike the `field` target of `like_model` (e.g. PostLike, 'post')
+    for `user_id`. Returns (liked, like_count), or None if the target doesn't exist.
+    """
+    target_model = like_model._meta.get_field(field).related_model
+    likes = like_model._meta.db_table
+    target_column = like_model._meta.get_field(field).column
+    user_column = like_model._meta.get_field('user').column
+    targets = target_model._meta.db_table
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {likes} WHERE {target_column} = %s AND {user_column} = %s',
+            [target_id, user_id],
+        )
+        if cursor.rowcount:
+            liked, delta = False, -1
+        else:
+            # the EXISTS guard turns a missing target into "nothing inserted"
+            # instead of a deferred foreign key error at commit
+            cursor.execute(
+                f'INSERT INTO {likes} ({target_column}, {user_column}, created_at) '
+                f'SELECT %s, %s, %s WHERE EXISTS (SELECT 1 FROM {targets} WHERE id = %s) '
+                f'ON CONFLICT ({target_column}, {user_column}) DO NOTHING',
+                [target_id, user_id, connection.ops.adapt_datetimefield_value(timezone.now()), target_id],
+            )
+            liked, delta = True, 1 if cursor.rowcount else 0
+            if delta:
+                pubsub.publish(f'{target_model._meta.model_name}_liked:{target_id}', **{f'{field}_id': target_id, 'user_id': user_id})
+                trending.record_likes(target_model, [target_id])
+                if field == 'post':
+                    posts_liked.send(sender=like_model, post_ids=[target_id], user_id=user_id)
+
+        row = None
+        if delta:
+            cursor.execute(
+                f'UPDATE {targets} SET like_count = like_count + %s '
+                f'WHERE id = %s AND like_count + %s >= 0 RETURNING like_count',
+                [delta, target_id, delta],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            # nothing changed, or a drifted counter is already at zero
+            cursor.execute(f'SELECT like_count FROM {targets} WHERE id = %s', [target_id])
+            row = cursor.fetchone()
+
+    if row is None:
+        return None
+    if delta:
+        # raw SQL sends no post_save/post_delete; invalidate like the signals would
+        transaction.on_commit(lambda: response_cache.invalidate(like_model._meta.model_name, target_model._meta.model_name))
+    return liked, row[0]
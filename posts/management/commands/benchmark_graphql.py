@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = "Benchmark the canonical GraphQL operations; optionally save or compare against a JSON baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--operation', action='append', dest='operations',
+                            choices=[op.name for op in benchmark.OPERATIONS], help="Run only these (repeatable).")
+        parser.add_argument('--concurrent', action='store_true',
+                            help="Resolve the root fields of each query concurrently, like the async view.")
+        parser.add_argument('--save', metavar='PATH', help="Write the results as a baseline.")
+        parser.add_argument('--compare', metavar='PATH', help="Fail if worse than this baseline.")
+        parser.add_argument('--tolerance', type=float, default=0.5, help="Allowed slowdown, 0.5 = 50%%.")
+
+    def handle(self, *args, **options):
+        try:
+            results = benchmark.Runner(
+                options['iterations'], options['warmup'], options['concurrent']).run(options['operations'])
+        except benchmark.BenchmarkError as e:
+            raise CommandError(e)
+
+        self.stdout.write(f"{'operation':<20} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'peak KB':>9}")
+        for name, r in results['operations'].items():
+            self.stdout.write(
+                f"{name:<20} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} {r['queries']:>8} {r['peak_kb']:>9}")
+
+        if options['save']:
+            benchmark.save(results, options['save'])
+            self.stdout.write(self.style.SUCCESS(f"Saved baseline to {options['save']}."))
+
+        if options['compare']:
+            regressions = benchmark.compare(results, benchmark.load(options['compare']), options['tolerance'])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
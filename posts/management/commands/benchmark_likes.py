@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Stress the like mutations on the most liked posts, directly and through the write-behind "
+        "like buffer, and report sustained likes per second. Writes real likes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--hot-posts', type=int, default=1, help="How many posts the likes go to.")
+        parser.add_argument('--mode', choices=['direct', 'buffered', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        modes = {'direct': [False], 'buffered': [True], 'both': [False, True]}[options['mode']]
+        self.stdout.write(f"{'mode':<10} {'likes':>8} {'likes/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7} {'consistent':>11}")
+        for buffered in modes:
+            try:
+                r = benchmark.like_stress(options['seconds'], options['threads'], options['hot_posts'], buffered)
+            except benchmark.BenchmarkError as e:
+                raise CommandError(e)
+            mode = 'buffered' if buffered else 'direct'
+            self.stdout.write(
+                f"{mode:<10} {r['likes']:>8} {r['likes_per_second']:>10} {r['p50_ms']!s:>9} {r['p95_ms']!s:>9} "
+                f"{r['errors']:>7} {r['consistent']!s:>11}")
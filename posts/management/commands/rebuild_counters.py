@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import Post, Comment, PostLike, CommentLike, count_of
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized like/comment counters on posts and comments."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            posts = Post.objects.update(
+                comment_count=count_of(Comment, 'post'),
+                like_count=count_of(PostLike, 'post'),
+            )
+            comments = Comment.objects.update(like_count=count_of(CommentLike, 'comment'))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt counters for {posts} posts and {comments} comments."))
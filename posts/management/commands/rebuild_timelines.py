@@ -0,0 +1,18 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.models import TimelineEntry
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Rematerialize every home timeline from the follow graph (latest posts per followed account)."
+
+    def handle(self, *args, **options):
+        # one user at a time, each atomically: no timeline is ever empty or
+        # half built, even if the rebuild stops midway
+        for user_id in User.objects.values_list('pk', flat=True).iterator():
+            timeline.rebuild(user_id)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {TimelineEntry.objects.count()} timeline entries."))
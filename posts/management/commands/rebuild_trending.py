@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = "Recompute the trending post scores of every window from recent likes and comments."
+
+    def handle(self, *args, **options):
+        ranked = trending.rebuild()
+        summary = ", ".join(f"{count} posts in {window}" for window, count in ranked.items())
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt trending scores: {summary}."))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.synthetic import SyntheticGraph, synthetic_users
+
+
+class Command(BaseCommand):
+    help = "Generate a reproducible synthetic social graph (users, power-law follows, posts, comment threads, likes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--follows', type=int, default=30, help="Average accounts followed per user.")
+        parser.add_argument('--posts', type=int, default=5, help="Average posts per user.")
+        parser.add_argument('--comments', type=int, default=3, help="Average top-level comments per post.")
+        parser.add_argument('--likes', type=int, default=10, help="Average likes per post.")
+        parser.add_argument('--reply-depth', type=int, default=3)
+        parser.add_argument('--exponent', type=float, default=1.1, help="Power-law exponent of account popularity.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--flush', action='store_true', help="Delete a previously generated graph first.")
+
+    def handle(self, *args, **options):
+        existing = synthetic_users()
+        if existing.exists():
+            if not options['flush']:
+                raise CommandError("A synthetic graph already exists; pass --flush to replace it.")
+            existing.delete()
+
+        counts = SyntheticGraph(
+            users=options['users'],
+            follows=options['follows'],
+            posts=options['posts'],
+            comments=options['comments'],
+            likes=options['likes'],
+            reply_depth=options['reply_depth'],
+            exponent=options['exponent'],
+            seed=options['seed'],
+        ).generate()
+        summary = ", ".join(f"{n} {kind.replace('_', ' ')}" for kind, n in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Created {summary}."))
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:20
+
+from django.db import migrations
+
+# Generated tsvector columns and their GIN indexes, PostgreSQL only: other
+# databases search through the in-process index in connect_u_backend.search.
+FORWARDS = [
+    """
+    ALTER TABLE posts_post ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(content, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX post_search_vector_idx ON posts_post USING gin (search_vector)",
+    """
+    ALTER TABLE posts_comment ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(content, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX comment_search_vector_idx ON posts_comment USING gin (search_vector)",
+]
+
+BACKWARDS = [
+    "ALTER TABLE posts_comment DROP COLUMN search_vector",
+    "ALTER TABLE posts_post DROP COLUMN search_vector",
+]
+
+
+def run_on_postgres(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_comment_parent_path'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_postgres(FORWARDS), run_on_postgres(BACKWARDS)),
+    ]
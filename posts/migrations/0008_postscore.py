@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_search_vectors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(max_length=16)),
+                ('score', models.FloatField()),
+                ('last_activity', models.DateTimeField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='posts.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['window', '-score'], name='postscore_window_score_idx')],
+                'unique_together': {('post', 'window')},
+            },
+        ),
+    ]
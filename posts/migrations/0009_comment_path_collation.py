@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:05
+
+from django.db import migrations
+
+# Comment paths are compared and ordered byte by byte (subtree ranges, thread
+# cursors, the path__startswith of deleteComment). SQLite's default BINARY
+# collation already does that; PostgreSQL's locale collations skip the '/'
+# separators, so the column is given the "C" collation there. Changing the
+# column's collation rebuilds comment_post_path_idx with it.
+FORWARDS = ['ALTER TABLE posts_comment ALTER COLUMN path TYPE varchar(704) COLLATE "C"']
+
+BACKWARDS = ['ALTER TABLE posts_comment ALTER COLUMN path TYPE varchar(704) COLLATE "default"']
+
+
+def run_on_postgres(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_postscore'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_postgres(FORWARDS), run_on_postgres(BACKWARDS)),
+    ]
@@ -1,32 +1,83 @@
 from django.db import models
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+PATH_SEGMENT_LENGTH = 11  # ten digit id plus separator
+MAX_THREAD_DEPTH = 64
+
 # Create your models here.
 
 
+def adjust_counter(model, pk, field, delta):
+    """UPDATE ... SET field = field + delta, never letting the counter drop below zero."""
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def count_of(model, fk, outer='pk'):
+    """Correlated COUNT(*) of `model` rows pointing at the outer row's `outer` through `fk`."""
+    counts = model.objects.filter(**{fk: OuterRef(outer)}).order_by().values(fk).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
 class Post(models.Model):
     title = models.CharField(max_length=255)
     author = models.ForeignKey(User, related_name='posts', on_delete=models.CASCADE)
     content = models.TextField()
     media_url = models.URLField(blank=True, null=True)
+    comment_count = models.PositiveIntegerField(default=0)  # denormalized, see adjust_counter
+    like_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # keyset pagination of the feed
+            models.Index(fields=['created_at', 'id'], name='post_created_id_idx'),
+            # an author's latest posts (timeline backfill and fan-out-on-read)
+            models.Index(fields=['author', 'created_at', 'id'], name='post_author_created_idx'),
+        ]
+
     def __str__(self):
         return self.title
     
 class Comment(models.Model):
     post = models.ForeignKey(Post, related_name='comments', on_delete=models.CASCADE)
     author = models.ForeignKey(User, related_name='comments', on_delete=models.CASCADE)
+    parent = models.ForeignKey('self', related_name='replies', null=True, blank=True, on_delete=models.CASCADE)
+    # materialized path: zero padded ids of every ancestor and the comment itself,
+    # e.g. "0000000012/0000000031/", so a subtree is one indexed range scan;
+    # compared byte by byte, hence the "C" collation on PostgreSQL (migration 0009)
+    path = models.CharField(max_length=PATH_SEGMENT_LENGTH * MAX_THREAD_DEPTH, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
     content = models.TextField()
+    like_count = models.PositiveIntegerField(default=0)  # denormalized, see adjust_counter
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ]
+
     def __str__(self):
         return f'Comment by {self.author.username} on {self.post.title}'
 
+    def save(self, *args, **kwargs):
+        if self.parent_id and self._state.adding:
+            self.depth = self.parent.depth + 1
+        super().save(*args, **kwargs)
+        # the path ends with our own id, which only exists once the row is inserted
+        if not self.path:
+            parent_path = self.parent.path if self.parent_id else ''
+            self.path = f'{parent_path}{self.pk:0{PATH_SEGMENT_LENGTH - 1}d}/'
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
+
 class PostLike(models.Model):
     post = models.ForeignKey(Post, related_name='likes', on_delete=models.CASCADE)
     user = models.ForeignKey(User, related_name='likes', on_delete=models.CASCADE)
@@ -49,6 +100,43 @@ class CommentLike(models.Model):
     def __str__(self):
         return f'Like by {self.user.username} on comment {self.comment.id}'
 
+
+class TimelineEntry(models.Model):
+    """A post materialized into a follower's home timeline (fan-out-on-write)."""
+    user = models.ForeignKey(User, related_name='timeline_entries', on_delete=models.CASCADE)
+    post = models.ForeignKey(Post, related_name='timeline_entries', on_delete=models.CASCADE)
+    author = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    created_at = models.DateTimeField()  # copied from the post so pages never join it
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'post'], name='timeline_user_created_idx'),
+            models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.post.title} in the timeline of {self.user.email}'
+
+
+class PostScore(models.Model):
+    """A post's time-decayed engagement in one trending window (see posts.trending)."""
+    post = models.ForeignKey(Post, related_name='scores', on_delete=models.CASCADE)
+    window = models.CharField(max_length=16)
+    # log2 of the decayed engagement, relative to trending.LANDMARK; only
+    # comparable within a window
+    score = models.FloatField()
+    last_activity = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('post', 'window')
+        indexes = [
+            models.Index(fields=['window', '-score'], name='postscore_window_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.post.title} ({self.window}): {self.score:.2f}'
+
   
 # class Share(models.Model): ##### Future implementation ######
 #     post = models.ForeignKey(Post, related_name='shares', on_delete=models.CASCADE)
@@ -1,43 +1,82 @@
 import graphene
 from graphene_django import DjangoObjectType
 from django.contrib.auth import get_user_model
-from .models import Post, Comment, PostLike, CommentLike
+from .models import Post, Comment, PostLike, CommentLike, MAX_THREAD_DEPTH, adjust_counter, count_of
 from graphql_jwt.decorators import login_required
-from django.db.models import Count
+from django.db import transaction
+from connect_u_backend import bulk, cache as response_cache, pubsub
+from connect_u_backend.loaders import related_resolver, windowed_resolver
+from connect_u_backend.pagination import build_connection, page_size, paginate
+from connect_u_backend.projection import project
+from . import like_buffer, search, threads, timeline, trending
+from .likes import toggle_like
+from .signals import posts_liked
+from users.schema import UserType
 
 User = get_user_model()
 
 class PostType(DjangoObjectType):
-    comment_count = graphene.Int()
-    like_count = graphene.Int()
     class Meta:
         model = Post
         fields = '__all__'
 
-    def resolve_comment_count(self, info):
-        return getattr(self, 'comment_count', self.comments.count())  
-    
-    def resolve_like_count(self, info):
-        return getattr(self, 'like_count', self.likes.count())
+    # a post may have any number of these; each post lists only its newest `first`
+    comments = graphene.List(graphene.NonNull(lambda: CommentType), required=True, first=graphene.Int())
+    likes = graphene.List(graphene.NonNull(lambda: PostLikeType), required=True, first=graphene.Int())
+
+    resolve_author = related_resolver('author')
+    resolve_comments = windowed_resolver('comments', ('-created_at', '-pk'))
+    resolve_likes = windowed_resolver('likes', ('-created_at', '-pk'))
+
+class PostConnection(graphene.relay.Connection):
+    class Meta:
+        node = PostType
+
 class CommentType(DjangoObjectType):
-    like_count = graphene.Int()
     class Meta:
         model = Comment
         fields = '__all__'
 
-    def resolve_like_count(self, info):
-        return getattr(self, 'like_count', self.likes.count())
+    resolve_post = related_resolver('post')
+    resolve_author = related_resolver('author')
+    resolve_parent = related_resolver('parent')
+    resolve_replies = related_resolver('replies')
+    resolve_likes = related_resolver('likes')
+
+class CommentThreadType(graphene.ObjectType):
+    comment = graphene.Field(CommentType)
+    replies = graphene.List(lambda: CommentThreadType)
+    has_more_replies = graphene.Boolean()
+    # pass as `after` together with `parentId` to page through the rest of the replies
+    replies_cursor = graphene.String()
+
+class CommentThreadConnection(graphene.relay.Connection):
+    class Meta:
+        node = CommentThreadType
+
+class TrendingPostType(graphene.ObjectType):
+    post = graphene.Field(PostType)
+    # time-decayed engagement: weighted likes and comments, each halving every half-life
+    score = graphene.Float()
+
+TrendingWindow = graphene.Enum('TrendingWindow', [(name.upper(), name) for name in trending.trending_settings()['WINDOWS']])
 
 class PostLikeType(DjangoObjectType):
     class Meta:
         model = PostLike
         fields = '__all__'
 
+    resolve_post = related_resolver('post')
+    resolve_user = related_resolver('user')
+
 class CommentLikeType(DjangoObjectType):
     class Meta:
         model = CommentLike
         fields = '__all__'
 
+    resolve_comment = related_resolver('comment')
+    resolve_user = related_resolver('user')
+
 
 # class ShareType(DjangoObjectType):  ##### Future implementation ######
 #     class Meta:
@@ -45,9 +84,21 @@ class CommentLikeType(DjangoObjectType):
 #         fields = '__all__'
 
 class Query(graphene.ObjectType):
-    posts = graphene.List(PostType)
+    posts = graphene.Field(PostConnection, first=graphene.Int(), after=graphene.String())
+    timeline = graphene.Field(PostConnection, first=graphene.Int(), after=graphene.String())
+    search_posts = graphene.Field(PostConnection, query=graphene.String(required=True), first=graphene.Int(), after=graphene.String())
     post = graphene.Field(PostType, id=graphene.ID(required=True))
+    trending_posts = graphene.List(TrendingPostType, window=TrendingWindow(default_value='day'), first=graphene.Int())
     comments = graphene.List(CommentType, post_id=graphene.ID(required=True))
+    comment_thread = graphene.Field(
+        CommentThreadConnection,
+        post_id=graphene.ID(required=True),
+        parent_id=graphene.ID(),
+        first=graphene.Int(),
+        after=graphene.String(),
+        depth=graphene.Int(),
+        replies_first=graphene.Int(),
+    )
     comments_count = graphene.Int(post_id=graphene.ID(required=True))
     likes_post = graphene.List(PostLikeType, post_id=graphene.ID(required=True))
     like_count = graphene.Int(post_id=graphene.ID(required=True))
@@ -56,21 +107,51 @@ class Query(graphene.ObjectType):
     # shares = graphene.List(ShareType, post_id=graphene.ID(required=True)) ##### Future implementation ######
 
 
-    # get all posts
+    # get a page of posts, newest first, loading only what the query selects
+    @login_required
+    def resolve_posts(self, info, first=None, after=None):
+        queryset = project(Post.objects.all(), info, 'edges', 'node', extra=('created_at',))
+        return paginate(queryset, PostConnection, first=first, after=after)
+
+    # get a page of posts matching a search, best match first
+    @login_required
+    def resolve_search_posts(self, info, query, first=None, after=None):
+        return search.search_posts(query, PostConnection, first=first, after=after)
+
+    # get a page of posts from the viewer and the accounts they follow, newest first
+    @login_required
+    def resolve_timeline(self, info, first=None, after=None):
+        return timeline.get_timeline(info.context.user, PostConnection, first=first, after=after)
+
+    # posts with the most time-decayed engagement in `window`, read from the score table
     @login_required
-    def resolve_posts(self, info, **kwargs):
-        return Post.objects.annotate(
-            comment_count=Count('comments', distinct=True), 
-            like_count=Count('likes', distinct=True),
-            ).select_related('author').prefetch_related('comments__author', 'likes__user')
+    def resolve_trending_posts(self, info, window='day', first=None):
+        return [TrendingPostType(post=post, score=score) for post, score in trending.trending_posts(window, page_size(first))]
 
     # get a single post
     @login_required
     def resolve_post(self, info, id):
-        return Post.objects.annotate(
-            comment_count=Count('comments', distinct=True), 
-            like_count=Count('likes', distinct=True),
-            ).select_related('author').prefetch_related('comments__author', 'likes__user').get(pk=id)   
+        return project(Post.objects.all(), info).get(pk=id)
+
+    # get a page of comments with their replies nested `depth` levels deep
+    @login_required
+    def resolve_comment_thread(self, info, post_id, parent_id=None, first=None, after=None, depth=None, replies_first=None):
+        nodes, has_next_page = threads.get_thread(post_id, parent_id, first, after, depth, replies_first)
+        items = [(node, threads.encode_path_cursor(node.comment.path)) for node in nodes]
+        return build_connection(CommentThreadConnection, items, has_next_page, after)
+
+    # counters are denormalized onto the rows, so these are single column reads
+    @login_required
+    def resolve_comments_count(self, info, post_id):
+        return Post.objects.filter(pk=post_id).values_list('comment_count', flat=True).first()
+
+    @login_required
+    def resolve_like_count(self, info, post_id):
+        return Post.objects.filter(pk=post_id).values_list('like_count', flat=True).first()
+
+    @login_required
+    def resolve_like_count_comment(self, info, comment_id):
+        return Comment.objects.filter(pk=comment_id).values_list('like_count', flat=True).first()
 
     
 class CreatePost(graphene.Mutation):
@@ -88,7 +169,9 @@ class CreatePost(graphene.Mutation):
     def mutate(self, info, title, content, media_url=None):
         user = info.context.user
         post = Post(title=title, content=content, author=user, media_url=media_url)
-        post.save()
+        with transaction.atomic():
+            post.save()
+            timeline.fan_out(post)
         return CreatePost(post=post, success=True, message="Post created successfully.")
     
 class DeletePost(graphene.Mutation):
@@ -152,7 +235,9 @@ class CreateComment(graphene.Mutation):
         user = info.context.user
         post = Post.objects.get(pk=post_id)
         comment = Comment(post=post, author=user, content=content)
-        comment.save()
+        with transaction.atomic():
+            comment.save()
+            adjust_counter(Post, post.pk, 'comment_count', 1)
         return CreateComment(comment=comment, success=True, message="Comment added successfully.")
     
 class DeleteComment(graphene.Mutation):
@@ -167,7 +252,11 @@ class DeleteComment(graphene.Mutation):
         user = info.context.user
         try:
             comment = Comment.objects.get(pk=comment_id, author=user)
-            comment.delete()
+            with transaction.atomic():
+                # replies are deleted along with the comment
+                removed = Comment.objects.filter(post_id=comment.post_id, path__startswith=comment.path).count()
+                comment.delete()
+                adjust_counter(Post, comment.post_id, 'comment_count', -removed)
             return DeleteComment(success=True, message="Comment deleted successfully.")
         except Comment.DoesNotExist:
             return DeleteComment(success=False, message="Comment not found or you do not have permission to delete it.")
@@ -207,8 +296,12 @@ class CreateCommentComment(graphene.Mutation):
     def mutate(self, info, parent_comment_id, content):
         user = info.context.user
         parent_comment = Comment.objects.get(pk=parent_comment_id)
-        comment = Comment(post=parent_comment.post, author=user, content=content)
-        comment.save()
+        if parent_comment.depth + 1 >= MAX_THREAD_DEPTH:
+            return CreateCommentComment(success=False, message="This thread is too deep to reply to.")
+        comment = Comment(post_id=parent_comment.post_id, parent=parent_comment, author=user, content=content)
+        with transaction.atomic():
+            comment.save()
+            adjust_counter(Post, parent_comment.post_id, 'comment_count', 1)
         return CreateCommentComment(comment=comment, success=True, message="Comment added successfully.")
     
 class CreateLikePost(graphene.Mutation):
@@ -224,7 +317,15 @@ class CreateLikePost(graphene.Mutation):
     def mutate(self, info, post_id):
         user = info.context.user
         post = Post.objects.get(pk=post_id)
-        like, created = PostLike.objects.get_or_create(post=post, user=user)
+        if like_buffer.enabled():
+            # written behind (see like_buffer.py), so there is no like row to return yet
+            if not like_buffer.like('post', post.pk, user.pk):
+                return CreateLikePost(success=False, message="You have already liked this post.")
+            return CreateLikePost(success=True, message="Post liked successfully.")
+        with transaction.atomic():
+            like, created = PostLike.objects.get_or_create(post=post, user=user)
+            if created:
+                adjust_counter(Post, post.pk, 'like_count', 1)
         if not created:
             return CreateLikePost(success=False, message="You have already liked this post.")
         
@@ -240,9 +341,16 @@ class UnlikePost(graphene.Mutation):
     @login_required
     def mutate(self, info, post_id):
         user = info.context.user
+        if like_buffer.enabled():
+            pk = bulk.to_int(post_id)
+            if pk is None or not like_buffer.unlike('post', pk, user.pk):
+                return UnlikePost(success=False, message="You have not liked this post.")
+            return UnlikePost(success=True, message="Post unliked successfully.")
         try:
             like = PostLike.objects.get(post__id=post_id, user=user)
-            like.delete()
+            with transaction.atomic():
+                like.delete()
+                adjust_counter(Post, like.post_id, 'like_count', -1)
             return UnlikePost(success=True, message="Post unliked successfully.")
         except PostLike.DoesNotExist:
             return UnlikePost(success=False, message="You have not liked this post.")
@@ -260,7 +368,14 @@ class CreateLikeComment(graphene.Mutation):
     def mutate(self, info, comment_id):
         user = info.context.user
         comment = Comment.objects.get(pk=comment_id)
-        like, created = CommentLike.objects.get_or_create(comment=comment, user=user)
+        if like_buffer.enabled():
+            if not like_buffer.like('comment', comment.pk, user.pk):
+                return CreateLikeComment(success=False, message="You have already liked this comment.")
+            return CreateLikeComment(success=True, message="Comment liked successfully.")
+        with transaction.atomic():
+            like, created = CommentLike.objects.get_or_create(comment=comment, user=user)
+            if created:
+                adjust_counter(Comment, comment.pk, 'like_count', 1)
         if not created:
             return CreateLikeComment(success=False, message="You have already liked this comment.")
         
@@ -276,15 +391,177 @@ class UnlikeComment(graphene.Mutation):
     @login_required
     def mutate(self, info, comment_id):
         user = info.context.user
+        if like_buffer.enabled():
+            pk = bulk.to_int(comment_id)
+            if pk is None or not like_buffer.unlike('comment', pk, user.pk):
+                return UnlikeComment(success=False, message="You have not liked this comment.")
+            return UnlikeComment(success=True, message="Comment unliked successfully.")
         try:
             like = CommentLike.objects.get(comment__id=comment_id, user=user)
-            like.delete()
+            with transaction.atomic():
+                like.delete()
+                adjust_counter(Comment, like.comment_id, 'like_count', -1)
             return UnlikeComment(success=True, message="Comment unliked successfully.")
         except CommentLike.DoesNotExist:
             return UnlikeComment(success=False, message="You have not liked this comment.")
         
         
     
+class TogglePostLike(graphene.Mutation):
+    class Arguments:
+        post_id = graphene.ID(required=True)
+
+    success = graphene.Boolean()
+    message = graphene.String()
+    liked = graphene.Boolean()
+    like_count = graphene.Int()
+
+    @login_required
+    def mutate(self, info, post_id):
+        pk = bulk.to_int(post_id)
+        state = toggle_like(PostLike, 'post', pk, info.context.user.pk) if pk is not None else None
+        if state is None:
+            return TogglePostLike(success=False, message="Post does not exist.")
+        liked, like_count = state
+        message = "Post liked successfully." if liked else "Post unliked successfully."
+        return TogglePostLike(success=True, message=message, liked=liked, like_count=like_count)
+
+class ToggleCommentLike(graphene.Mutation):
+    class Arguments:
+        comment_id = graphene.ID(required=True)
+
+    success = graphene.Boolean()
+    message = graphene.String()
+    liked = graphene.Boolean()
+    like_count = graphene.Int()
+
+    @login_required
+    def mutate(self, info, comment_id):
+        pk = bulk.to_int(comment_id)
+        state = toggle_like(CommentLike, 'comment', pk, info.context.user.pk) if pk is not None else None
+        if state is None:
+            return ToggleCommentLike(success=False, message="Comment does not exist.")
+        liked, like_count = state
+        message = "Comment liked successfully." if liked else "Comment unliked successfully."
+        return ToggleCommentLike(success=True, message=message, liked=liked, like_count=like_count)
+
+def like_many(user, ids, target, like_model, field):
+    """
+    Like every existing, not yet liked `target` in `ids` with a fixed number of
+    queries: one existence check, one lookup of current likes, one insert that
+    returns what it inserted and one counter refresh. Returns {id: (success, message)}.
+    """
+    noun = target._meta.verbose_name
+    pks = bulk.parse_ids(ids)
+    existing = set(target.objects.filter(pk__in=pks).values_list('pk', flat=True))
+    liked = set(
+        like_model.objects.filter(user=user, **{f'{field}_id__in': existing}).values_list(f'{field}_id', flat=True)
+    )
+    new = [pk for pk in pks if pk in existing and pk not in liked]
+    inserted = []
+    if new:
+        with transaction.atomic():
+            # rows a concurrent request inserted first are skipped; only the
+            # ones written here are announced and scored
+            inserted = [pk for pk, in bulk.insert_new(
+                [like_model(user=user, **{f'{field}_id': pk}) for pk in new], returning=[field]
+            )]
+            # recounted rather than incremented: a concurrent like of the same
+            # row is skipped by ignore_conflicts and mustn't be counted twice
+            target.objects.filter(pk__in=new).update(like_count=count_of(like_model, field))
+            if inserted:
+                trending.record_likes(target, inserted)
+                if like_model is PostLike:
+                    posts_liked.send(sender=PostLike, post_ids=inserted, user_id=user.pk)
+                # deferred to the commit, when the likes and counts are visible
+                for pk in inserted:
+                    pubsub.publish(f'{target._meta.model_name}_liked:{pk}', **{f'{field}_id': pk, 'user_id': user.pk})
+        # bulk_create sends no post_save, so invalidate like the signal would
+        transaction.on_commit(lambda: response_cache.invalidate(like_model._meta.model_name, target._meta.model_name))
+
+    inserted = set(inserted)
+
+    def message(pk):
+        if pk not in existing:
+            return False, f"{noun.capitalize()} does not exist."
+        if pk not in inserted:
+            return False, f"You have already liked this {noun}."
+        return True, f"{noun.capitalize()} liked successfully."
+    return {pk: message(pk) for pk in pks}
+
+def unlike_many(user, ids, target, like_model, field):
+    """Remove the user's likes of `ids` with a fixed number of queries. Returns {id: (success, message)}."""
+    noun = target._meta.verbose_name
+    pks = bulk.parse_ids(ids)
+    likes = like_model.objects.filter(user=user, **{f'{field}_id__in': pks})
+    liked = set(likes.values_list(f'{field}_id', flat=True))
+    if liked:
+        with transaction.atomic():
+            likes.delete()
+            target.objects.filter(pk__in=liked).update(like_count=count_of(like_model, field))
+
+    return {
+        pk: (True, f"{noun.capitalize()} unliked successfully.") if pk in liked
+        else (False, f"You have not liked this {noun}.")
+        for pk in pks
+    }
+
+class LikePosts(graphene.Mutation):
+    class Arguments:
+        post_ids = graphene.List(graphene.ID, required=True)
+
+    success = graphene.Boolean()
+    message = graphene.String()
+    results = graphene.List(bulk.BulkItemResult)
+
+    @login_required
+    def mutate(self, info, post_ids):
+        messages = like_many(info.context.user, post_ids, Post, PostLike, 'post')
+        liked = sum(success for success, _ in messages.values())
+        return LikePosts(success=True, message=f"{liked} posts liked.", results=bulk.results(post_ids, messages))
+
+class UnlikePosts(graphene.Mutation):
+    class Arguments:
+        post_ids = graphene.List(graphene.ID, required=True)
+
+    success = graphene.Boolean()
+    message = graphene.String()
+    results = graphene.List(bulk.BulkItemResult)
+
+    @login_required
+    def mutate(self, info, post_ids):
+        messages = unlike_many(info.context.user, post_ids, Post, PostLike, 'post')
+        unliked = sum(success for success, _ in messages.values())
+        return UnlikePosts(success=True, message=f"{unliked} posts unliked.", results=bulk.results(post_ids, messages))
+
+class LikeComments(graphene.Mutation):
+    class Arguments:
+        comment_ids = graphene.List(graphene.ID, required=True)
+
+    success = graphene.Boolean()
+    message = graphene.String()
+    results = graphene.List(bulk.BulkItemResult)
+
+    @login_required
+    def mutate(self, info, comment_ids):
+        messages = like_many(info.context.user, comment_ids, Comment, CommentLike, 'comment')
+        liked = sum(success for success, _ in messages.values())
+        return LikeComments(success=True, message=f"{liked} comments liked.", results=bulk.results(comment_ids, messages))
+
+class UnlikeComments(graphene.Mutation):
+    class Arguments:
+        comment_ids = graphene.List(graphene.ID, required=True)
+
+    success = graphene.Boolean()
+    message = graphene.String()
+    results = graphene.List(bulk.BulkItemResult)
+
+    @login_required
+    def mutate(self, info, comment_ids):
+        messages = unlike_many(info.context.user, comment_ids, Comment, CommentLike, 'comment')
+        unliked = sum(success for success, _ in messages.values())
+        return UnlikeComments(success=True, message=f"{unliked} comments unliked.", results=bulk.results(comment_ids, messages))
+
 # class CreateShare(graphene.Mutation): ##### Future implementation ######
 #     share = graphene.Field(ShareType)
 
@@ -305,6 +582,9 @@ class Mutation(graphene.ObjectType):
     create_post = CreatePost.Field()
     create_like_post = CreateLikePost.Field()
     unlike_post = UnlikePost.Field()
+    like_posts = LikePosts.Field()
+    toggle_post_like = TogglePostLike.Field()
+    unlike_posts = UnlikePosts.Field()
     delete_post = DeletePost.Field()
     update_post = UpdatePost.Field()
 
@@ -314,6 +594,9 @@ class Mutation(graphene.ObjectType):
     delete_comment = DeleteComment.Field()
     create_like_comment = CreateLikeComment.Field()
     unlike_comment = UnlikeComment.Field()
+    like_comments = LikeComments.Field()
+    toggle_comment_like = ToggleCommentLike.Field()
+    unlike_comments = UnlikeComments.Field()
     create_comment_comment = CreateCommentComment.Field()
     
     
@@ -321,3 +604,29 @@ class Mutation(graphene.ObjectType):
 
     # create_share = CreateShare.Field() ##### Future implementation ######
 
+
+class PostLikedType(graphene.ObjectType):
+    post = graphene.Field(PostType)
+    user = graphene.Field(UserType)
+    like_count = graphene.Int()
+
+class Subscription(graphene.ObjectType):
+    comment_added = graphene.Field(CommentType, post_id=graphene.ID(required=True))
+    post_liked = graphene.Field(PostLikedType, post_id=graphene.ID(required=True))
+
+    # new comments and replies on a post
+    @login_required
+    def resolve_comment_added(self, info, post_id):
+        return (
+            pubsub.subscribe(f'comment_added:{post_id}')
+            .map(lambda event: event.load(Comment, 'comment_id', select_related=('author',)))
+            .filter(lambda comment: comment is not None)
+        )
+
+    # likes on a post, with its like count after the like
+    @login_required
+    def resolve_post_liked(self, info, post_id):
+        def payload(event):
+            post = event.load(Post, 'post_id')
+            return PostLikedType(post=post, user=event.load(User, 'user_id'), like_count=post.like_count) if post else None
+        return pubsub.subscribe(f'post_liked:{post_id}').map(payload).filter(lambda liked: liked is not None)
@@ -0,0 +1,72 @@
+"""
+Post search: a post matches on its title (weight A), its content (B) or the
+content of any of its comments (C). See connect_u_backend/search.py.
+"""
+from django.contrib.postgres.search import SearchRank
+from django.db.models import FloatField, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from connect_u_backend import search
+from connect_u_backend.pagination import build_connection
+from .models import Comment, Post
+
+SEARCH_CONFIG = 'english'
+# a post that only matches through a comment ranks below one matching itself
+COMMENT_RANK_WEIGHT = search.WEIGHTS['C']
+
+
+def post_fields(post, comments):
+    return [(post.title, 'A'), (post.content, 'B')] + [(content, 'C') for content in comments]
+
+
+def load_posts():
+    comments = {}
+    for post_id, content in Comment.objects.values_list('post_id', 'content').iterator():
+        comments.setdefault(post_id, []).append(content)
+    for post in Post.objects.only('title', 'content').iterator():
+        yield post.pk, post_fields(post, comments.get(post.pk, ()))
+
+
+def load_post(pk):
+    post = Post.objects.filter(pk=pk).only('title', 'content').first()
+    if post is None:
+        return None
+    return post_fields(post, Comment.objects.filter(post_id=pk).values_list('content', flat=True))
+
+
+post_index = search.InvertedIndex(load_posts, load_post)
+
+
+def search_posts(text, connection_type, first=None, after=None):
+    text = search.clean_query(text)
+    if search.uses_postgres():
+        return search_posts_postgres(text, connection_type, first, after)
+
+    page, has_next_page = search.page_of_ranked(post_index.search(text), first, after)
+    posts = Post.objects.select_related('author').in_bulk([pk for _, pk in page])
+    items = [(posts[pk], search.encode_rank_cursor(score, pk)) for score, pk in page if pk in posts]
+    return build_connection(connection_type, items, has_next_page, after)
+
+
+def search_posts_postgres(text, connection_type, first=None, after=None):
+    query = search.search_query(text, SEARCH_CONFIG)
+    post_vector = search.vector_column(Post._meta.db_table)
+    comment_vector = search.vector_column(Comment._meta.db_table)
+
+    matching_comments = Comment.objects.annotate(document=comment_vector).filter(document=query)
+    comment_rank = (
+        matching_comments.filter(post_id=OuterRef('pk'))
+        .order_by().values('post_id')
+        .annotate(best=Max(SearchRank(comment_vector, query)))
+        .values('best')
+    )
+    posts = (
+        Post.objects.annotate(document=post_vector)
+        .filter(Q(document=query) | Q(pk__in=matching_comments.values('post_id')))
+        .annotate(rank=(
+            SearchRank(post_vector, query)
+            + Value(COMMENT_RANK_WEIGHT) * Coalesce(Subquery(comment_rank, output_field=FloatField()), Value(0.0))
+        ))
+        .select_related('author')
+    )
+    return search.ranked_page(posts, connection_type, first, after)
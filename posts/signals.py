@@ -0,0 +1,105 @@
+from users.models import Follow
+from users.signals import follows_created
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+
+from connect_u_backend import cache as response_cache, pubsub
+from .models import Post, Comment, PostLike, CommentLike
+from . import timeline, trending
+from .search import post_index
+
+# Sent with post_ids and user_id after PostLike rows are written without
+# post_save (togglePostLike, likePosts, the like buffer); receivers do what
+# their post_save receivers would.
+posts_liked = Signal()
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    """Bring the followed account's recent posts into the follower's timeline."""
+    if created:
+        timeline.backfill(instance.follower_id, instance.followed_id)
+
+
+@receiver(follows_created)
+def backfill_timeline_bulk(sender, follower_id, followed_ids, **kwargs):
+    timeline.backfill_many(follower_id, followed_ids)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    """Take an unfollowed account's posts out of the follower's timeline."""
+    timeline.remove(instance.follower_id, instance.followed_id)
+
+
+# Cached GraphQL responses are tagged with the models they read. Counters live
+# on the parent row, so likes and comments also invalidate their parent's tag.
+# Tags are bumped after commit, or a concurrent reader could cache the old
+# rows under the new version.
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_post_responses(sender, **kwargs):
+    transaction.on_commit(lambda: response_cache.invalidate('post'))
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def invalidate_comment_responses(sender, **kwargs):
+    transaction.on_commit(lambda: response_cache.invalidate('comment', 'post'))
+
+
+@receiver([post_save, post_delete], sender=PostLike)
+def invalidate_post_like_responses(sender, **kwargs):
+    transaction.on_commit(lambda: response_cache.invalidate('postlike', 'post'))
+
+
+@receiver([post_save, post_delete], sender=CommentLike)
+def invalidate_comment_like_responses(sender, **kwargs):
+    transaction.on_commit(lambda: response_cache.invalidate('commentlike', 'comment'))
+
+
+# The fallback search index (databases without full-text search) re-reads a
+# post whenever it or one of its comments changes.
+
+@receiver([post_save, post_delete], sender=Post)
+def reindex_post(sender, instance, **kwargs):
+    post_index.refresh(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def reindex_commented_post(sender, instance, **kwargs):
+    post_index.refresh(instance.post_id)
+
+
+# Subscriptions (see connect_u_backend/pubsub.py); delivered after commit.
+
+@receiver(post_save, sender=Comment)
+def publish_comment_added(sender, instance, created, **kwargs):
+    if created:
+        pubsub.publish(f'comment_added:{instance.post_id}', comment_id=instance.pk, post_id=instance.post_id)
+
+
+@receiver(post_save, sender=PostLike)
+def publish_post_liked(sender, instance, created, **kwargs):
+    if created:
+        pubsub.publish(f'post_liked:{instance.post_id}', post_id=instance.post_id, user_id=instance.user_id)
+
+
+# Trending scores (see posts/trending.py); removals are left to rebuild_trending.
+
+@receiver(post_save, sender=Comment)
+def score_comment(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: trending.record('comment', [instance.post_id]))
+
+
+@receiver(post_save, sender=PostLike)
+def score_post_like(sender, instance, created, **kwargs):
+    if created:
+        trending.record_likes(Post, [instance.post_id])
+
+
+@receiver(post_save, sender=CommentLike)
+def score_comment_like(sender, instance, created, **kwargs):
+    if created:
+        trending.record_likes(Comment, [instance.comment_id])
@@ -0,0 +1,168 @@
+"""
+Reproducible synthetic social graph for benchmarks and load tests.
+
+Everything is written with bulk_create, so none of the model signals run;
+the derived data they would maintain (follower and like/comment
+counters, timelines, cached responses) is rebuilt in one pass at the end.
+The same `seed` always produces the same graph.
+"""
+import io
+import random
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+
+from connect_u_backend import cache as response_cache
+from users.importing import bulk_create_users
+from users.models import Follow, Profile
+from .models import Comment, CommentLike, Post, PostLike, PATH_SEGMENT_LENGTH, count_of
+
+User = get_user_model()
+
+EMAIL_DOMAIN = 'synthetic.connectu.dev'
+PASSWORD = 'synthetic-password'
+BATCH_SIZE = 1000
+SPREAD = timedelta(days=30)
+
+
+def synthetic_users():
+    return User.objects.filter(email__endswith='@' + EMAIL_DOMAIN)
+
+
+def zipf_weights(n, exponent):
+    """Cumulative weights of a power law over n ranks, for random.choices."""
+    total, cumulative = 0.0, []
+    for rank in range(1, n + 1):
+        total += rank ** -exponent
+        cumulative.append(total)
+    return cumulative
+
+
+def comment_path(comment, parent_path=''):
+    return f'{parent_path}{comment.pk:0{PATH_SEGMENT_LENGTH - 1}d}/'
+
+
+class SyntheticGraph:
+
+    def __init__(self, users=1000, follows=30, posts=5, comments=3, likes=10,
+                 reply_depth=3, exponent=1.1, seed=0, now=None):
+        self.user_count = users
+        self.follows = follows
+        self.posts = posts
+        self.comments = comments
+        self.likes = likes
+        self.reply_depth = reply_depth
+        self.exponent = exponent
+        self.rng = random.Random(seed)
+        self.now = now or timezone.now()
+
+    def timestamp(self):
+        return self.now - SPREAD * self.rng.random()
+
+    def create_users(self):
+        password = make_password(PASSWORD)
+        return bulk_create_users(
+            [
+                User(email=f'user{i}@{EMAIL_DOMAIN}', username=f'user{i}', password=password)
+                for i in range(self.user_count)
+            ],
+            verified=True,
+            batch_size=BATCH_SIZE,
+        )
+
+    def create_follows(self, users):
+        # popularity follows a power law over a shuffled ranking, out-degree is
+        # drawn around the requested average
+        ranking = [user.pk for user in users]
+        self.rng.shuffle(ranking)
+        weights = zipf_weights(len(ranking), self.exponent)
+        follows = []
+        for user in users:
+            degree = min(len(users) - 1, int(self.rng.expovariate(1 / self.follows)) if self.follows else 0)
+            followed = set(self.rng.choices(ranking, cum_weights=weights, k=degree)) - {user.pk}
+            follows += [Follow(follower_id=user.pk, followed_id=pk) for pk in followed]
+        Follow.objects.bulk_create(follows, batch_size=BATCH_SIZE)
+
+    def create_posts(self, users):
+        posts = [
+            Post(author_id=user.pk, title=f'Post {i} by user {user.pk}', content='Synthetic post.')
+            for user in users
+            for i in range(self.rng.randint(0, 2 * self.posts))
+        ]
+        posts = Post.objects.bulk_create(posts, batch_size=BATCH_SIZE)
+        # auto_now_add stamps every row with the same instant; spread them out
+        for post in posts:
+            post.created_at = self.timestamp()
+        Post.objects.bulk_update(posts, ['created_at'], batch_size=BATCH_SIZE)
+        return posts
+
+    def create_comments(self, users, posts):
+        """Top-level comments, then each level of replies; paths need the ids of the level above."""
+        level = [
+            Comment(post_id=post.pk, author_id=self.rng.choice(users).pk, content='Synthetic comment.', depth=0)
+            for post in posts
+            for _ in range(self.rng.randint(0, 2 * self.comments))
+        ]
+        created, parents = [], {}
+        for depth in range(self.reply_depth + 1):
+            level = Comment.objects.bulk_create(level, batch_size=BATCH_SIZE)
+            for comment in level:
+                comment.path = comment_path(comment, parents.get(comment.parent_id, ''))
+            Comment.objects.bulk_update(level, ['path'], batch_size=BATCH_SIZE)
+            created += level
+
+            parents = {comment.pk: comment.path for comment in level}
+            # each comment gets a reply with a probability that halves every level
+            level = [
+                Comment(post_id=comment.post_id, parent_id=comment.pk, depth=depth + 1,
+                        author_id=self.rng.choice(users).pk, content='Synthetic reply.')
+                for comment in level
+                if self.rng.random() < 0.5 ** (depth + 1)
+            ]
+            if not level:
+                break
+        return created
+
+    def create_likes(self, users, posts, comments):
+        user_ids = [user.pk for user in users]
+        likes = [
+            PostLike(post_id=post.pk, user_id=user_id)
+            for post in posts
+            for user_id in self.rng.sample(user_ids, min(len(user_ids), self.rng.randint(0, 2 * self.likes)))
+        ]
+        PostLike.objects.bulk_create(likes, batch_size=BATCH_SIZE)
+        comment_likes = [
+            CommentLike(comment_id=comment.pk, user_id=user_id)
+            for comment in comments
+            for user_id in self.rng.sample(user_ids, min(len(user_ids), self.rng.randint(0, self.likes // 2)))
+        ]
+        CommentLike.objects.bulk_create(comment_likes, batch_size=BATCH_SIZE)
+        return len(likes), len(comment_likes)
+
+    def rebuild_derived(self):
+        Profile.objects.update(follower_count=count_of(Follow, 'followed', outer='user_id'))
+        call_command('rebuild_counters', stdout=io.StringIO())
+        call_command('rebuild_timelines', stdout=io.StringIO())
+        response_cache.invalidate(User._meta.model_name, 'profile', 'follow', 'post', 'comment', 'postlike', 'commentlike')
+
+    def generate(self):
+        """Create the dataset and return how many rows of each kind were written."""
+        with transaction.atomic():
+            users = self.create_users()
+            self.create_follows(users)
+            posts = self.create_posts(users)
+            comments = self.create_comments(users, posts)
+            likes, comment_likes = self.create_likes(users, posts, comments)
+        self.rebuild_derived()
+        return {
+            'users': len(users),
+            'follows': Follow.objects.filter(follower__in=synthetic_users()).count(),
+            'posts': len(posts),
+            'comments': len(comments),
+            'likes': likes,
+            'comment_likes': comment_likes,
+        }
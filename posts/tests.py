@@ -1,3 +1,1232 @@
-from django.test import TestCase
+import json
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.core.cache import caches
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from graphql_jwt.shortcuts import get_token
+from graphql_jwt.testcases import JSONWebTokenTestCase
+
+from users.models import Follow
+from .models import Post, Comment, PostLike, CommentLike, PostScore, TimelineEntry
+
+User = get_user_model()
 
 # Create your tests here.
+
+
+class PostFeedPaginationTest(JSONWebTokenTestCase):
+    query = '''
+        query Feed($first: Int, $after: String) {
+          posts(first: $first, after: $after) {
+            edges { cursor node { id title } }
+            pageInfo { hasNextPage endCursor }
+          }
+        }
+    '''
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='reader@example.com', password='pass')
+        self.client.authenticate(self.user)
+        self.posts = [
+            Post.objects.create(title=f'Post {i}', content='...', author=self.user)
+            for i in range(5)
+        ]
+
+    def test_pages_walk_the_feed_newest_first(self):
+        result = self.client.execute(self.query, {'first': 2})
+        self.assertIsNone(result.errors)
+        page = result.data['posts']
+        self.assertEqual([e['node']['title'] for e in page['edges']], ['Post 4', 'Post 3'])
+        self.assertTrue(page['pageInfo']['hasNextPage'])
+
+        seen = [e['node']['title'] for e in page['edges']]
+        while page['pageInfo']['hasNextPage']:
+            result = self.client.execute(self.query, {'first': 2, 'after': page['pageInfo']['endCursor']})
+            page = result.data['posts']
+            seen += [e['node']['title'] for e in page['edges']]
+        self.assertEqual(seen, [f'Post {i}' for i in reversed(range(5))])
+
+    def test_page_size_is_capped(self):
+        from connect_u_backend.pagination import MAX_PAGE_SIZE
+        Post.objects.bulk_create(
+            Post(title='bulk', content='...', author=self.user) for _ in range(MAX_PAGE_SIZE + 5)
+        )
+        result = self.client.execute(self.query, {'first': 1000})
+        self.assertEqual(len(result.data['posts']['edges']), MAX_PAGE_SIZE)
+
+    def test_invalid_cursor_is_rejected(self):
+        result = self.client.execute(self.query, {'after': 'not-a-cursor'})
+        self.assertEqual(result.errors[0].message, 'Invalid cursor.')
+
+
+# query counts are compared across requests; keep the cached JWT user lookup out of them
+@override_settings(JWT_USER_CACHE={'ENABLED': False})
+class NestedRelationBatchingTest(JSONWebTokenTestCase):
+    query = '''
+        query Followers($userId: ID!) {
+          followers(userId: $userId, first: 50) {
+            edges { node {
+              profile { bio }
+              following { followed { email } }
+              posts {
+                author { email }
+                likes { user { email } }
+                comments {
+                  post { title }
+                  author { profile { location } }
+                  likes { user { email } comment { content } }
+                }
+              }
+            } }
+          }
+        }
+    '''
+
+    def setUp(self):
+        self.viewer = User.objects.create_user(email='viewer@example.com', password='pass')
+        self.client.authenticate(self.viewer)
+
+    def make_users(self, count):
+        for i in range(count):
+            author = User.objects.create_user(email=f'author{count}-{i}@example.com', password='pass')
+            Follow.objects.create(follower=author, followed=self.viewer)
+            post = Post.objects.create(title=f'Post {i}', content='...', author=author)
+            PostLike.objects.create(post=post, user=self.viewer)
+            for _ in range(2):
+                comment = Comment.objects.create(post=post, author=self.viewer, content='hi')
+                CommentLike.objects.create(comment=comment, user=author)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = self.client.execute(self.query, {'userId': self.viewer.pk})
+        self.assertIsNone(result.errors)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_list_size(self):
+        self.make_users(2)
+        small = self.count_queries()
+        self.make_users(8)
+        self.assertEqual(self.count_queries(), small)
+
+    def test_one_query_per_relation_level(self):
+        self.make_users(3)
+        # auth lookup, one page of followers, then one batched query per relation
+        # level; a post's bounded comments and likes join their own relations
+        self.assertEqual(self.count_queries(), 9)
+
+
+class ProjectionTest(JSONWebTokenTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='projected@example.com', password='pass')
+        self.client.authenticate(self.user)
+        self.post = Post.objects.create(title='Projected', content='a long body', author=self.user)
+        Comment.objects.create(post=self.post, author=self.user, content='hi')
+        PostLike.objects.create(post=self.post, user=self.user)
+
+    def capture(self, query, variables=None):
+        with CaptureQueriesContext(connection) as queries:
+            result = self.client.execute(query, variables)
+        self.assertIsNone(result.errors)
+        # the first query is the viewer's authentication
+        return result.data, [q['sql'] for q in queries][1:]
+
+    def test_only_selected_columns_are_loaded(self):
+        data, queries = self.capture('{ posts { edges { node { id title } } } }')
+        self.assertEqual(data['posts']['edges'][0]['node']['title'], 'Projected')
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"posts_post"."title"', queries[0])
+        self.assertNotIn('"posts_post"."content"', queries[0])
+
+    def test_relations_are_loaded_only_when_selected(self):
+        query = '''
+            query Post($id: ID!) {
+              post(id: $id) {
+                ...Body
+                author { email }
+                comments { content author { email } }
+              }
+            }
+            fragment Body on PostType { content }
+        '''
+        data, queries = self.capture(query, {'id': self.post.pk})
+        self.assertEqual(data['post']['content'], 'a long body')
+        self.assertEqual(data['post']['comments'], [{'content': 'hi', 'author': {'email': 'projected@example.com'}}])
+        # the post joined with its author, then its newest comments joined with theirs; no likes
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('posts_postlike', ' '.join(queries))
+        self.assertNotIn('"users_customuser"."password"', ' '.join(queries))
+
+
+class BoundedRelationTest(JSONWebTokenTestCase):
+    query = '''
+        query Feed($first: Int) {
+          posts(first: 10) { edges { node { title comments(first: $first) { content } likes(first: $first) { user { email } } } } }
+        }
+    '''
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='bounded@example.com', password='pass')
+        self.client.authenticate(self.user)
+        self.quiet = Post.objects.create(title='Quiet', content='...', author=self.user)
+        self.viral = Post.objects.create(title='Viral', content='...', author=self.user)
+        fans = [User.objects.create_user(email=f'fan{i}@example.com', password='pass') for i in range(30)]
+        PostLike.objects.bulk_create(PostLike(post=self.viral, user=fan) for fan in fans)
+        Comment.objects.bulk_create(Comment(post=self.viral, author=fan, content=f'c{i}') for i, fan in enumerate(fans))
+        Comment.objects.create(post=self.quiet, author=self.user, content='only one')
+
+    def test_each_post_lists_its_newest_first_children(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = self.client.execute(self.query, {'first': 5})
+        self.assertIsNone(result.errors)
+        viral, quiet = (edge['node'] for edge in result.data['posts']['edges'])
+        self.assertEqual([c['content'] for c in viral['comments']], ['c29', 'c28', 'c27', 'c26', 'c25'])
+        self.assertEqual(len(viral['likes']), 5)
+        self.assertEqual(quiet['comments'], [{'content': 'only one'}])
+        self.assertEqual(quiet['likes'], [])
+
+        # one windowed query per relation for the whole page, never every row
+        windowed = [q['sql'] for q in queries if 'ROW_NUMBER' in q['sql']]
+        self.assertEqual(len(windowed), 2)
+
+    def test_first_is_clamped_like_a_page(self):
+        from connect_u_backend.pagination import DEFAULT_PAGE_SIZE
+        result = self.client.execute(self.query)
+        viral = result.data['posts']['edges'][0]['node']
+        self.assertEqual(len(viral['comments']), DEFAULT_PAGE_SIZE)
+        result = self.client.execute(self.query, {'first': 0})
+        self.assertEqual(result.errors[0].message, '`first` must be a positive integer.')
+
+
+class DenormalizedCounterTest(JSONWebTokenTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='counter@example.com', password='pass')
+        self.client.authenticate(self.user)
+        self.post = Post.objects.create(title='Counted', content='...', author=self.user)
+
+    def execute(self, query, **variables):
+        result = self.client.execute(query, variables)
+        self.assertIsNone(result.errors)
+        return result.data
+
+    def test_mutations_keep_counters_in_step(self):
+        self.execute('mutation($id: ID!) { createLikePost(postId: $id) { success } }', id=self.post.pk)
+        data = self.execute('mutation($id: ID!) { createComment(postId: $id, content: "hi") { comment { id } } }', id=self.post.pk)
+        comment_id = data['createComment']['comment']['id']
+        self.execute('mutation($id: ID!) { createLikeComment(commentId: $id) { success } }', id=comment_id)
+
+        data = self.execute(
+            'query($p: ID!, $c: ID!) { commentsCount(postId: $p) likeCount(postId: $p) likeCountComment(commentId: $c) }',
+            p=self.post.pk, c=comment_id,
+        )
+        self.assertEqual(data, {'commentsCount': 1, 'likeCount': 1, 'likeCountComment': 1})
+
+        self.execute('mutation($id: ID!) { unlikeComment(commentId: $id) { success } }', id=comment_id)
+        self.execute('mutation($id: ID!) { deleteComment(commentId: $id) { success } }', id=comment_id)
+        self.execute('mutation($id: ID!) { unlikePost(postId: $id) { success } }', id=self.post.pk)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.comment_count, self.post.like_count), (0, 0))
+
+    def test_rebuild_counters_command_repairs_drift(self):
+        comment = Comment.objects.create(post=self.post, author=self.user, content='hi')
+        PostLike.objects.create(post=self.post, user=self.user)
+        CommentLike.objects.create(comment=comment, user=self.user)
+
+        call_command('rebuild_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual((self.post.comment_count, self.post.like_count, comment.like_count), (1, 1, 1))
+
+
+# query counts are compared across requests; keep the cached JWT user lookup out of them
+@override_settings(JWT_USER_CACHE={'ENABLED': False})
+class TimelineTest(JSONWebTokenTestCase):
+    query = '''
+        query Timeline($first: Int, $after: String) {
+          timeline(first: $first, after: $after) {
+            edges { node { title } }
+            pageInfo { hasNextPage endCursor }
+          }
+        }
+    '''
+    create = 'mutation($title: String!) { createPost(title: $title, content: "...") { success } }'
+
+    def setUp(self):
+        self.reader = User.objects.create_user(email='timeline-reader@example.com', password='pass')
+        self.friend = User.objects.create_user(email='timeline-friend@example.com', password='pass')
+        self.stranger = User.objects.create_user(email='timeline-stranger@example.com', password='pass')
+        Follow.objects.create(follower=self.reader, followed=self.friend)
+
+    def post_as(self, user, title):
+        self.client.authenticate(user)
+        self.client.execute(self.create, {'title': title})
+
+    def titles(self, **variables):
+        self.client.authenticate(self.reader)
+        result = self.client.execute(self.query, variables)
+        self.assertIsNone(result.errors)
+        return [edge['node']['title'] for edge in result.data['timeline']['edges']]
+
+    def test_posts_are_fanned_out_to_followers(self):
+        self.post_as(self.friend, 'from friend')
+        self.post_as(self.stranger, 'from stranger')
+        self.post_as(self.reader, 'my own')
+        self.assertEqual(self.titles(), ['my own', 'from friend'])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        self.post_as(self.stranger, 'before follow')
+        Follow.objects.create(follower=self.reader, followed=self.stranger)
+        self.assertEqual(self.titles(), ['before follow'])
+        Follow.objects.get(follower=self.reader, followed=self.stranger).delete()
+        self.assertEqual(self.titles(), [])
+
+    def test_high_follower_accounts_are_merged_on_read(self):
+        with mock.patch('posts.timeline.FANOUT_LIMIT', 0):
+            for i in range(3):
+                self.post_as(self.friend, f'celebrity {i}')
+                self.post_as(self.reader, f'mine {i}')
+            self.assertFalse(TimelineEntry.objects.filter(user=self.reader, author=self.friend).exists())
+            self.assertEqual(self.titles(first=4), ['mine 2', 'celebrity 2', 'mine 1', 'celebrity 1'])
+
+            self.client.authenticate(self.reader)
+            page = self.client.execute(self.query, {'first': 4}).data['timeline']['pageInfo']
+            self.assertEqual(self.titles(after=page['endCursor']), ['mine 0', 'celebrity 0'])
+
+    def test_read_cost_does_not_depend_on_follow_count(self):
+        self.post_as(self.friend, 'hello')
+        self.client.authenticate(self.reader)
+        with CaptureQueriesContext(connection) as few:
+            self.client.execute(self.query)
+        for i in range(20):
+            Follow.objects.create(follower=self.reader, followed=User.objects.create_user(email=f'f{i}@example.com'))
+        with CaptureQueriesContext(connection) as many:
+            self.client.execute(self.query)
+        self.assertEqual(len(few), len(many))
+
+    def test_rebuild_replaces_each_timeline_atomically(self):
+        self.post_as(self.friend, 'from friend')
+        self.post_as(self.reader, 'my own')
+        TimelineEntry.objects.filter(user=self.reader, author=self.reader).delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.titles(), ['my own', 'from friend'])
+
+        # a failure midway leaves the user's previous timeline in place
+        with mock.patch('posts.timeline.backfill_many', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.titles(), ['my own', 'from friend'])
+
+
+class CommentThreadTest(JSONWebTokenTestCase):
+    query = '''
+        query Thread($postId: ID!, $parentId: ID, $first: Int, $after: String, $depth: Int, $repliesFirst: Int) {
+          commentThread(postId: $postId, parentId: $parentId, first: $first, after: $after, depth: $depth, repliesFirst: $repliesFirst) {
+            edges {
+              node {
+                comment { content }
+                hasMoreReplies
+                repliesCursor
+                replies {
+                  comment { content }
+                  hasMoreReplies
+                  replies { comment { content } hasMoreReplies }
+                }
+              }
+            }
+            pageInfo { hasNextPage endCursor }
+          }
+        }
+    '''
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='thread@example.com', password='pass')
+        self.client.authenticate(self.user)
+        self.post = Post.objects.create(title='Thread', content='...', author=self.user)
+
+    def reply(self, parent, content):
+        parent_kwargs = {'parent': parent} if parent else {}
+        return Comment.objects.create(post=self.post, author=self.user, content=content, **parent_kwargs)
+
+    def thread(self, **variables):
+        result = self.client.execute(self.query, {'postId': self.post.pk, **variables})
+        self.assertIsNone(result.errors)
+        return result.data['commentThread']
+
+    def test_reply_mutation_records_parent_and_path(self):
+        root = self.reply(None, 'root')
+        result = self.client.execute(
+            'mutation($id: ID!) { createCommentComment(parentCommentId: $id, content: "child") { comment { id } } }',
+            {'id': root.pk},
+        )
+        child = Comment.objects.get(pk=result.data['createCommentComment']['comment']['id'])
+        self.assertEqual(child.parent, root)
+        self.assertEqual(child.depth, 1)
+        self.assertTrue(child.path.startswith(root.path))
+
+    def test_thread_loads_nested_pages_in_constant_queries(self):
+        first, second = self.reply(None, 'first'), self.reply(None, 'second')
+        children = [self.reply(first, f'child {i}') for i in range(3)]
+        self.reply(children[0], 'grandchild')
+        self.reply(self.reply(children[1], 'deep'), 'deeper')
+        self.reply(second, 'other child')
+
+        with CaptureQueriesContext(connection) as queries:
+            thread = self.thread(first=1, repliesFirst=2)
+        # auth lookup, the page of roots, every reply beneath it in one range scan
+        self.assertEqual(len(queries), 3)
+
+        root = thread['edges'][0]['node']
+        self.assertEqual(root['comment']['content'], 'first')
+        self.assertTrue(root['hasMoreReplies'])
+        self.assertEqual([r['comment']['content'] for r in root['replies']], ['child 0', 'child 1'])
+        self.assertEqual(root['replies'][0]['replies'], [{'comment': {'content': 'grandchild'}, 'hasMoreReplies': False}])
+        self.assertTrue(root['replies'][1]['replies'][0]['hasMoreReplies'])
+
+        rest = self.thread(parentId=first.pk, after=root['repliesCursor'])
+        self.assertEqual([e['node']['comment']['content'] for e in rest['edges']], ['child 2'])
+
+        next_page = self.thread(first=1, after=thread['pageInfo']['endCursor'])
+        self.assertEqual(next_page['edges'][0]['node']['comment']['content'], 'second')
+        self.assertFalse(next_page['pageInfo']['hasNextPage'])
+
+    def test_deleting_a_comment_discounts_its_replies(self):
+        root = self.reply(None, 'root')
+        self.reply(self.reply(root, 'child'), 'grandchild')
+        Post.objects.filter(pk=self.post.pk).update(comment_count=3)
+        self.client.execute('mutation($id: ID!) { deleteComment(commentId: $id) { success } }', {'id': root.pk})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+
+@override_settings(DATABASE_ROUTING={**settings.DATABASE_ROUTING, 'REPLICA': None})
+class ResponseCacheTest(TestCase):
+    query = '{ posts(first: 5) { edges { node { title likeCount } } } }'
+
+    def setUp(self):
+        caches['graphql'].clear()
+        self.user = User.objects.create_user(email='cached@example.com', password='pass')
+        self.post = Post.objects.create(title='Cached', content='...', author=self.user)
+        self.auth = {'HTTP_AUTHORIZATION': f'JWT {get_token(self.user)}'}
+
+    def execute(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/', {'query': query}, content_type='application/json', **self.auth)
+        return response.json(), len(queries)
+
+    def test_repeated_queries_are_served_from_cache(self):
+        first, queries = self.execute(self.query)
+        self.assertGreater(queries, 0)
+        # whitespace differences normalize to the same document
+        second, queries = self.execute(self.query.replace(' ', '  '))
+        self.assertEqual(queries, 0)
+        self.assertEqual(first, second)
+
+    def test_writes_invalidate_dependent_responses(self):
+        self.execute(self.query)
+        with self.captureOnCommitCallbacks(execute=True):
+            PostLike.objects.create(post=self.post, user=self.user)
+            Post.objects.filter(pk=self.post.pk).update(like_count=1)
+        data, queries = self.execute(self.query)
+        self.assertGreater(queries, 0)
+        self.assertEqual(data['data']['posts']['edges'][0]['node']['likeCount'], 1)
+
+    def test_reads_before_the_commit_are_not_cached_as_fresh(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            PostLike.objects.create(post=self.post, user=self.user)
+            # a concurrent reader would still see the old rows here; whatever
+            # it caches must miss once the write commits
+            self.execute(self.query)
+            _, queries = self.execute(self.query)
+            self.assertEqual(queries, 0)
+        _, queries = self.execute(self.query)
+        self.assertGreater(queries, 0)
+
+    def test_viewers_and_mutations_are_not_shared(self):
+        self.execute(self.query)
+        other = User.objects.create_user(email='other@example.com', password='pass')
+        self.auth = {'HTTP_AUTHORIZATION': f'JWT {get_token(other)}'}
+        _, queries = self.execute(self.query)
+        self.assertGreater(queries, 0)
+
+        mutation = 'mutation { createLikePost(postId: %d) { success } }' % self.post.pk
+        self.execute(mutation)
+        data, _ = self.execute(mutation)
+        self.assertFalse(data['data']['createLikePost']['success'])
+
+    def test_session_viewers_are_not_shared_with_anonymous_clients(self):
+        from django.test import Client
+        session = Client()
+        session.force_login(self.user)
+        body = session.post('/', {'query': self.query}, content_type='application/json').json()
+        self.assertEqual(body['data']['posts']['edges'][0]['node']['title'], 'Cached')
+
+        body = Client().post('/', {'query': self.query}, content_type='application/json').json()
+        self.assertIn('errors', body)
+        self.assertIsNone(body['data']['posts'])
+
+    def cached_timeouts(self):
+        cache = caches['graphql']
+        with mock.patch.object(cache, 'set', wraps=cache.set) as set_value:
+            self.execute(self.query)
+        return [c.args[2] for c in set_value.call_args_list if c.args[0].startswith('graphql:response:')]
+
+    def test_replica_responses_expire_with_the_sticky_window(self):
+        self.assertEqual(self.cached_timeouts(), [30])
+        caches['graphql'].clear()
+        # any alias reads the rows here; what matters is that it is "the replica"
+        with override_settings(DATABASE_ROUTING={**settings.DATABASE_ROUTING, 'REPLICA': 'default', 'STICKY_SECONDS': 3}):
+            self.assertEqual(self.cached_timeouts(), [3])
+
+
+@override_settings(DATABASE_ROUTING={**settings.DATABASE_ROUTING, 'REPLICA': None})
+class PersistedQueryTest(TestCase):
+    query = '{ posts(first: 1) { edges { node { title } } } }'
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='apq@example.com', password='pass')
+        Post.objects.create(title='Persisted', content='...', author=self.user)
+        self.auth = {'HTTP_AUTHORIZATION': f'JWT {get_token(self.user)}'}
+
+    def post(self, body):
+        response = self.client.post('/', body, content_type='application/json', **self.auth)
+        return response.status_code, response.json()
+
+    def test_hash_only_requests_after_registration(self):
+        from connect_u_backend.backend import query_hash
+        extensions = {'persistedQuery': {'version': 1, 'sha256Hash': query_hash(self.query + ' ')}}
+
+        status, body = self.post({'extensions': extensions})
+        self.assertEqual((status, body['errors'][0]['message']), (200, 'PersistedQueryNotFound'))
+
+        status, body = self.post({'query': self.query + ' ', 'extensions': extensions})
+        self.assertEqual(status, 200)
+        status, body = self.post({'extensions': extensions})
+        self.assertEqual(body['data']['posts']['edges'][0]['node']['title'], 'Persisted')
+
+    def test_mismatched_hash_is_rejected(self):
+        status, _ = self.post({'query': self.query, 'extensions': {'persistedQuery': {'version': 1, 'sha256Hash': 'abc'}}})
+        self.assertEqual(status, 400)
+
+    def test_document_cache_is_bounded(self):
+        from connect_u_backend.backend import ValidatedDocumentBackend, query_hash
+        from connect_u_backend.schema import schema
+        backend = ValidatedDocumentBackend(max_documents=2)
+        first = backend.document_from_string(schema, '{ posts { edges { cursor } } }')
+        self.assertIs(backend.document_from_string(schema, '{ posts { edges { cursor } } }'), first)
+        backend.document_from_string(schema, '{ timeline { edges { cursor } } }')
+        backend.document_from_string(schema, '{ commentsCount(postId: 1) }')
+        self.assertEqual(len(backend.documents), 2)
+        self.assertIsNone(backend.get_document(query_hash(first.document_string)))
+
+
+@override_settings(DATABASE_ROUTING={**settings.DATABASE_ROUTING, 'REPLICA': None})
+class QueryComplexityTest(TestCase):
+
+    def setUp(self):
+        caches['graphql'].clear()
+        self.user = User.objects.create_user(email='complex@example.com', password='pass')
+        self.auth = {'HTTP_AUTHORIZATION': f'JWT {get_token(self.user)}'}
+
+    def post(self, query):
+        response = self.client.post('/', {'query': query}, content_type='application/json', **self.auth)
+        return response.status_code, response.json()
+
+    def test_cost_is_reported_in_extensions(self):
+        # posts (1) + edges (1) + 5 * (node (1) + author (1))
+        status, body = self.post('{ posts(first: 5) { edges { node { title author { email } } } } }')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['extensions']['cost']['requested'], 12)
+        self.assertEqual(body['extensions']['cost']['depth'], 5)
+
+    def test_literal_page_sizes_are_costed_at_most_the_page_cap(self):
+        # posts (1) + edges (1) + MAX_PAGE_SIZE (50) * (node (1) + author (1))
+        status, body = self.post('{ posts(first: 1000) { edges { node { title author { email } } } } }')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['extensions']['cost']['requested'], 102)
+
+    def test_deep_queries_are_rejected(self):
+        nested = 'id'
+        for _ in range(6):
+            nested = f'parent {{ {nested} }}'
+        status, body = self.post(f'{{ posts(first: 1) {{ edges {{ node {{ comments {{ {nested} }} }} }} }} }}')
+        self.assertEqual(status, 400)
+        self.assertIn('levels deep', body['errors'][0]['message'])
+
+    @mock.patch.dict('django.conf.settings.GRAPHQL_QUERY_LIMITS', {'MAX_COST': 100})
+    def test_costly_queries_are_rejected(self):
+        query = '{ posts(first: 50) { edges { node { comments { author { email } } } } } }'
+        status, body = self.post(query)
+        self.assertEqual(status, 400)
+        self.assertIn('has a cost of', body['errors'][0]['message'])
+
+
+@override_settings(DATABASE_ROUTING={**settings.DATABASE_ROUTING, 'REPLICA': None})
+@override_settings(GRAPHQL_PROFILING={**settings.GRAPHQL_PROFILING, 'ENABLED': True})
+class ProfilingTest(TestCase):
+    query = '{ posts(first: 5) { edges { node { title author { email } } } } }'
+
+    def setUp(self):
+        caches['graphql'].clear()
+        self.user = User.objects.create_user(email='profiled@example.com', password='pass')
+        for i in range(3):
+            Post.objects.create(title=f'Post {i}', content='...', author=self.user)
+
+    def post(self, user, **headers):
+        response = self.client.post('/', {'query': self.query}, content_type='application/json',
+                                    HTTP_AUTHORIZATION=f'JWT {get_token(user)}', **headers)
+        return response.json()
+
+    def test_staff_get_profile_in_extensions(self):
+        self.user.is_staff = True
+        self.user.save()
+        body = self.post(self.user, HTTP_X_DEBUG_PROFILE='1')
+        profile = body['extensions']['profile']
+        self.assertEqual(profile['fields']['Query.posts']['calls'], 1)
+        self.assertEqual(profile['fields']['PostType.title']['calls'], 3)
+        self.assertEqual(profile['queries'], sum(f['queries'] for f in profile['fields'].values()))
+
+    def test_n_plus_one_queries_are_flagged(self):
+        from connect_u_backend.profiling import RequestProfile
+        with RequestProfile() as profile:
+            for post in Post.objects.all():
+                User.objects.get(pk=post.author_id)
+        suspects = profile.n_plus_one_suspects()
+        self.assertEqual(len(suspects), 1)
+        self.assertEqual(suspects[0]['count'], 3)
+
+    def test_other_requests_are_logged(self):
+        with self.assertLogs('connect_u_backend.profiling', 'INFO') as logs:
+            body = self.post(self.user, HTTP_X_DEBUG_PROFILE='1')
+        self.assertNotIn('profile', body['extensions'])
+        self.assertIn('"queries"', logs.output[0])
+
+
+@override_settings(DATABASE_ROUTING={**settings.DATABASE_ROUTING, 'REPLICA': None})
+@override_settings(GRAPHQL_PROFILING={**settings.GRAPHQL_PROFILING, 'ENABLED': True})
+class ConcurrentRootFieldsTest(TransactionTestCase):
+    # pool threads use their own connections, which only see committed rows
+    query = '''
+        query Home {
+          posts(first: 2) { edges { node { title author { email } } } }
+          me { email }
+          timeline(first: 5) { edges { node { title } } }
+        }
+    '''
+
+    def setUp(self):
+        caches['graphql'].clear()
+        self.user = User.objects.create_user(email='async@example.com', password='pass', is_staff=True)
+        for i in range(3):
+            Post.objects.create(title=f'Post {i}', content='...', author=self.user)
+
+    def post(self, query, **headers):
+        response = self.client.post('/', {'query': query}, content_type='application/json',
+                                    HTTP_AUTHORIZATION=f'JWT {get_token(self.user)}', **headers)
+        return response.json()
+
+    def test_root_fields_resolve_on_the_pool_in_request_order(self):
+        import threading
+        from connect_u_backend import concurrency
+        threads = []
+
+        def execute_field(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return original(*args, **kwargs)
+        original = concurrency.execute_field
+        with mock.patch.object(concurrency, 'execute_field', execute_field):
+            body = self.post(self.query, HTTP_X_DEBUG_PROFILE='1')
+
+        self.assertNotIn('errors', body)
+        self.assertEqual(list(body['data']), ['posts', 'me', 'timeline'])
+        self.assertEqual([edge['node']['title'] for edge in body['data']['posts']['edges']], ['Post 2', 'Post 1'])
+        self.assertEqual(body['data']['me'], {'email': 'async@example.com'})
+        self.assertEqual(len(threads), 3)
+        self.assertTrue(all(name.startswith('graphql') for name in threads))
+        self.assertEqual(body['extensions']['cost']['depth'], 5)
+        # queries from every pool thread land in the one profile
+        fields = body['extensions']['profile']['fields']
+        self.assertIn('Query.posts', fields)
+        self.assertIn('Query.timeline', fields)
+        self.assertGreater(body['extensions']['profile']['queries'], 0)
+
+    def test_split_only_independent_query_fields(self):
+        from graphql import parse
+        from connect_u_backend.concurrency import root_field_documents
+
+        documents = root_field_documents(parse('{ a: posts(first: 1) { edges { cursor } } a: posts(first: 1) { pageInfo { hasNextPage } } me { email } }'), None)
+        self.assertEqual([len(d.definitions[0].selection_set.selections) for d in documents], [2, 1])
+        self.assertIsNone(root_field_documents(parse('{ me { email } }'), None))
+        self.assertIsNone(root_field_documents(parse('{ ...Root me { email } } fragment Root on Query { me { pk } }'), None))
+        self.assertIsNone(root_field_documents(parse('mutation { a: togglePostLike(postId: 1) { liked } b: togglePostLike(postId: 1) { liked } }'), None))
+
+    def test_errors_and_other_operations(self):
+        body = self.post('{ posts(first: 1) { edges { node { title } } } timeline(first: -1) { edges { cursor } } }')
+        self.assertEqual(body['data']['posts']['edges'][0]['node']['title'], 'Post 2')
+        self.assertEqual(len(body['errors']), 1)
+        # single root field: served by the sync view
+        self.assertEqual(len(self.post('{ posts(first: 1) { edges { cursor } } }')['data']['posts']['edges']), 1)
+
+
+class ReplicaRoutingTest(TestCase):
+
+    def setUp(self):
+        from django.test import RequestFactory
+        caches['default'].clear()
+        self.user = User.objects.create_user(email='writer@example.com', password='pass')
+        self.request = RequestFactory().post('/', HTTP_AUTHORIZATION=f'JWT {get_token(self.user)}')
+
+    def read_alias(self):
+        from connect_u_backend.routers import PrimaryReplicaRouter
+        return PrimaryReplicaRouter().db_for_read(Post)
+
+    @override_settings(DATABASE_ROUTING={'REPLICA': 'replica'})
+    def test_queries_read_the_replica_until_the_viewer_writes(self):
+        from connect_u_backend.routers import route_operation
+        with route_operation(self.request, 'query'):
+            self.assertEqual(self.read_alias(), 'replica')
+        self.assertIsNone(self.read_alias())
+        with route_operation(self.request, 'mutation'):
+            self.assertIsNone(self.read_alias())
+        # read-your-writes: the writer is pinned, everyone else isn't
+        with route_operation(self.request, 'query'):
+            self.assertIsNone(self.read_alias())
+        from django.test import RequestFactory
+        with route_operation(RequestFactory().post('/'), 'query'):
+            self.assertEqual(self.read_alias(), 'replica')
+
+    @override_settings(DATABASE_ROUTING={'REPLICA': 'replica'})
+    def test_routing_follows_the_operation_into_the_pool(self):
+        from asgiref.sync import async_to_sync
+        from connect_u_backend.concurrency import run_in_pool
+        from connect_u_backend.routers import route_operation
+
+        async def read_in_pool():
+            with route_operation(self.request, 'query'):
+                return await run_in_pool(self.read_alias)
+        self.assertEqual(async_to_sync(read_in_pool)(), 'replica')
+
+    @override_settings(DATABASE_ROUTING={'REPLICA': None})
+    def test_disabled_without_a_replica(self):
+        from connect_u_backend.routers import route_operation
+        with route_operation(self.request, 'query'):
+            self.assertIsNone(self.read_alias())
+
+
+@skipUnless('replica' in settings.DATABASES, "set DATABASE_REPLICA_URL to test against a second alias")
+@override_settings(DATABASE_ROUTING={**settings.DATABASE_ROUTING, 'REPLICA': 'replica'})
+class ReplicaAliasTest(TransactionTestCase):
+    # the replica alias is a second connection, which only sees committed rows
+    databases = '__all__'
+
+    def test_requests_use_both_aliases(self):
+        from django.db import connections
+        caches['default'].clear()
+        caches['graphql'].clear()
+        user = User.objects.create_user(email='replicated@example.com', password='pass')
+        post = Post.objects.create(title='Replicated', content='...', author=user)
+        headers = {'HTTP_AUTHORIZATION': f'JWT {get_token(user)}'}
+
+        def run(query, alias):
+            with CaptureQueriesContext(connections[alias]) as queries:
+                body = self.client.post('/', {'query': query}, content_type='application/json', **headers).json()
+            self.assertNotIn('errors', body)
+            return len(queries)
+
+        self.assertGreater(run('{ post(id: %d) { title } }' % post.pk, 'replica'), 0)
+        self.assertGreater(run('mutation { togglePostLike(postId: %d) { liked } }' % post.pk, 'default'), 0)
+        self.assertEqual(run('{ post(id: %d) { likeCount } }' % post.pk, 'replica'), 0)
+
+
+class BenchmarkTest(TestCase):
+
+    def test_synthetic_graph_is_consistent_and_reproducible(self):
+        from .synthetic import SyntheticGraph, synthetic_users
+        counts = SyntheticGraph(users=30, follows=5, posts=2, comments=2, likes=3, seed=7).generate()
+        follows = sorted(Follow.objects.values_list('follower__email', 'followed__email'))
+        self.assertEqual(counts['users'], synthetic_users().count())
+
+        # derived data is rebuilt even though bulk_create skipped the signals
+        post = Post.objects.order_by('-comment_count').first()
+        self.assertEqual(post.comment_count, post.comments.count())
+        for comment in Comment.objects.filter(parent__isnull=False)[:20]:
+            self.assertTrue(comment.path.startswith(comment.parent.path))
+            self.assertEqual(comment.depth, comment.parent.depth + 1)
+
+        synthetic_users().delete()
+        SyntheticGraph(users=30, follows=5, posts=2, comments=2, likes=3, seed=7).generate()
+        self.assertEqual(sorted(Follow.objects.values_list('follower__email', 'followed__email')), follows)
+
+    def test_benchmark_compares_against_baseline(self):
+        from . import benchmark
+        from .synthetic import SyntheticGraph
+        SyntheticGraph(users=20, follows=4, posts=2, comments=2, likes=3, seed=1).generate()
+        results = benchmark.Runner(iterations=2, warmup=0).run()
+        self.assertEqual(set(results['operations']), {op.name for op in benchmark.OPERATIONS})
+        self.assertEqual(benchmark.compare(results, results), [])
+
+        feed = results['operations']['feed']
+        baseline = {'operations': {'feed': {**feed, 'queries': feed['queries'] - 1}}}
+        self.assertEqual(len(benchmark.compare(results, baseline)), 1)
+
+
+class TrendingTest(JSONWebTokenTestCase):
+    query = '''
+        query Trending($window: TrendingWindow, $first: Int) {
+          trendingPosts(window: $window, first: $first) { score post { title } }
+        }
+    '''
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='trend@example.com', password='pass')
+        self.client.authenticate(self.user)
+        self.fans = [User.objects.create_user(email=f'trendfan{i}@example.com', password='pass') for i in range(3)]
+        self.hot = Post.objects.create(title='Hot', content='...', author=self.user)
+        self.warm = Post.objects.create(title='Warm', content='...', author=self.user)
+        Post.objects.create(title='Cold', content='...', author=self.user)
+
+    def engage(self):
+        toggle = 'mutation($id: ID!) { togglePostLike(postId: $id) { liked } }'
+        with self.captureOnCommitCallbacks(execute=True):
+            for fan in self.fans:
+                PostLike.objects.create(post=self.hot, user=fan)
+            Comment.objects.create(post=self.hot, author=self.fans[0], content='wow')
+            self.client.execute(toggle, {'id': self.warm.pk})
+            comment = Comment.objects.create(post=self.warm, author=self.user, content='meh')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.execute('mutation($ids: [ID]!) { likeComments(commentIds: $ids) { success } }', {'ids': [comment.pk]})
+
+    def titles(self, **variables):
+        result = self.client.execute(self.query, variables)
+        self.assertIsNone(result.errors)
+        return [(item['post']['title'], round(item['score'], 2)) for item in result.data['trendingPosts']]
+
+    def test_scores_are_kept_up_to_date_on_write(self):
+        self.engage()
+        # three likes and a comment; a like, a comment and a comment like; barely decayed yet
+        self.assertEqual(self.titles(), [('Hot', 6.0), ('Warm', 4.5)])
+        self.assertEqual(self.titles(window='WEEK', first=1), [('Hot', 6.0)])
+
+    def test_ranking_reads_only_the_score_table(self):
+        self.engage()
+        with CaptureQueriesContext(connection) as queries:
+            self.titles()
+        self.assertFalse(any('posts_postlike' in q['sql'] or 'posts_comment' in q['sql'] for q in queries))
+
+    def test_rebuild_matches_incremental_scores_and_drops_removals(self):
+        self.engage()
+        before = dict(PostScore.objects.filter(window='day').values_list('post__title', 'score'))
+        call_command('rebuild_trending', stdout=StringIO())
+        after = dict(PostScore.objects.filter(window='day').values_list('post__title', 'score'))
+        self.assertEqual(after.keys(), before.keys())
+        for title in before:
+            self.assertAlmostEqual(after[title], before[title], places=2)
+
+        PostLike.objects.filter(post=self.hot).delete()
+        Comment.objects.filter(post=self.hot).delete()
+        call_command('rebuild_trending', stdout=StringIO())
+        self.assertEqual([title for title, _ in self.titles()], ['Warm'])
+
+    def test_activity_outside_the_window_does_not_rank(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from . import trending
+        trending.record('like', [self.hot.pk], at=timezone.now() - timedelta(days=2))
+        self.assertEqual(self.titles(), [])
+        self.assertEqual([title for title, _ in self.titles(window='WEEK')], ['Hot'])
+
+
+class SearchTest(JSONWebTokenTestCase):
+    query = '''
+        query Search($query: String!, $first: Int, $after: String) {
+          searchPosts(query: $query, first: $first, after: $after) {
+            edges { node { title } }
+            pageInfo { hasNextPage endCursor }
+          }
+        }
+    '''
+
+    def setUp(self):
+        from .search import post_index
+        from users.search import user_index
+        post_index.clear()
+        user_index.clear()
+        self.user = User.objects.create_user(email='searcher@example.com', password='pass', username='searcher')
+        self.client.authenticate(self.user)
+        self.in_title = Post.objects.create(title='Gardening tips', content='Water daily.', author=self.user)
+        self.in_content = Post.objects.create(title='Weekend', content='Spent it gardening.', author=self.user)
+        self.in_comment = Post.objects.create(title='Photos', content='Look at these.', author=self.user)
+        Comment.objects.create(post=self.in_comment, author=self.user, content='Nice gardening!')
+        Post.objects.create(title='Cooking', content='Pasta recipes.', author=self.user)
+
+    def search(self, query, **variables):
+        result = self.client.execute(self.query, {'query': query, **variables})
+        self.assertIsNone(result.errors)
+        return result.data['searchPosts']
+
+    def titles(self, page):
+        return [edge['node']['title'] for edge in page['edges']]
+
+    def test_ranked_by_where_the_terms_match(self):
+        self.assertEqual(self.titles(self.search('gardening')), ['Gardening tips', 'Weekend', 'Photos'])
+        self.assertEqual(self.titles(self.search('gardening water')), ['Gardening tips'])
+
+    def test_paginated(self):
+        page = self.search('gardening', first=2)
+        self.assertTrue(page['pageInfo']['hasNextPage'])
+        rest = self.search('gardening', first=2, after=page['pageInfo']['endCursor'])
+        self.assertEqual(self.titles(rest), ['Photos'])
+
+    def test_index_follows_writes(self):
+        self.search('gardening')
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(title='More gardening', content='...', author=self.user)
+            self.in_title.delete()
+        self.assertEqual(self.titles(self.search('gardening tips')), [])
+        self.assertIn('More gardening', self.titles(self.search('gardening')))
+
+    def test_search_users(self):
+        other = User.objects.create_user(email='ana@example.com', password='pass', username='ana')
+        other.profile.bio = 'Keen on gardening'
+        other.profile.save()
+        result = self.client.execute('{ searchUsers(query: "gardening") { email } }')
+        self.assertEqual(result.data['searchUsers'], [{'email': 'ana@example.com'}])
+        result = self.client.execute('{ searchUsers(query: "searcher") { email } }')
+        self.assertEqual(result.data['searchUsers'], [{'email': 'searcher@example.com'}])
+
+
+# query counts are compared across requests; keep the cached JWT user lookup out of them
+@override_settings(JWT_USER_CACHE={'ENABLED': False})
+class BulkLikeTest(JSONWebTokenTestCase):
+    like = '''
+        mutation Like($ids: [ID]!) {
+          likePosts(postIds: $ids) { message results { id success message } }
+        }
+    '''
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='bulk@example.com', password='pass')
+        self.client.authenticate(self.user)
+
+    def make_posts(self, count):
+        return [Post.objects.create(title=f'Post {i}', content='...', author=self.user) for i in range(count)]
+
+    def execute(self, query, ids):
+        with CaptureQueriesContext(connection) as queries:
+            result = self.client.execute(query, {'ids': ids})
+        self.assertIsNone(result.errors)
+        return result.data, len(queries)
+
+    def test_per_item_results(self):
+        first, second = self.make_posts(2)
+        PostLike.objects.create(post=second, user=self.user)
+        Post.objects.filter(pk=second.pk).update(like_count=1)
+
+        data, _ = self.execute(self.like, [first.pk, second.pk, 999999, 'abc', first.pk])
+        results = [(r['id'], r['success'], r['message']) for r in data['likePosts']['results']]
+        self.assertEqual(results, [
+            (str(first.pk), True, 'Post liked successfully.'),
+            (str(second.pk), False, 'You have already liked this post.'),
+            ('999999', False, 'Post does not exist.'),
+            ('abc', False, 'Invalid id.'),
+        ])
+        self.assertEqual(list(Post.objects.order_by('pk').values_list('like_count', flat=True)), [1, 1])
+
+        data, _ = self.execute(
+            'mutation($ids: [ID]!) { unlikePosts(postIds: $ids) { results { success } } }', [first.pk, second.pk])
+        self.assertEqual(list(Post.objects.values_list('like_count', flat=True)), [0, 0])
+        self.assertFalse(PostLike.objects.exists())
+
+    def test_fixed_number_of_queries(self):
+        _, few = self.execute(self.like, [post.pk for post in self.make_posts(2)])
+        _, many = self.execute(self.like, [post.pk for post in self.make_posts(30)])
+        self.assertEqual(few, many)
+
+    def test_likes_skipped_as_conflicts_are_not_announced(self):
+        from connect_u_backend import bulk
+        from .schema import like_many
+        first, second = self.make_posts(2)
+        insert_new = bulk.insert_new
+
+        def concurrent_like_first(objs, **kwargs):
+            # another request likes `first` between the lookup and the insert
+            PostLike.objects.create(post=first, user=self.user)
+            return insert_new(objs, **kwargs)
+
+        with mock.patch('connect_u_backend.bulk.insert_new', concurrent_like_first), \
+                mock.patch('connect_u_backend.pubsub.publish') as publish, \
+                mock.patch('posts.trending.record_likes') as record_likes, \
+                self.captureOnCommitCallbacks(execute=True):
+            messages = like_many(self.user, [first.pk, second.pk], Post, PostLike, 'post')
+
+        self.assertEqual(messages[first.pk], (False, 'You have already liked this post.'))
+        self.assertEqual(messages[second.pk], (True, 'Post liked successfully.'))
+        self.assertEqual([c.args[0] for c in publish.call_args_list], [f'post_liked:{second.pk}'])
+        record_likes.assert_called_once_with(Post, [second.pk])
+        self.assertEqual(list(Post.objects.order_by('pk').values_list('like_count', flat=True)), [1, 1])
+
+    def test_like_comments(self):
+        post = self.make_posts(1)[0]
+        comments = [Comment.objects.create(post=post, author=self.user, content='hi') for _ in range(3)]
+        data, _ = self.execute(
+            'mutation($ids: [ID]!) { likeComments(commentIds: $ids) { message } }', [c.pk for c in comments])
+        self.assertEqual(data['likeComments']['message'], '3 comments liked.')
+        self.assertEqual(set(Comment.objects.values_list('like_count', flat=True)), {1})
+
+
+class ToggleLikeTest(JSONWebTokenTestCase):
+    query = '''
+        mutation Toggle($id: ID!) { togglePostLike(postId: $id) { success message liked likeCount } }
+    '''
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='toggler@example.com', password='pass')
+        self.post = Post.objects.create(title='Toggle me', content='...', author=self.user)
+        self.client.authenticate(self.user)
+
+    def toggle(self, post_id):
+        result = self.client.execute(self.query, {'id': post_id})
+        self.assertIsNone(result.errors)
+        return result.data['togglePostLike']
+
+    def test_toggles_state_and_count(self):
+        self.assertEqual(self.toggle(self.post.pk), {
+            'success': True, 'message': 'Post liked successfully.', 'liked': True, 'likeCount': 1})
+        self.assertTrue(PostLike.objects.filter(post=self.post, user=self.user).exists())
+        self.assertEqual(self.toggle(self.post.pk)['likeCount'], 0)
+        self.assertFalse(PostLike.objects.exists())
+
+    def test_missing_post(self):
+        self.assertEqual(self.toggle(999999)['message'], 'Post does not exist.')
+        self.assertEqual(self.toggle('abc')['success'], False)
+        self.assertFalse(PostLike.objects.exists())
+
+    def test_comment_toggle(self):
+        comment = Comment.objects.create(post=self.post, author=self.user, content='hi')
+        result = self.client.execute(
+            'mutation($id: ID!) { toggleCommentLike(commentId: $id) { liked likeCount } }', {'id': comment.pk})
+        self.assertEqual(result.data['toggleCommentLike'], {'liked': True, 'likeCount': 1})
+
+
+class ToggleLikeStressTest(TransactionTestCase):
+
+    def test_concurrent_toggles_keep_the_count_exact(self):
+        import random
+        import threading
+        from django.db import OperationalError, connections
+        from .likes import toggle_like
+
+        author = User.objects.create_user(email='stress@example.com', password='pass')
+        post = Post.objects.create(title='Hot', content='...', author=author)
+        users = [User.objects.create_user(email=f'tapper{i}@example.com', password='pass').pk for i in range(4)]
+        errors = []
+
+        def tap(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(25):
+                    user_id = rng.choice(users)
+                    while True:
+                        try:
+                            toggle_like(PostLike, 'post', post.pk, user_id)
+                            break
+                        except OperationalError as e:
+                            # SQLite's shared in-memory test database refuses concurrent
+                            # writers instead of waiting; the toggle was rolled back, retry
+                            if 'locked' not in str(e):
+                                raise
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=tap, args=(seed,)) for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        post.refresh_from_db()
+        self.assertEqual(post.like_count, PostLike.objects.filter(post=post).count())
+
+
+@override_settings(LIKE_BUFFER={'ENABLED': True})
+class LikeBufferTest(JSONWebTokenTestCase):
+    like = 'mutation($id: ID!) { createLikePost(postId: $id) { success message } }'
+    unlike = 'mutation($id: ID!) { unlikePost(postId: $id) { success message } }'
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from . import like_buffer
+        self.user = User.objects.create_user(email='buffered@example.com', password='pass')
+        self.client.authenticate(self.user)
+        self.post = Post.objects.create(title='Viral', content='...', author=self.user)
+        self.journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.journal_dir)
+        # flushed by the test, on the thread that can see the test transaction's rows
+        patcher = mock.patch.object(like_buffer, '_buffer', self.new_buffer())
+        self.buffer = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def new_buffer(self):
+        from .like_buffer import LikeBuffer
+        return LikeBuffer(self.journal_dir, background=False)
+
+    def execute(self, query):
+        result = self.client.execute(query, {'id': self.post.pk})
+        self.assertIsNone(result.errors)
+        return next(iter(result.data.values()))['success']
+
+    def test_likes_are_written_behind_and_deduplicated(self):
+        self.assertTrue(self.execute(self.like))
+        # the viewer's own state is known before anything is written
+        self.assertFalse(self.execute(self.like))
+        self.assertFalse(PostLike.objects.exists())
+
+        self.assertTrue(self.execute(self.unlike))
+        self.assertTrue(self.execute(self.like))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(PostLike.objects.filter(post=self.post, user=self.user).count(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertFalse(any(q['sql'].startswith('UPDATE "posts_post"') and 'like_count" + ' in q['sql'] for q in queries))
+
+        self.assertTrue(self.execute(self.unlike))
+        self.buffer.flush()
+        self.post.refresh_from_db()
+        self.assertEqual((PostLike.objects.count(), self.post.like_count), (0, 0))
+
+    def test_unflushed_events_survive_a_crash(self):
+        import os
+        fan = User.objects.create_user(email='crashfan@example.com', password='pass')
+        self.execute(self.like)
+        self.buffer.record('post', self.post.pk, fan.pk, True)
+        self.buffer.record('post', self.post.pk, fan.pk, False)
+        self.buffer.record('post', self.post.pk, fan.pk, True)
+        # the process dies: its journal segment is closed (unlocked) without a flush
+        self.buffer.journal.active.close()
+
+        recovered = self.new_buffer()
+        self.assertEqual(recovered.flush(), 2)
+        self.assertEqual(set(PostLike.objects.values_list('user_id', flat=True)), {self.user.pk, fan.pk})
+        # the replayed segment is gone; only the new buffer's empty one remains
+        self.assertEqual(os.listdir(self.journal_dir), [os.path.basename(recovered.journal.active.name)])
+
+    def test_a_live_buffer_keeps_its_journal(self):
+        self.execute(self.like)
+        self.assertEqual(self.new_buffer().flush(), 0)
+        self.assertEqual(self.buffer.flush(), 1)
+
+
+class SubscriptionTest(TestCase):
+    subscription = '''
+        subscription Comments($postId: ID!) {
+          commentAdded(postId: $postId) { content author { email } }
+        }
+    '''
+
+    def setUp(self):
+        from connect_u_backend import pubsub
+        self.user = User.objects.create_user(email='listener@example.com', password='pass')
+        self.post = Post.objects.create(title='Live', content='...', author=self.user)
+        # deliver on the publishing thread, where the test transaction's rows are visible
+        patcher = mock.patch.object(pubsub, '_backend', pubsub.LocalBackend(inline=True))
+        self.backend = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def subscribe(self, query, variables, user=None):
+        from types import SimpleNamespace
+        from connect_u_backend.schema import schema
+        context = SimpleNamespace(user=user or self.user)
+        observable = schema.execute(query, variable_values=variables, context_value=context, allow_subscriptions=True)
+        results = []
+        return results, observable.subscribe(results.append)
+
+    def test_comment_added_after_commit(self):
+        results, subscription = self.subscribe(self.subscription, {'postId': self.post.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=self.post, author=self.user, content='First!')
+            self.assertEqual(results, [])
+        other = Post.objects.create(title='Elsewhere', content='...', author=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=other, author=self.user, content='Not here')
+
+        self.assertEqual([result.data for result in results], [
+            {'commentAdded': {'content': 'First!', 'author': {'email': 'listener@example.com'}}}])
+        subscription.dispose()
+        self.assertEqual(self.backend.subscriber_count(f'comment_added:{self.post.pk}'), 0)
+
+    def test_post_liked_from_toggle_and_batch(self):
+        results, _ = self.subscribe(
+            'subscription($id: ID!) { postLiked(postId: $id) { likeCount user { email } } }', {'id': self.post.pk})
+        fan = User.objects.create_user(email='fan@example.com', password='pass')
+        from .likes import toggle_like
+        from .schema import like_many
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_like(PostLike, 'post', self.post.pk, fan.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            like_many(self.user, [self.post.pk], Post, PostLike, 'post')
+        self.assertEqual([result.data['postLiked'] for result in results], [
+            {'likeCount': 1, 'user': {'email': 'fan@example.com'}},
+            {'likeCount': 2, 'user': {'email': 'listener@example.com'}},
+        ])
+
+    async def test_websocket_protocol(self):
+        from asgiref.sync import sync_to_async
+        from asgiref.testing import ApplicationCommunicator
+        from connect_u_backend.asgi import application
+
+        socket = ApplicationCommunicator(application, {
+            'type': 'websocket', 'path': '/graphql/', 'subprotocols': ['graphql-transport-ws']})
+        await socket.send_input({'type': 'websocket.connect'})
+        self.assertEqual(await socket.receive_output(), {
+            'type': 'websocket.accept', 'subprotocol': 'graphql-transport-ws'})
+
+        async def send(message):
+            await socket.send_input({'type': 'websocket.receive', 'text': json.dumps(message)})
+
+        async def receive():
+            return json.loads((await socket.receive_output(timeout=2))['text'])
+
+        token = await sync_to_async(get_token)(self.user)
+        await send({'type': 'connection_init', 'payload': {'Authorization': f'JWT {token}'}})
+        self.assertEqual(await receive(), {'type': 'connection_ack'})
+        await send({'id': '1', 'type': 'subscribe',
+                    'payload': {'query': self.subscription, 'variables': {'postId': self.post.pk}}})
+        await send({'type': 'ping'})
+        self.assertEqual(await receive(), {'type': 'pong'})
+
+        def comment():
+            with self.captureOnCommitCallbacks(execute=True):
+                Comment.objects.create(post=self.post, author=self.user, content='Over the wire')
+        await sync_to_async(comment)()
+        self.assertEqual(await receive(), {'id': '1', 'type': 'next', 'payload': {'data': {
+            'commentAdded': {'content': 'Over the wire', 'author': {'email': 'listener@example.com'}}}}})
+
+        await send({'id': '1', 'type': 'complete'})
+        await send({'id': '2', 'type': 'subscribe', 'payload': {'query': '{ posts(first: 1) { edges { node { title } } } }'}})
+        self.assertEqual((await receive())['payload'], {'data': {'posts': {'edges': [{'node': {'title': 'Live'}}]}}})
+        self.assertEqual(await receive(), {'id': '2', 'type': 'complete'})
+        self.assertEqual(self.backend.subscriber_count(f'comment_added:{self.post.pk}'), 0)
+        await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await socket.wait(timeout=2)
+
+    async def test_websocket_requires_valid_token(self):
+        from asgiref.testing import ApplicationCommunicator
+        from connect_u_backend.asgi import application
+
+        socket = ApplicationCommunicator(application, {
+            'type': 'websocket', 'path': '/graphql/', 'subprotocols': ['graphql-transport-ws']})
+        await socket.send_input({'type': 'websocket.connect'})
+        await socket.receive_output()
+        await socket.send_input({'type': 'websocket.receive', 'text': json.dumps(
+            {'type': 'connection_init', 'payload': {'Authorization': 'JWT not-a-token'}})})
+        self.assertEqual((await socket.receive_output(timeout=2))['code'], 4403)
+        await socket.send_input({'type': 'websocket.disconnect', 'code': 4403})
+        await socket.wait(timeout=2)
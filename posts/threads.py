@@ -0,0 +1,92 @@
+"""
+Comment threads loaded from the materialized `Comment.path`.
+
+A page of sibling comments is read in path order; every reply beneath that
+page (down to the requested depth, at most `replies_first` + 1 per parent)
+comes back from a single range query on (post, path).
+"""
+import base64
+
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from graphql import GraphQLError
+
+from connect_u_backend.pagination import page_size
+from .models import Comment
+
+DEFAULT_DEPTH = 3
+MAX_DEPTH = 10
+DEFAULT_REPLIES = 5
+
+
+def encode_path_cursor(path):
+    return base64.urlsafe_b64encode(path.encode()).decode()
+
+
+def decode_path_cursor(cursor):
+    try:
+        return base64.urlsafe_b64decode(cursor.encode()).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise GraphQLError("Invalid cursor.")
+
+
+class ThreadNode:
+    """A comment together with the slice of its replies that was loaded."""
+
+    def __init__(self, comment):
+        self.comment = comment
+        self.replies = []
+        self.has_more_replies = False
+
+    @property
+    def replies_cursor(self):
+        return encode_path_cursor(self.replies[-1].comment.path) if self.replies else None
+
+
+def get_thread(post_id, parent_id=None, first=None, after=None, depth=None, replies_first=None):
+    """
+    Return ([ThreadNode], has_next_page) for a page of the comments directly
+    under `parent_id` (top-level comments when None), nested `depth` levels deep.
+    """
+    limit = page_size(first)
+    replies_limit = page_size(replies_first or DEFAULT_REPLIES)
+    depth = min(max(depth or DEFAULT_DEPTH, 1), MAX_DEPTH)
+
+    roots = Comment.objects.filter(post_id=post_id, parent_id=parent_id).select_related('author').order_by('path')
+    if after:
+        roots = roots.filter(path__gt=decode_path_cursor(after))
+    roots = list(roots[:limit + 1])
+    has_next_page = len(roots) > limit
+    roots = roots[:limit]
+    if not roots:
+        return [], has_next_page
+
+    nodes = {comment.pk: ThreadNode(comment) for comment in roots}
+    base_depth = roots[0].depth
+
+    # one extra level is read only to tell whether the deepest nodes have replies
+    descendants = (
+        Comment.objects
+        .filter(
+            post_id=post_id,
+            path__gt=roots[0].path,
+            path__lt=roots[-1].path + '~',
+            depth__gt=base_depth,
+            depth__lte=base_depth + depth,
+        )
+        .annotate(position=Window(RowNumber(), partition_by=F('parent_id'), order_by=F('path').asc()))
+        .filter(position__lte=replies_limit + 1)
+        .select_related('author')
+        .order_by('path')
+    )
+    for comment in descendants:
+        parent = nodes.get(comment.parent_id)
+        if parent is None:
+            continue  # its parent was cut off by the per-node limit
+        if comment.depth == base_depth + depth or len(parent.replies) == replies_limit:
+            parent.has_more_replies = True
+            continue
+        nodes[comment.pk] = ThreadNode(comment)
+        parent.replies.append(nodes[comment.pk])
+
+    return [nodes[comment.pk] for comment in roots], has_next_page
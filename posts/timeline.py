@@ -0,0 +1,114 @@
+"""
+Home timeline: posts from the accounts a user follows.
+
+Posts are fanned out on write into TimelineEntry rows for every follower.
+Authors with more than TIMELINE_FANOUT_LIMIT followers are skipped at write
+time and their posts are merged in at read time instead, so a single post
+never turns into millions of inserts.
+"""
+import heapq
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from connect_u_backend.pagination import build_connection, decode_cursor, encode_cursor, page_size
+from users.models import Follow, Profile
+from .models import Post, TimelineEntry
+
+FANOUT_LIMIT = getattr(settings, 'TIMELINE_FANOUT_LIMIT', 5000)
+BACKFILL_SIZE = 50
+
+
+def is_fan_out_author(author_id):
+    follower_count = Profile.objects.filter(user_id=author_id).values_list('follower_count', flat=True).first()
+    return (follower_count or 0) <= FANOUT_LIMIT
+
+
+def entries_for(post, user_ids):
+    return [
+        TimelineEntry(user_id=user_id, post_id=post.pk, author_id=post.author_id, created_at=post.created_at)
+        for user_id in user_ids
+    ]
+
+
+def fan_out(post):
+    """Push a new post into its author's timeline and, for regular authors, every follower's."""
+    user_ids = [post.author_id]
+    if is_fan_out_author(post.author_id):
+        user_ids += Follow.objects.filter(followed_id=post.author_id).values_list('follower_id', flat=True)
+    TimelineEntry.objects.bulk_create(entries_for(post, user_ids), batch_size=1000, ignore_conflicts=True)
+
+
+def backfill(follower_id, followed_id):
+    """Copy the latest posts of a newly followed account into the follower's timeline."""
+    if follower_id != followed_id and not is_fan_out_author(followed_id):
+        return
+    posts = Post.objects.filter(author_id=followed_id).order_by('-created_at', '-id')[:BACKFILL_SIZE]
+    entries = [entry for post in posts for entry in entries_for(post, [follower_id])]
+    TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def backfill_many(follower_id, followed_ids):
+    """backfill() for several newly followed accounts with one read and one insert."""
+    sources = Profile.objects.filter(user_id__in=followed_ids, follower_count__lte=FANOUT_LIMIT).values('user_id')
+    posts = (
+        Post.objects.filter(author_id__in=sources)
+        .annotate(position=Window(RowNumber(), partition_by=F('author_id'), order_by=[F('created_at').desc(), F('id').desc()]))
+        .filter(position__lte=BACKFILL_SIZE)
+    )
+    entries = [entry for post in posts for entry in entries_for(post, [follower_id])]
+    TimelineEntry.objects.bulk_create(entries, batch_size=1000, ignore_conflicts=True)
+
+
+def rebuild(user_id):
+    """Rematerialize one user's timeline in one transaction, so readers see the old or the new one."""
+    with transaction.atomic():
+        TimelineEntry.objects.filter(user_id=user_id).delete()
+        backfill(user_id, user_id)
+        backfill_many(user_id, Follow.objects.filter(follower_id=user_id).values('followed_id'))
+
+
+def remove(follower_id, followed_id):
+    """Drop an unfollowed account's posts from the follower's timeline."""
+    TimelineEntry.objects.filter(user_id=follower_id, author_id=followed_id).delete()
+
+
+def after_cursor(queryset, after, created_at_field, post_field):
+    if not after:
+        return queryset
+    created_at, post_id = decode_cursor(after)
+    return queryset.filter(
+        Q(**{f'{created_at_field}__lt': created_at}) | Q(**{created_at_field: created_at, f'{post_field}__lt': post_id})
+    )
+
+
+def get_timeline(user, connection, first=None, after=None):
+    """
+    Build a page of `user`'s timeline: at most `first` + 1 rows from the
+    materialized entries and from each high-follower source, merged newest first.
+    """
+    limit = page_size(first)
+
+    entries = TimelineEntry.objects.filter(user=user).select_related('post__author').order_by('-created_at', '-post_id')
+    entries = after_cursor(entries, after, 'created_at', 'post_id')
+    materialized = [entry.post for entry in entries[:limit + 1]]
+
+    # the set of high-follower accounts is small and indexed, so this stays
+    # independent of how many accounts the user follows
+    celebrities = Profile.objects.filter(follower_count__gt=FANOUT_LIMIT).filter(
+        Q(user=user) | Q(user__followers__follower=user)
+    ).values('user_id')
+    pulled = Post.objects.filter(author_id__in=celebrities).select_related('author').order_by('-created_at', '-id')
+    pulled = list(after_cursor(pulled, after, 'created_at', 'id')[:limit + 1])
+
+    merged, seen = [], set()
+    for post in heapq.merge(materialized, pulled, key=lambda p: (p.created_at, p.pk), reverse=True):
+        if post.pk not in seen:
+            seen.add(post.pk)
+            merged.append(post)
+    has_next_page = len(merged) > limit
+
+    items = [(post, encode_cursor(post.created_at, post.pk)) for post in merged[:limit]]
+    return build_connection(connection, items, has_next_page, after)
@@ -0,0 +1,145 @@
+"""
+Trending posts: posts ranked by time-decayed engagement.
+
+Every like, comment and comment like on a post adds its weight to the
+post's score in each window, and that contribution halves every half-life.
+Scores use forward decay: an event at time t adds
+weight * 2^((t - LANDMARK) / half_life), so a score never has to be
+rewritten as time passes and ordering by the stored value orders by the
+decayed engagement at any moment. Stored values are log2 of that sum, which
+keeps them from overflowing, and recording an event is one UPDATE of the
+post's PostScore rows (plus an INSERT for its first event in a window).
+
+Reads are an index scan of PostScore; nothing is aggregated per request.
+Removals (unlikes, deleted comments) aren't subtracted, and an event racing
+a post's first one may be missed: `manage.py rebuild_trending` recomputes
+every window from its recent activity and should run periodically.
+"""
+import math
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Abs, Greatest, Log, Power
+from django.utils import timezone
+
+from .models import Comment, CommentLike, Post, PostLike, PostScore
+
+LANDMARK = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+REBUILD_CHUNK_SIZE = 10000
+
+DEFAULTS = {
+    # name: (hours of activity a post is ranked on, half-life in hours)
+    'WINDOWS': {'day': (24, 6), 'week': (24 * 7, 36)},
+    'WEIGHTS': {'like': 1.0, 'comment': 3.0, 'comment_like': 0.5},
+}
+
+
+def trending_settings():
+    return {**DEFAULTS, **getattr(settings, 'TRENDING', {})}
+
+
+def exponent(at, half_life):
+    """log2 of the forward decay factor of an event at `at`."""
+    return (at - LANDMARK).total_seconds() / 3600 / half_life
+
+
+def log_add(score, value):
+    """log2(2^score + 2^value) as an expression, without overflowing either power."""
+    value = Value(value, output_field=FloatField())
+    return Greatest(score, value) + Log(Value(2.0), Value(1.0) + Power(Value(2.0), -Abs(score - value)))
+
+
+def add(post_ids, weight, at):
+    for window, (hours, half_life) in trending_settings()['WINDOWS'].items():
+        value = exponent(at, half_life) + math.log2(weight)
+        scores = PostScore.objects.filter(window=window, post_id__in=post_ids)
+        updated = scores.update(score=log_add(F('score'), value), last_activity=at)
+        if updated < len(post_ids):
+            existing = set(scores.values_list('post_id', flat=True))
+            PostScore.objects.bulk_create(
+                [PostScore(post_id=pk, window=window, score=value, last_activity=at)
+                 for pk in post_ids if pk not in existing],
+                ignore_conflicts=True,
+            )
+
+
+def record(kind, post_ids, at=None):
+    """
+    Add one `kind` event ('like', 'comment' or 'comment_like') to each of
+    `post_ids`; a post listed n times gets n events. Writes one UPDATE per
+    window for every distinct repeat count.
+    """
+    weight = trending_settings()['WEIGHTS'][kind]
+    at = at or timezone.now()
+    by_count = defaultdict(list)
+    for pk, count in Counter(post_ids).items():
+        by_count[count].append(pk)
+    for count, pks in by_count.items():
+        add(pks, weight * count, at)
+
+
+def record_likes(target_model, target_ids):
+    """Once the current transaction commits, record new likes of posts or comments (`target_model`)."""
+    def run():
+        if target_model is Post:
+            record('like', target_ids)
+        else:
+            record('comment_like', list(Comment.objects.filter(pk__in=target_ids).values_list('post_id', flat=True)))
+    transaction.on_commit(run)
+
+
+def rebuild(now=None):
+    """
+    Recompute every window from the likes, comments and comment likes inside
+    it, in one pass over the longest window. Returns {window: posts ranked}.
+    """
+    options = trending_settings()
+    now = now or timezone.now()
+    windows = {name: (now - timedelta(hours=hours), half_life) for name, (hours, half_life) in options['WINDOWS'].items()}
+    since = min(start for start, _ in windows.values())
+    totals = {name: defaultdict(float) for name in windows}
+    last_activity = {}
+
+    events = [
+        ('like', PostLike.objects.filter(created_at__gte=since).values_list('post_id', 'created_at')),
+        ('comment', Comment.objects.filter(created_at__gte=since).values_list('post_id', 'created_at')),
+        ('comment_like', CommentLike.objects.filter(created_at__gte=since).values_list('comment__post_id', 'created_at')),
+    ]
+    for kind, rows in events:
+        weight = options['WEIGHTS'][kind]
+        for post_id, at in rows.iterator(chunk_size=REBUILD_CHUNK_SIZE):
+            last_activity[post_id] = max(last_activity.get(post_id, at), at)
+            for name, (start, half_life) in windows.items():
+                if at >= start:
+                    # relative to the window's start, which keeps the sums small
+                    totals[name][post_id] += weight * 2 ** ((at - start).total_seconds() / 3600 / half_life)
+
+    with transaction.atomic():
+        for name, (start, half_life) in windows.items():
+            offset = exponent(start, half_life)
+            PostScore.objects.filter(window=name).delete()
+            PostScore.objects.bulk_create(
+                [PostScore(post_id=pk, window=name, score=math.log2(total) + offset, last_activity=last_activity[pk])
+                 for pk, total in totals[name].items()],
+                batch_size=1000,
+            )
+    return {name: len(totals[name]) for name in windows}
+
+
+def trending_posts(window, limit, now=None):
+    """
+    The `limit` best scoring posts with activity in `window`, best first, as
+    (post, decayed engagement) pairs.
+    """
+    hours, half_life = trending_settings()['WINDOWS'][window]
+    now = now or timezone.now()
+    rows = (
+        PostScore.objects.filter(window=window, last_activity__gte=now - timedelta(hours=hours))
+        .select_related('post__author')
+        .order_by('-score')[:limit]
+    )
+    current = exponent(now, half_life)
+    return [(row.post, 2 ** (row.score - current)) for row in rows]
@@ -0,0 +1,116 @@
+"""
+Per-process caches in front of JWT authentication.
+
+graphql_jwt verifies the token's signature and loads the user by email
+(get_user_by_payload) on every authenticated request. Both steps go through
+handlers configured in GRAPHQL_JWT, and these replace them:
+
+- jwt_decode keeps verified claims per token, never past the token's expiry.
+- get_user_by_natural_key keeps users for TTL seconds. Each request gets its
+  own copy without related objects, so what one request changes on its user
+  can't leak into another.
+
+Writes that matter for authentication drop the user's entry: any save or
+delete of the user (password change, deactivation, deleteAccount), of its
+UserStatus (archiveAccount), and logoutUser. The caches are per process, so
+other workers see those changes within TTL seconds.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from graphql_jwt import utils
+from graphql_jwt.settings import jwt_settings
+
+DEFAULTS = {
+    'ENABLED': True,
+    'TTL': 60,  # seconds
+    'MAX_ENTRIES': 10000,
+}
+
+
+def auth_cache_settings():
+    return {**DEFAULTS, **getattr(settings, 'JWT_USER_CACHE', {})}
+
+
+class ExpiringLRU:
+    """A thread-safe LRU mapping whose entries each have an expiry time."""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > auth_cache_settings()['MAX_ENTRIES']:
+                self.entries.popitem(last=False)
+
+    def discard_if(self, predicate):
+        with self.lock:
+            for key in [key for key, (value, _) in self.entries.items() if predicate(key, value)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+verified_claims = ExpiringLRU()
+users = ExpiringLRU()
+
+
+def jwt_decode(token, context=None):
+    options = auth_cache_settings()
+    if not options['ENABLED']:
+        return utils.jwt_decode(token, context)
+    payload = verified_claims.get(token)
+    if payload is None:
+        # raises for bad signatures and expired tokens, which aren't cached
+        payload = utils.jwt_decode(token, context)
+        expires_at = time.time() + options['TTL']
+        if jwt_settings.JWT_VERIFY_EXPIRATION and 'exp' in payload:
+            expires_at = min(expires_at, payload['exp'])
+        verified_claims.set(token, payload, expires_at)
+    return dict(payload)
+
+
+def get_user_by_natural_key(username):
+    options = auth_cache_settings()
+    if not options['ENABLED']:
+        return utils.get_user_by_natural_key(username)
+    user = users.get(username)
+    if user is None:
+        user = utils.get_user_by_natural_key(username)
+        if user is None:
+            return None
+        users.set(username, detached(user), time.time() + options['TTL'])
+    return detached(user)
+
+
+def detached(user):
+    """A copy of `user` sharing no mutable state (or cached relations) with the original."""
+    user = copy.copy(user)
+    user._state.fields_cache = {}
+    return user
+
+
+def forget_user(user):
+    """Drop a user from the cache, under its current or any earlier email; the next request loads it again."""
+    username = user.get_username()
+    users.discard_if(lambda key, cached: cached.pk == user.pk or key == username)
@@ -0,0 +1,158 @@
+"""
+In-memory follow graph for "people you may know" suggestions.
+
+Each user's followed ids are kept as a sorted array('q') (8 bytes per edge,
+no per-edge Python objects), built from Follow in one streamed pass and then
+kept current by the Follow signals in users.signals. Other processes catch up
+on their next rebuild, at most FOLLOW_GRAPH_REBUILD_INTERVAL seconds later.
+A stale graph keeps serving while one background thread rebuilds it; follows
+and unfollows seen during the rebuild are replayed onto the new graph.
+
+Suggestions are friends-of-friends ranked by mutual connections: how many
+of the accounts the user follows also follow the candidate.
+"""
+import heapq
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count
+
+from .models import Follow
+
+logger = logging.getLogger(__name__)
+
+REBUILD_INTERVAL = getattr(settings, 'FOLLOW_GRAPH_REBUILD_INTERVAL', 300)
+BUILD_CHUNK_SIZE = 10000
+
+
+def contains(ids, value):
+    index = bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+
+def insert(following, follower_id, followed_id):
+    ids = following.setdefault(follower_id, array('q'))
+    index = bisect_left(ids, followed_id)
+    if index == len(ids) or ids[index] != followed_id:
+        ids.insert(index, followed_id)
+
+
+def discard(following, follower_id, followed_id):
+    ids = following.get(follower_id)
+    if ids is not None and contains(ids, followed_id):
+        del ids[bisect_left(ids, followed_id)]
+
+
+class FollowGraph:
+
+    def __init__(self):
+        self.following = {}
+        self.built_at = None
+        self.lock = threading.Lock()  # guards following and changes
+        self.build_lock = threading.Lock()  # one build at a time
+        # (added, follower id, followed id) seen while a build runs, None otherwise
+        self.changes = None
+
+    def build(self):
+        """Load the graph from Follow now, waiting for a build already running."""
+        with self.build_lock:
+            self.load()
+
+    def load(self):
+        # the caller holds build_lock
+        with self.lock:
+            self.changes = []
+        try:
+            following = {}
+            follower_id, ids = None, None
+            edges = Follow.objects.order_by('follower_id', 'followed_id').values_list('follower_id', 'followed_id')
+            for follower, followed in edges.iterator(chunk_size=BUILD_CHUNK_SIZE):
+                if follower != follower_id:
+                    follower_id, ids = follower, array('q')
+                    following[follower] = ids
+                ids.append(followed)
+        except BaseException:
+            with self.lock:
+                self.changes = None
+            raise
+        with self.lock:
+            # the stream may have missed follows committed while it ran; replaying
+            # ones it did see is harmless, since insert and discard are idempotent
+            for added, follower, followed in self.changes:
+                (insert if added else discard)(following, follower, followed)
+            self.changes = None
+            self.following = following
+            self.built_at = time.monotonic()
+
+    def ensure_fresh(self):
+        if self.built_at is None:
+            # nothing to serve yet: the first request builds, the others wait for it
+            with self.build_lock:
+                if self.built_at is None:
+                    self.load()
+        elif time.monotonic() - self.built_at > REBUILD_INTERVAL and self.build_lock.acquire(blocking=False):
+            threading.Thread(target=self.rebuild, name='follow-graph-rebuild', daemon=True).start()
+
+    def rebuild(self):
+        # runs with build_lock, acquired by ensure_fresh
+        try:
+            self.load()
+        except Exception:
+            logger.exception("Rebuilding the follow graph failed; the old one is kept")
+        finally:
+            self.build_lock.release()
+            connections.close_all()
+
+    def add(self, follower_id, followed_id):
+        self.change(True, follower_id, followed_id)
+
+    def remove(self, follower_id, followed_id):
+        self.change(False, follower_id, followed_id)
+
+    def change(self, added, follower_id, followed_id):
+        with self.lock:
+            if self.changes is not None:
+                self.changes.append((added, follower_id, followed_id))
+            # not loaded in this process yet: the first build will include it
+            if self.built_at is not None:
+                (insert if added else discard)(self.following, follower_id, followed_id)
+
+    def suggestions(self, user_id, limit):
+        """Return up to `limit` (user id, mutual connections) pairs, best first."""
+        self.ensure_fresh()
+        following = self.following
+        direct = following.get(user_id, ())
+        counts = defaultdict(int)
+        for friend in direct:
+            for candidate in following.get(friend, ()):
+                counts[candidate] += 1
+        candidates = (
+            (count, candidate) for candidate, count in counts.items()
+            if candidate != user_id and not contains(direct, candidate)
+        )
+        # most mutual connections first, lowest id breaks ties
+        best = heapq.nsmallest(limit, candidates, key=lambda pair: (-pair[0], pair[1]))
+        return [(candidate, count) for count, candidate in best]
+
+
+def naive_suggestions(user_id, limit):
+    """The same ranking computed in SQL, for comparison with the in-memory graph."""
+    direct = Follow.objects.filter(follower_id=user_id).values('followed_id')
+    rows = (
+        Follow.objects.filter(follower_id__in=direct)
+        .exclude(followed_id=user_id)
+        .exclude(followed_id__in=direct)
+        .values('followed_id')
+        .annotate(mutual=Count('pk'))
+        .order_by('-mutual', 'followed_id')[:limit]
+    )
+    return [(row['followed_id'], row['mutual']) for row in rows]
+
+
+follow_graph = FollowGraph()
@@ -0,0 +1,131 @@
+"""
+Bulk user import.
+
+Creating accounts one by one costs three inserts each: the user, its Profile
+(users.signals.create_profile) and graphql_auth's UserStatus, plus the
+signal work after every save. bulk_create_users writes each kind of row with
+one statement per batch and then does, once, what those receivers would
+have done for every user.
+"""
+import csv
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+from graphql_auth.models import UserStatus
+
+from connect_u_backend import cache as response_cache
+from .models import Profile
+from .search import user_fields, user_index
+
+User = get_user_model()
+
+BATCH_SIZE = 500
+USER_COLUMNS = ('username', 'first_name', 'last_name')
+PROFILE_COLUMNS = ('bio', 'location', 'birth_date', 'profile_pic')
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+def bulk_create_users(users, profiles=None, verified=False, batch_size=BATCH_SIZE):
+    """
+    Insert unsaved users together with their Profile and UserStatus rows.
+    `profiles` optionally holds a dict of Profile field values per user, in
+    the same order. Returns the created users, with primary keys.
+    """
+    profiles = profiles or [{}] * len(users)
+    with transaction.atomic():
+        users = User.objects.bulk_create(users, batch_size=batch_size)
+        Profile.objects.bulk_create(
+            [Profile(user=user, **values) for user, values in zip(users, profiles)], batch_size=batch_size)
+        UserStatus.objects.bulk_create(
+            [UserStatus(user=user, verified=verified) for user in users], batch_size=batch_size)
+
+        def index():
+            if user_index.built:
+                for user, values in zip(users, profiles):
+                    user_index.add(user.pk, user_fields(
+                        user.username, user.email, values.get('bio', ''), values.get('location', '')))
+        transaction.on_commit(index)
+    transaction.on_commit(lambda: response_cache.invalidate(User._meta.model_name, 'profile'))
+    return users
+
+
+def parse_row(row):
+    """Build an unsaved user and its profile values from a CSV row (a dict)."""
+    email = User.objects.normalize_email((row.get('email') or '').strip())
+    if '@' not in email:
+        raise InvalidRow("missing or invalid email")
+
+    if row.get('password_hash'):
+        # already hashed, e.g. migrated from another Django site
+        password = row['password_hash']
+    else:
+        # hashing is deliberately slow; without a password the account can
+        # still be claimed through the password reset flow
+        password = make_password(row.get('password') or None)
+
+    user = User(email=email, password=password, **{
+        column: row[column].strip() for column in USER_COLUMNS if row.get(column)})
+    profile = {column: row[column].strip() for column in PROFILE_COLUMNS if row.get(column)}
+    if 'birth_date' in profile:
+        profile['birth_date'] = parse_date(profile['birth_date'])
+        if profile['birth_date'] is None:
+            raise InvalidRow("birth_date must be YYYY-MM-DD")
+    # caught here rather than by the database, which would abort the import midway
+    check_fields(user, ['email', *(column for column in USER_COLUMNS if row.get(column))])
+    check_fields(Profile(**profile), profile)
+    return user, profile
+
+
+def check_fields(instance, columns):
+    """Validate `columns` of an unsaved instance against their fields (lengths, URLs, ...)."""
+    others = {field.name for field in instance._meta.fields} - set(columns)
+    try:
+        instance.clean_fields(exclude=others)
+    except ValidationError as e:
+        raise InvalidRow(' '.join(f"{name}: {' '.join(messages)}" for name, messages in e.message_dict.items()))
+
+
+def import_users(lines, verified=False, batch_size=BATCH_SIZE):
+    """
+    Import users from CSV lines with an `email` column and optional
+    password/password_hash, username, first_name, last_name, bio, location,
+    birth_date and profile_pic columns. Existing emails are skipped.
+    Returns {'created', 'skipped', 'errors': [(line number, message)]}.
+    """
+    report = {'created': 0, 'skipped': 0, 'errors': []}
+    seen = set()
+    batch = []
+
+    def flush():
+        existing = set(User.objects.filter(email__in=[user.email for user, _ in batch])
+                       .values_list('email', flat=True))
+        new = [(user, profile) for user, profile in batch if user.email not in existing]
+        report['skipped'] += len(batch) - len(new)
+        if new:
+            users, profiles = zip(*new)
+            report['created'] += len(bulk_create_users(list(users), list(profiles), verified, batch_size))
+        batch.clear()
+
+    reader = csv.DictReader(lines)
+    for row in reader:
+        try:
+            user, profile = parse_row(row)
+        except InvalidRow as e:
+            report['errors'].append((reader.line_num, str(e)))
+            continue
+        if user.email in seen:
+            report['skipped'] += 1
+            continue
+        seen.add(user.email)
+        batch.append((user, profile))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return report
@@ -0,0 +1,54 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.benchmark import percentile
+from users.graph import FollowGraph, naive_suggestions
+
+User = get_user_model()
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+class Command(BaseCommand):
+    help = "Compare suggestedUsers from the in-memory follow graph against the equivalent ORM query."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=100, help="Number of users to compute suggestions for.")
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        user_ids = list(User.objects.filter(following__isnull=False).distinct().values_list('pk', flat=True))
+        if not user_ids:
+            raise CommandError("No follows to benchmark; run `manage.py seed_social_graph` first.")
+        sample = random.Random(options['seed']).sample(user_ids, min(options['samples'], len(user_ids)))
+
+        graph = FollowGraph()
+        _, build_ms = timed(graph.build)
+        edges = sum(len(ids) for ids in graph.following.values())
+        self.stdout.write(f"Built graph of {edges} edges in {build_ms:.1f} ms")
+
+        timings = {'graph': [], 'orm': []}
+        mismatches = 0
+        for user_id in sample:
+            fast, fast_ms = timed(graph.suggestions, user_id, options['limit'])
+            slow, slow_ms = timed(naive_suggestions, user_id, options['limit'])
+            timings['graph'].append(fast_ms)
+            timings['orm'].append(slow_ms)
+            mismatches += fast != slow
+
+        for name, values in timings.items():
+            values.sort()
+            self.stdout.write(
+                f"{name:<6} p50 {percentile(values, 0.5):8.3f} ms   p95 {percentile(values, 0.95):8.3f} ms"
+                f"   p99 {percentile(values, 0.99):8.3f} ms")
+        if mismatches:
+            raise CommandError(f"{mismatches} of {len(sample)} users got different suggestions.")
+        self.stdout.write(self.style.SUCCESS(f"Both agree for all {len(sample)} users."))
@@ -0,0 +1,30 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.importing import BATCH_SIZE, import_users
+
+
+class Command(BaseCommand):
+    help = "Import users (and their profiles) from a CSV file with an `email` column, a batch at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file, or - for standard input.")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--verified', action='store_true', help="Mark the imported accounts as verified.")
+
+    def handle(self, *args, **options):
+        try:
+            if options['path'] == '-':
+                report = import_users(sys.stdin, options['verified'], options['batch_size'])
+            else:
+                with open(options['path'], newline='') as f:
+                    report = import_users(f, options['verified'], options['batch_size'])
+        except OSError as e:
+            raise CommandError(e)
+
+        for line, message in report['errors']:
+            self.stderr.write(f"line {line}: {message}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report['created']} users, skipped {report['skipped']} existing or repeated emails, "
+            f"{len(report['errors'])} invalid rows."))
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:50
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_follower_count(apps, schema_editor):
+    Profile = apps.get_model('users', 'Profile')
+    Follow = apps.get_model('users', 'Follow')
+    counts = Follow.objects.filter(followed=OuterRef('user')).order_by().values('followed').annotate(n=Count('pk')).values('n')
+    Profile.objects.update(follower_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_profile_follow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='follower_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(backfill_follower_count, migrations.RunPython.noop),
+    ]
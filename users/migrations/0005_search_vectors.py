@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:20
+
+from django.db import migrations
+
+# Generated tsvector columns and their GIN indexes, PostgreSQL only: other
+# databases search through the in-process index in connect_u_backend.search.
+# The 'simple' configuration keeps names and addresses unstemmed.
+FORWARDS = [
+    """
+    ALTER TABLE users_customuser ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(username, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(email, '')), 'A')
+    ) STORED
+    """,
+    "CREATE INDEX user_search_vector_idx ON users_customuser USING gin (search_vector)",
+    """
+    ALTER TABLE users_profile ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(bio, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(location, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX profile_search_vector_idx ON users_profile USING gin (search_vector)",
+]
+
+BACKWARDS = [
+    "ALTER TABLE users_profile DROP COLUMN search_vector",
+    "ALTER TABLE users_customuser DROP COLUMN search_vector",
+]
+
+
+def run_on_postgres(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_follow_created_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_postgres(FORWARDS), run_on_postgres(BACKWARDS)),
+    ]
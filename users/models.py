@@ -49,9 +49,47 @@ class Profile(models.Model):
     location = models.CharField(max_length=100, blank=True)
     birth_date = models.DateField(null=True, blank=True)            
     profile_pic = models.URLField(max_length=500, blank=True, null=True) 
+    follower_count = models.PositiveIntegerField(default=0, db_index=True)  # kept in step by users.signals
 
     def __str__(self):
         return f"{self.user.email}'s profile"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        profile = super().from_db(db, field_names, values)
+        profile._saved_values = profile.current_values()
+        return profile
+
+    def current_values(self):
+        deferred = self.get_deferred_fields()
+        return {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname not in deferred
+        }
+
+    def changed_fields(self):
+        """Fields assigned since the profile was loaded or saved, or None if that isn't known."""
+        saved = getattr(self, '_saved_values', None)
+        if saved is None:
+            return None
+        return [name for name, value in self.current_values().items() if saved.get(name, value) != value]
+
+    def save(self, *args, **kwargs):
+        # Only write what changed: a no-op save costs nothing, and a stale
+        # follower_count (maintained with F() updates) is never written back.
+        changed = self.changed_fields()
+        if changed is not None and not self._state.adding and 'update_fields' not in kwargs \
+                and not kwargs.get('force_insert') and not kwargs.get('force_update'):
+            if not changed:
+                return
+            kwargs['update_fields'] = changed
+        super().save(*args, **kwargs)
+        current = self.current_values()
+        if kwargs.get('update_fields') is not None and changed is not None:
+            written = {self._meta.get_field(name).attname for name in kwargs['update_fields']}
+            current = {**self._saved_values, **{name: current[name] for name in written if name in current}}
+        self._saved_values = current
     
     # Get followers of a user
     def get_followers(self):
@@ -76,6 +114,12 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ('follower', 'followed')
+        indexes = [
+            # keyset pages of followers / following, newest first; the other
+            # side's id is included so a page never has to visit the table
+            models.Index(fields=['followed', 'created_at', 'id', 'follower'], name='follow_followed_created_idx'),
+            models.Index(fields=['follower', 'created_at', 'id', 'followed'], name='follow_follower_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.follower.email} follows {self.followed.email}"
@@ -1,8 +1,19 @@
 import graphene
 from graphene_django import DjangoObjectType
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from .models import Profile, Follow
+from graphql import GraphQLError
 from graphql_jwt.decorators import login_required
+from connect_u_backend import bulk, pubsub
+from connect_u_backend.loaders import related_resolver
+from connect_u_backend.pagination import page_size, paginate
+from connect_u_backend.projection import project
+from .graph import follow_graph
+from .search import search_users
+from .signals import follows_created
+
+MAX_FOLLOW_LOOKUPS = 100
 
 User = get_user_model()
 
@@ -11,43 +22,103 @@ class UserType(DjangoObjectType):
         model = User
         fields = '__all__'
 
+    resolve_profile = related_resolver('profile')
+    resolve_posts = related_resolver('posts')
+    resolve_comments = related_resolver('comments')
+    resolve_likes = related_resolver('likes')
+    resolve_comment_likes = related_resolver('comment_likes')
+    resolve_following = related_resolver('following')
+    resolve_followers = related_resolver('followers')
+
 
 class ProfileType(DjangoObjectType):
     class Meta:
         model = Profile
         fields = '__all__'
 
+    resolve_user = related_resolver('user')
+
 class FollowType(DjangoObjectType):
     class Meta:
         model = Follow
         fields = '__all__'
 
+    resolve_follower = related_resolver('follower')
+    resolve_followed = related_resolver('followed')
+
+class UserConnection(graphene.relay.Connection):
+    class Meta:
+        node = UserType
+
+class SuggestedUserType(graphene.ObjectType):
+    user = graphene.Field(UserType)
+    # accounts the viewer follows that follow this user
+    mutual_connections = graphene.Int()
+
 
 class UserQuery(graphene.ObjectType):
     users = graphene.List(UserType)
     user = graphene.Field(UserType, id=graphene.ID(required=True))
-    followers = graphene.List(UserType, user_id=graphene.ID(required=True))
-    following = graphene.List(UserType, user_id=graphene.ID(required=True))
+    followers = graphene.Field(UserConnection, user_id=graphene.ID(required=True), first=graphene.Int(), after=graphene.String())
+    following = graphene.Field(UserConnection, user_id=graphene.ID(required=True), first=graphene.Int(), after=graphene.String())
+    # whether the viewer follows each of `userIds`, in the same order
+    is_following = graphene.List(graphene.Boolean, user_ids=graphene.List(graphene.ID, required=True))
+    # accounts the viewer follows that also follow `userId`
+    mutual_follows = graphene.Field(UserConnection, user_id=graphene.ID(required=True), first=graphene.Int(), after=graphene.String())
+    suggested_users = graphene.List(SuggestedUserType, first=graphene.Int())
+    search_users = graphene.List(UserType, query=graphene.String(required=True), first=graphene.Int())
     
-    # Get all users
+    # Get all users, loading only what the query selects
     @login_required
     def resolve_users(self, info, **kwargs):
-        return User.objects.all()
+        return project(User.objects.all(), info)
 
     # Get a single user
     @login_required
     def resolve_user(root, info, id):
-        return User.objects.get(pk=id)
+        return project(User.objects.all(), info).get(pk=id)
     
+    # Followers newest first, paginated on the follow time
     @login_required
-    def resolve_followers(self, info, user_id):
-        user = User.objects.get(pk=user_id)
-        return user.profile.get_followers()
+    def resolve_followers(self, info, user_id, first=None, after=None):
+        follows = Follow.objects.filter(followed_id=user_id).select_related('follower')
+        return paginate(follows, UserConnection, first, after, node=lambda follow: follow.follower)
     
     @login_required
-    def resolve_following(self, info, user_id):
-        user = User.objects.get(pk=user_id)
-        return user.profile.get_following()
+    def resolve_following(self, info, user_id, first=None, after=None):
+        follows = Follow.objects.filter(follower_id=user_id).select_related('followed')
+        return paginate(follows, UserConnection, first, after, node=lambda follow: follow.followed)
+
+    @login_required
+    def resolve_is_following(self, info, user_ids):
+        if len(user_ids) > MAX_FOLLOW_LOOKUPS:
+            raise GraphQLError(f"At most {MAX_FOLLOW_LOOKUPS} users can be looked up at once.")
+        follows = Follow.objects.filter(follower=info.context.user, followed_id__in=bulk.parse_ids(user_ids))
+        followed = set(follows.values_list('followed_id', flat=True))
+        # ids that aren't user ids can't be followed
+        return [bulk.to_int(user_id) in followed for user_id in user_ids]
+
+    @login_required
+    def resolve_mutual_follows(self, info, user_id, first=None, after=None):
+        viewer_follows = Follow.objects.filter(follower=info.context.user).values('followed_id')
+        follows = Follow.objects.filter(followed_id=user_id, follower_id__in=viewer_follows).select_related('follower')
+        return paginate(follows, UserConnection, first, after, node=lambda follow: follow.follower)
+
+    # Users matching a search, best match first
+    @login_required
+    def resolve_search_users(self, info, query, first=None):
+        return search_users(query, first)
+
+    # People you may know: friends of friends from the in-memory follow graph
+    @login_required
+    def resolve_suggested_users(self, info, first=None):
+        suggestions = follow_graph.suggestions(info.context.user.pk, page_size(first))
+        users = User.objects.in_bulk([user_id for user_id, _ in suggestions])
+        return [
+            SuggestedUserType(user=users[user_id], mutual_connections=count)
+            for user_id, count in suggestions
+            if user_id in users
+        ]
     
     def get_following(self):
         return User.objects.filter(followers__follower=self.user)
@@ -84,6 +155,44 @@ class FollowUser(graphene.Mutation):
             return FollowUser(success=False, message="The user you are trying to follow does not exist.")
         
         
+class FollowUsers(graphene.Mutation):
+    class Arguments:
+        user_ids = graphene.List(graphene.ID, required=True)
+
+    success = graphene.Boolean()
+    message = graphene.String()
+    results = graphene.List(bulk.BulkItemResult)
+
+    @login_required
+    def mutate(self, info, user_ids):
+        follower = info.context.user
+        pks = bulk.parse_ids(user_ids)
+        existing = set(User.objects.filter(pk__in=pks).values_list('pk', flat=True))
+        following = set(Follow.objects.filter(follower=follower, followed_id__in=existing).values_list('followed_id', flat=True))
+        new = [pk for pk in pks if pk in existing and pk not in following and pk != follower.pk]
+        inserted = []
+        if new:
+            with transaction.atomic():
+                # follows a concurrent request inserted first are skipped; only
+                # the ones written here are announced
+                inserted = [pk for pk, in bulk.insert_new(
+                    [Follow(follower=follower, followed_id=pk) for pk in new], returning=['followed'])]
+                if inserted:
+                    follows_created.send(sender=Follow, follower_id=follower.pk, followed_ids=inserted)
+        inserted = set(inserted)
+
+        def message(pk):
+            if pk == follower.pk:
+                return False, "You cannot follow yourself."
+            if pk not in existing:
+                return False, "The user you are trying to follow does not exist."
+            if pk not in inserted:
+                return False, "You are already following this user."
+            return True, "You are now following this user."
+        messages = {pk: message(pk) for pk in pks}
+        return FollowUsers(success=True, message=f"You are now following {len(inserted)} users.", results=bulk.results(user_ids, messages))
+        
+        
 class UnfollowUser(graphene.Mutation):
     class Arguments:
         user_id = graphene.ID(required=True)
@@ -140,8 +249,21 @@ class UpdateProfile(graphene.Mutation):
         profile.save()
 
         return UpdateProfile(profile=profile, success=True, message="Profile updated successfully.")   
+class Subscription(graphene.ObjectType):
+    new_follower = graphene.Field(UserType)
+
+    # accounts that start following the viewer
+    @login_required
+    def resolve_new_follower(self, info):
+        return (
+            pubsub.subscribe(f'new_follower:{info.context.user.pk}')
+            .map(lambda event: event.load(User, 'follower_id'))
+            .filter(lambda follower: follower is not None)
+        )
+
 class Mutation(graphene.ObjectType):
     follow_user = FollowUser.Field()
+    follow_users = FollowUsers.Field()
     unfollow_user = UnfollowUser.Field()
     update_profile = UpdateProfile.Field()
     
@@ -0,0 +1,65 @@
+"""
+User search over username and email (weight A) and the profile's bio (B) and
+location (C). See connect_u_backend/search.py.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchRank
+from django.db.models import FloatField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from connect_u_backend import search
+from connect_u_backend.pagination import page_size
+from .models import Profile
+
+User = get_user_model()
+
+# names and addresses shouldn't be stemmed
+SEARCH_CONFIG = 'simple'
+
+
+def user_fields(username, email, bio, location):
+    return [(username, 'A'), (email, 'A'), (bio, 'B'), (location, 'C')]
+
+
+def load_users():
+    rows = User.objects.values_list('pk', 'username', 'email', 'profile__bio', 'profile__location')
+    for pk, *fields in rows.iterator():
+        yield pk, user_fields(*fields)
+
+
+def load_user(pk):
+    row = User.objects.filter(pk=pk).values_list('username', 'email', 'profile__bio', 'profile__location').first()
+    return user_fields(*row) if row else None
+
+
+user_index = search.InvertedIndex(load_users, load_user)
+
+
+def search_users(text, first=None):
+    text = search.clean_query(text)
+    limit = page_size(first)
+    if search.uses_postgres():
+        return search_users_postgres(text, limit)
+
+    ranked = user_index.search(text)[:limit]
+    users = User.objects.select_related('profile').in_bulk([pk for _, pk in ranked])
+    return [users[pk] for _, pk in ranked if pk in users]
+
+
+def search_users_postgres(text, limit):
+    query = search.search_query(text, SEARCH_CONFIG)
+    user_vector = search.vector_column(User._meta.db_table)
+    profile_vector = search.vector_column(Profile._meta.db_table)
+
+    matching_profiles = Profile.objects.annotate(document=profile_vector).filter(document=query)
+    profile_rank = matching_profiles.filter(user_id=OuterRef('pk')).annotate(
+        rank=SearchRank(profile_vector, query)).values('rank')
+    users = (
+        User.objects.annotate(document=user_vector)
+        .filter(Q(document=query) | Q(pk__in=matching_profiles.values('user_id')))
+        .annotate(rank=SearchRank(user_vector, query) + Coalesce(
+            Subquery(profile_rank, output_field=FloatField()), Value(0.0)))
+        .select_related('profile')
+        .order_by('-rank', '-pk')
+    )
+    return list(users[:limit])
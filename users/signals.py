@@ -1,6 +1,19 @@
 from .models import CustomUser, Profile, Follow
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+from graphql_auth.models import UserStatus
+
+from connect_u_backend import cache as response_cache, pubsub
+from .auth import forget_user
+from .graph import follow_graph
+from .search import user_index
+
+# Sent with follower_id and followed_ids after Follow rows are bulk created,
+# which skips post_save; receivers do what the post_save receivers would.
+follows_created = Signal()
 
 
 @receiver(post_save, sender=CustomUser) 
@@ -8,13 +21,102 @@ def create_profile(sender, instance, created, **kwargs):
     """Create a profile when a new user is created.""" 
     if created: 
         Profile.objects.create(user=instance)
-        
 
 
 @receiver(post_save, sender=CustomUser) 
 def save_profile(sender, instance, **kwargs): 
-    """Save the profile whenever the user is saved.""" 
-    if hasattr(instance, "profile"): 
+    """Save changes made through user.profile along with the user.""" 
+    # only a profile that was already loaded can have changes; Profile.save
+    # skips the UPDATE when none of its fields did (e.g. on every login)
+    if CustomUser.profile.is_cached(instance): 
         instance.profile.save()
 
 
+@receiver(post_save, sender=Follow)
+def increment_follower_count(sender, instance, created, **kwargs):
+    """Keep the denormalized follower count of the followed user in step."""
+    if created:
+        Profile.objects.filter(user_id=instance.followed_id).update(follower_count=F('follower_count') + 1)
+
+
+@receiver(post_delete, sender=Follow)
+def decrement_follower_count(sender, instance, **kwargs):
+    Profile.objects.filter(user_id=instance.followed_id, follower_count__gt=0).update(follower_count=F('follower_count') - 1)
+
+
+@receiver([post_save, post_delete], sender=Follow)
+def invalidate_follow_responses(sender, **kwargs):
+    """Follower lists, follower counts and timelines are all derived from Follow rows."""
+    transaction.on_commit(lambda: response_cache.invalidate('follow', 'profile'))
+
+
+@receiver(post_save, sender=Follow)
+def add_follow_edge(sender, instance, created, **kwargs):
+    """Keep this process's in-memory follow graph current once the follow is committed."""
+    if created:
+        transaction.on_commit(lambda: follow_graph.add(instance.follower_id, instance.followed_id))
+
+
+@receiver(post_delete, sender=Follow)
+def remove_follow_edge(sender, instance, **kwargs):
+    transaction.on_commit(lambda: follow_graph.remove(instance.follower_id, instance.followed_id))
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def reindex_user(sender, instance, update_fields=None, **kwargs):
+    """Keep the fallback search index (databases without full-text search) current."""
+    if update_fields is not None and not {'username', 'email'} & set(update_fields):
+        return  # e.g. last_login on every login
+    user_index.refresh(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def reindex_profile_user(sender, instance, **kwargs):
+    user_index.refresh(instance.user_id)
+
+
+@receiver(follows_created)
+def follows_created_bulk(sender, follower_id, followed_ids, **kwargs):
+    """Recount (bulk_create may have skipped rows) followers, update the graph and the cache."""
+    counts = Follow.objects.filter(followed_id=OuterRef('user_id')).order_by().values('followed_id').annotate(n=Count('pk')).values('n')
+    Profile.objects.filter(user_id__in=followed_ids).update(
+        follower_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+    )
+    transaction.on_commit(lambda: [follow_graph.add(follower_id, followed_id) for followed_id in followed_ids])
+    transaction.on_commit(lambda: response_cache.invalidate('follow', 'profile'))
+    for followed_id in followed_ids:
+        pubsub.publish(f'new_follower:{followed_id}', follower_id=follower_id, followed_id=followed_id)
+
+
+@receiver(post_save, sender=Follow)
+def publish_new_follower(sender, instance, created, **kwargs):
+    """Feed the newFollower subscription of the followed user."""
+    if created:
+        pubsub.publish(f'new_follower:{instance.followed_id}', follower_id=instance.follower_id, followed_id=instance.followed_id)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def forget_authenticated_user(sender, instance, update_fields=None, **kwargs):
+    """Password, is_active or email changes must reach the JWT user cache (users/auth.py)."""
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    forget_user(instance)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def invalidate_user_responses(sender, instance, update_fields=None, **kwargs):
+    """Cached users, user and searchUsers responses read users and their profiles."""
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    # after commit, or a concurrent reader could cache the old row under the new version
+    transaction.on_commit(lambda: response_cache.invalidate(CustomUser._meta.model_name, 'profile'))
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def invalidate_profile_responses(sender, **kwargs):
+    transaction.on_commit(lambda: response_cache.invalidate(CustomUser._meta.model_name, 'profile'))
+
+
+@receiver(post_save, sender=UserStatus)
+def forget_archived_user(sender, instance, **kwargs):
+    forget_user(instance.user)
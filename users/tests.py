@@ -1,3 +1,455 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from graphql_jwt.testcases import JSONWebTokenTestCase
+
+from .graph import follow_graph, naive_suggestions
+from .models import Follow, Profile
+
+User = get_user_model()
 
 # Create your tests here.
+
+
+class FollowListTest(JSONWebTokenTestCase):
+    followers = '''
+        query Followers($userId: ID!, $first: Int, $after: String) {
+          followers(userId: $userId, first: $first, after: $after) {
+            edges { node { email } }
+            pageInfo { hasNextPage endCursor }
+          }
+        }
+    '''
+
+    def setUp(self):
+        self.viewer = User.objects.create_user(email='viewer@example.com', password='pass')
+        self.star = User.objects.create_user(email='star@example.com', password='pass')
+        self.fans = [User.objects.create_user(email=f'fan{i}@example.com', password='pass') for i in range(5)]
+        for fan in self.fans:
+            Follow.objects.create(follower=fan, followed=self.star)
+        self.client.authenticate(self.viewer)
+
+    def execute(self, query, **variables):
+        result = self.client.execute(query, variables)
+        self.assertIsNone(result.errors)
+        return result.data
+
+    def test_followers_are_paginated_newest_first(self):
+        page = self.execute(self.followers, userId=self.star.pk, first=3)['followers']
+        self.assertEqual([e['node']['email'] for e in page['edges']], ['fan4@example.com', 'fan3@example.com', 'fan2@example.com'])
+        self.assertTrue(page['pageInfo']['hasNextPage'])
+
+        rest = self.execute(self.followers, userId=self.star.pk, first=3, after=page['pageInfo']['endCursor'])['followers']
+        self.assertEqual([e['node']['email'] for e in rest['edges']], ['fan1@example.com', 'fan0@example.com'])
+        self.assertFalse(rest['pageInfo']['hasNextPage'])
+
+    def test_following(self):
+        data = self.execute('query($userId: ID!) { following(userId: $userId) { edges { node { email } } } }',
+                            userId=self.fans[0].pk)
+        self.assertEqual([e['node']['email'] for e in data['following']['edges']], ['star@example.com'])
+
+    def test_is_following_is_one_query(self):
+        Follow.objects.create(follower=self.viewer, followed=self.fans[1])
+        ids = [self.star.pk, self.fans[1].pk, self.fans[2].pk]
+        with CaptureQueriesContext(connection) as queries:
+            data = self.execute('query($ids: [ID]!) { isFollowing(userIds: $ids) }', ids=ids)
+        self.assertEqual(data['isFollowing'], [False, True, False])
+        self.assertEqual(len(queries), 2)  # auth lookup and the follow lookup
+
+    def test_is_following_ids_that_are_not_numbers(self):
+        Follow.objects.create(follower=self.viewer, followed=self.star)
+        data = self.execute('query($ids: [ID]!) { isFollowing(userIds: $ids) }', ids=[self.star.pk, 'abc'])
+        self.assertEqual(data['isFollowing'], [True, False])
+
+    def test_mutual_follows(self):
+        for fan in self.fans[:2]:
+            Follow.objects.create(follower=self.viewer, followed=fan)
+        data = self.execute('query($userId: ID!) { mutualFollows(userId: $userId) { edges { node { email } } } }',
+                            userId=self.star.pk)
+        self.assertEqual([e['node']['email'] for e in data['mutualFollows']['edges']], ['fan1@example.com', 'fan0@example.com'])
+
+
+class SuggestedUsersTest(JSONWebTokenTestCase):
+    query = '{ suggestedUsers(first: 5) { user { email } mutualConnections } }'
+
+    def setUp(self):
+        self.viewer = User.objects.create_user(email='me@example.com', password='pass')
+        self.friends = [User.objects.create_user(email=f'friend{i}@example.com', password='pass') for i in range(3)]
+        self.popular = User.objects.create_user(email='popular@example.com', password='pass')
+        self.niche = User.objects.create_user(email='niche@example.com', password='pass')
+        for friend in self.friends:
+            Follow.objects.create(follower=self.viewer, followed=friend)
+            Follow.objects.create(follower=friend, followed=self.popular)
+        Follow.objects.create(follower=self.friends[0], followed=self.niche)
+        Follow.objects.create(follower=self.friends[0], followed=self.viewer)
+        follow_graph.build()
+        self.client.authenticate(self.viewer)
+
+    def suggestions(self):
+        result = self.client.execute(self.query)
+        self.assertIsNone(result.errors)
+        return [(s['user']['email'], s['mutualConnections']) for s in result.data['suggestedUsers']]
+
+    def test_ranked_by_mutual_connections(self):
+        self.assertEqual(self.suggestions(), [('popular@example.com', 3), ('niche@example.com', 1)])
+        self.assertEqual(follow_graph.suggestions(self.viewer.pk, 5), naive_suggestions(self.viewer.pk, 5))
+
+    def test_follows_during_a_build_are_kept(self):
+        from unittest import mock
+        from .graph import FollowGraph
+        graph = FollowGraph()
+        stream = list(Follow.objects.order_by('follower_id', 'followed_id').values_list('follower_id', 'followed_id'))
+
+        def edges(**kwargs):
+            # a follow and an unfollow commit while the edges are being read
+            yield stream[0]
+            graph.add(self.viewer.pk, self.niche.pk)
+            graph.remove(self.friends[0].pk, self.popular.pk)
+            yield from stream[1:]
+
+        queryset = mock.MagicMock()
+        queryset.values_list.return_value.iterator.side_effect = edges
+        with mock.patch.object(Follow.objects, 'order_by', return_value=queryset):
+            graph.build()
+        self.assertIn(self.niche.pk, graph.following[self.viewer.pk])
+        self.assertNotIn(self.popular.pk, graph.following[self.friends[0].pk])
+
+    def test_stale_graph_is_served_while_one_rebuild_runs(self):
+        import time
+        from unittest import mock
+        from .graph import FollowGraph, REBUILD_INTERVAL
+        graph = FollowGraph()
+        graph.build()
+        following = graph.following
+        graph.built_at = time.monotonic() - REBUILD_INTERVAL - 1
+        with mock.patch('users.graph.threading.Thread') as thread:
+            for _ in range(3):
+                self.assertEqual(graph.suggestions(self.viewer.pk, 5)[0], (self.popular.pk, 3))
+        self.assertEqual(thread.call_count, 1)
+        self.assertIs(graph.following, following)
+        graph.build_lock.release()  # held for the thread that wasn't started
+
+    def test_follows_update_the_graph(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.execute('mutation($id: ID!) { followUser(userId: $id) { success } }', {'id': self.popular.pk})
+        self.assertEqual(self.suggestions(), [('niche@example.com', 1)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.execute('mutation($id: ID!) { unfollowUser(userId: $id) { success } }', {'id': self.friends[0].pk})
+        # niche was only reachable through friend0
+        self.assertEqual(self.suggestions(), [])
+
+
+# query counts are compared across requests; keep the cached JWT user lookup out of them
+@override_settings(JWT_USER_CACHE={'ENABLED': False})
+class BulkFollowTest(JSONWebTokenTestCase):
+    query = '''
+        mutation Follow($ids: [ID]!) {
+          followUsers(userIds: $ids) { message results { id success message } }
+        }
+    '''
+
+    def setUp(self):
+        self.viewer = User.objects.create_user(email='importer@example.com', password='pass')
+        self.client.authenticate(self.viewer)
+
+    def make_users(self, count):
+        return [User.objects.create_user(email=f'contact{User.objects.count()}@example.com', password='pass')
+                for _ in range(count)]
+
+    def follow(self, ids):
+        with CaptureQueriesContext(connection) as queries:
+            result = self.client.execute(self.query, {'ids': ids})
+        self.assertIsNone(result.errors)
+        return result.data['followUsers'], len(queries)
+
+    def test_per_item_results_and_derived_data(self):
+        from posts.models import Post, TimelineEntry
+        known, new = self.make_users(2)
+        Follow.objects.create(follower=self.viewer, followed=known)
+        post = Post.objects.create(title='Hello', content='...', author=new)
+
+        data, _ = self.follow([new.pk, known.pk, self.viewer.pk, 999999])
+        self.assertEqual([(r['success'], r['message']) for r in data['results']], [
+            (True, 'You are now following this user.'),
+            (False, 'You are already following this user.'),
+            (False, 'You cannot follow yourself.'),
+            (False, 'The user you are trying to follow does not exist.'),
+        ])
+        new.profile.refresh_from_db()
+        self.assertEqual(new.profile.follower_count, 1)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.viewer, post=post).exists())
+
+    def test_follows_skipped_as_conflicts_are_not_announced(self):
+        from unittest import mock
+        from connect_u_backend import bulk
+        first, second = self.make_users(2)
+        insert_new = bulk.insert_new
+
+        def concurrent_follow_first(objs, **kwargs):
+            # another request follows `first` between the lookup and the insert
+            Follow.objects.bulk_create([Follow(follower=self.viewer, followed=first)])
+            return insert_new(objs, **kwargs)
+
+        with mock.patch('connect_u_backend.bulk.insert_new', concurrent_follow_first), \
+                mock.patch('connect_u_backend.pubsub.publish') as publish:
+            data, _ = self.follow([first.pk, second.pk])
+
+        self.assertEqual(data['message'], 'You are now following 1 users.')
+        self.assertEqual([(r['success'], r['message']) for r in data['results']], [
+            (False, 'You are already following this user.'),
+            (True, 'You are now following this user.'),
+        ])
+        self.assertEqual([c.args[0] for c in publish.call_args_list], [f'new_follower:{second.pk}'])
+
+    def test_fixed_number_of_queries(self):
+        _, few = self.follow([user.pk for user in self.make_users(2)])
+        _, many = self.follow([user.pk for user in self.make_users(20)])
+        self.assertEqual(few, many)
+
+
+class NewFollowerSubscriptionTest(JSONWebTokenTestCase):
+
+    def test_followed_user_is_notified(self):
+        from types import SimpleNamespace
+        from unittest import mock
+        from connect_u_backend import pubsub
+        from connect_u_backend.schema import schema
+
+        viewer, fan, other = (User.objects.create_user(email=f'{name}@example.com', password='pass')
+                              for name in ('star', 'fan', 'other'))
+        results = []
+        with mock.patch.object(pubsub, '_backend', pubsub.LocalBackend(inline=True)):
+            observable = schema.execute('subscription { newFollower { email } }',
+                                        context_value=SimpleNamespace(user=viewer), allow_subscriptions=True)
+            observable.subscribe(results.append)
+            with self.captureOnCommitCallbacks(execute=True):
+                Follow.objects.create(follower=fan, followed=viewer)
+                Follow.objects.create(follower=viewer, followed=other)
+            self.client.authenticate(other)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.execute('mutation($ids: [ID]!) { followUsers(userIds: $ids) { message } }',
+                                    {'ids': [viewer.pk]})
+
+        self.assertEqual([result.data['newFollower']['email'] for result in results],
+                         ['fan@example.com', 'other@example.com'])
+
+
+class ProfileSaveTest(JSONWebTokenTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='member@example.com', password='pass')
+
+    def test_login_doesnt_touch_the_profile(self):
+        from django.contrib.auth.models import update_last_login
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            update_last_login(None, user)
+
+    def test_user_save_only_writes_changed_profile_fields(self):
+        user = User.objects.select_related('profile').get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            user.save()
+
+        # a follow lands after the profile was loaded
+        Follow.objects.create(follower=User.objects.create_user(email='fan@example.com', password='pass'), followed=user)
+        user.profile.bio = 'Hello'
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('follower_count', queries[1]['sql'])
+        profile = Profile.objects.get(user=user)
+        self.assertEqual((profile.bio, profile.follower_count), ('Hello', 1))
+
+
+class ImportUsersTest(JSONWebTokenTestCase):
+    header = 'email,password_hash,username,bio,birth_date\n'
+
+    def rows(self, start, count):
+        from django.contrib.auth.hashers import make_password
+        password = make_password('imported')
+        return ''.join(f'person{i}@Example.com,{password},person{i},Bio {i},1990-01-0{1 + i % 9}\n'
+                       for i in range(start, start + count))
+
+    def run_import(self, text, **kwargs):
+        from io import StringIO
+        from .importing import import_users
+        with CaptureQueriesContext(connection) as queries:
+            report = import_users(StringIO(self.header + text), **kwargs)
+        return report, len(queries)
+
+    def test_users_and_profiles_in_a_few_queries(self):
+        report, few = self.run_import(self.rows(0, 2))
+        self.assertEqual(report, {'created': 2, 'skipped': 0, 'errors': []})
+        report, many = self.run_import(self.rows(2, 40))
+        self.assertEqual(report['created'], 40)
+        self.assertEqual(few, many)
+
+        user = User.objects.select_related('profile', 'status').get(email='person3@example.com')
+        self.assertEqual((user.username, user.profile.bio, str(user.profile.birth_date)), ('person3', 'Bio 3', '1990-01-04'))
+        self.assertTrue(user.check_password('imported'))
+        self.assertFalse(user.status.verified)
+
+    def test_duplicates_and_invalid_rows(self):
+        User.objects.create_user(email='person0@example.com', password='pass')
+        report, _ = self.run_import(self.rows(0, 2) + self.rows(1, 1) + 'not-an-email,,,,\nx@example.com,,,,June\n',
+                                    batch_size=2)
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(report['skipped'], 2)
+        self.assertEqual(report['errors'], [(5, 'missing or invalid email'), (6, 'birth_date must be YYYY-MM-DD')])
+
+    def test_values_too_long_for_their_columns(self):
+        report, _ = self.run_import(
+            f"long@example.com,,{'x' * 51},,\n" + self.rows(0, 1) + "bio@example.com,,fine,,\n", batch_size=1)
+        self.assertEqual(report['created'], 2)
+        self.assertEqual(report['errors'], [(2, 'username: Ensure this value has at most 50 characters (it has 51).')])
+
+        from io import StringIO
+        from .importing import import_users
+        report = import_users(StringIO(f"email,location,profile_pic\nfar@example.com,{'y' * 101},not a url\n"))
+        self.assertEqual(report['created'], 0)
+        self.assertEqual(report['errors'], [(2, 'location: Ensure this value has at most 100 characters (it has 101). '
+                                                'profile_pic: Enter a valid URL.')])
+
+    def test_command(self):
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write(self.header + 'new@example.com,,newbie,,\n')
+            f.flush()
+            out = StringIO()
+            call_command('import_users', f.name, '--verified', stdout=out)
+        self.assertIn('Created 1 users', out.getvalue())
+        user = User.objects.get(email='new@example.com')
+        self.assertFalse(user.has_usable_password())
+        self.assertTrue(user.status.verified)
+
+
+@override_settings(DATABASE_ROUTING={**settings.DATABASE_ROUTING, 'REPLICA': None})
+class JWTUserCacheTest(JSONWebTokenTestCase):
+    query = '{ me { email } }'
+
+    def setUp(self):
+        from graphql_jwt.shortcuts import get_token
+        from .auth import users, verified_claims
+        users.clear()
+        verified_claims.clear()
+        self.user = User.objects.create_user(email='cached@example.com', password='pass')
+        self.token = get_token(self.user)
+
+    def request(self, token=None):
+        from django.test import Client
+        with CaptureQueriesContext(connection) as queries:
+            response = Client().post('/', {'query': self.query}, content_type='application/json',
+                                     HTTP_AUTHORIZATION=f'JWT {token or self.token}')
+        return response.json(), len(queries)
+
+    def test_repeat_requests_skip_the_user_lookup(self):
+        body, first = self.request()
+        self.assertEqual(body['data']['me'], {'email': 'cached@example.com'})
+        body, repeat = self.request()
+        self.assertEqual(body['data']['me'], {'email': 'cached@example.com'})
+        self.assertEqual(repeat, first - 1)
+
+    def test_account_changes_are_honoured(self):
+        self.request()
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        body, _ = self.request()
+        self.assertIsNone(body['data']['me'])
+
+    def test_logout_and_archive_drop_the_user(self):
+        from graphql_auth.models import UserStatus
+        from graphql_jwt.refresh_token.shortcuts import create_refresh_token
+        from .auth import users
+        refresh = create_refresh_token(self.user)
+        self.request()
+        self.assertIsNotNone(users.get('cached@example.com'))
+        self.client.execute('mutation($t: String!) { logoutUser(refreshToken: $t) { ok } }', {'t': refresh.token})
+        self.assertIsNone(users.get('cached@example.com'))
+
+        self.request()
+        UserStatus.archive(self.user)
+        self.assertIsNone(users.get('cached@example.com'))
+
+    def test_requests_get_their_own_copy(self):
+        from .auth import get_user_by_natural_key
+        first = get_user_by_natural_key('cached@example.com')
+        first.first_name = 'Changed'
+        first.profile  # loads and caches the relation on this copy only
+        second = get_user_by_natural_key('cached@example.com')
+        self.assertEqual(second.first_name, '')
+        self.assertFalse(User.profile.is_cached(second))
+
+    def test_expired_tokens_are_rejected(self):
+        import jwt
+        from datetime import timedelta
+        from unittest import mock
+        from graphql_jwt.settings import jwt_settings
+        from graphql_jwt.shortcuts import get_token
+        from .auth import jwt_decode, verified_claims
+        with mock.patch.object(jwt_settings, 'JWT_EXPIRATION_DELTA', timedelta(seconds=-10)):
+            expired = get_token(self.user)
+        with self.assertRaises(jwt.ExpiredSignatureError):
+            jwt_decode(expired)
+        self.assertIsNone(verified_claims.get(expired))
+
+
+class RootUsersQueryTest(JSONWebTokenTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='listed@example.com', password='pass', username='listed')
+        User.objects.create_user(email='other@example.com', password='pass', username='other')
+        self.client.authenticate(self.user)
+
+    def test_users_connection_resolves(self):
+        result = self.client.execute('{ users(first: 2) { edges { node { username verified } } } }')
+        self.assertIsNone(result.errors)
+        self.assertEqual(
+            sorted(edge['node']['username'] for edge in result.data['users']['edges']), ['listed', 'other'],
+        )
+
+    def test_users_connection_filters(self):
+        result = self.client.execute('{ users(email: "other@example.com") { edges { node { email } } } }')
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data['users']['edges'], [{'node': {'email': 'other@example.com'}}])
+
+
+@override_settings(DATABASE_ROUTING={**settings.DATABASE_ROUTING, 'REPLICA': None})
+class UserResponseCacheTest(JSONWebTokenTestCase):
+    query = '{ searchUsers(query: "zeddy") { firstName profile { bio } } }'
+
+    def setUp(self):
+        from django.core.cache import caches
+        from graphql_jwt.shortcuts import get_token
+        from .search import user_index
+        caches['graphql'].clear()
+        user_index.clear()
+        self.user = User.objects.create_user(email='zeddy@example.com', password='pass', username='zeddy')
+        self.auth = {'HTTP_AUTHORIZATION': f'JWT {get_token(self.user)}'}
+
+    def search(self):
+        from django.test import Client
+        response = Client().post('/', {'query': self.query}, content_type='application/json', **self.auth)
+        return response.json()['data']['searchUsers']
+
+    def test_user_and_profile_changes_invalidate_cached_responses(self):
+        self.assertEqual(self.search(), [{'firstName': '', 'profile': {'bio': ''}}])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Zed'
+            self.user.save()
+        self.assertEqual(self.search()[0]['firstName'], 'Zed')
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = Profile.objects.get(user=self.user)
+            profile.bio = 'Hi'
+            profile.save()
+        self.assertEqual(self.search()[0]['profile'], {'bio': 'Hi'})
+
+    def test_logins_keep_cached_responses(self):
+        from django.contrib.auth.models import update_last_login
+        self.search()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            update_last_login(None, self.user)
+        self.assertEqual(callbacks, [])